@@ -10,8 +10,12 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.2/ref/settings/
 """
 
+import copy
+import os
 from pathlib import Path
 
+from django.core.exceptions import ImproperlyConfigured
+
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
 
@@ -46,12 +50,16 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    'portal.middleware.InstrumentationMiddleware',
+    # Before sessions, so a login's session write pins the browser to the primary
+    'portal.middleware.ReplicaPinningMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'portal.middleware.LastSeenMiddleware',
 ]
 
 ROOT_URLCONF = 'fresh_app.urls'
@@ -66,6 +74,7 @@ TEMPLATES = [
                 'django.template.context_processors.request',
                 'django.contrib.auth.context_processors.auth',
                 'django.contrib.messages.context_processors.messages',
+                'portal.context_processors.notifications',
             ],
         },
     },
@@ -77,12 +86,122 @@ WSGI_APPLICATION = 'fresh_app.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/5.2/ref/settings/#databases
 
+# Pick a profile with DJANGO_DB_PROFILE:
+#   development  the bare db.sqlite3 (default)
+#   sqlite       db.sqlite3 tuned for concurrent traffic: WAL, IMMEDIATE write
+#                transactions, busy timeout and the PRAGMAs in SQLITE_PRAGMAS,
+#                applied to every new connection by portal/database.py
+#   postgres     PostgreSQL through psycopg 3 with a connection pool, configured
+#                with DJANGO_DB_NAME, DJANGO_DB_USER, DJANGO_DB_PASSWORD,
+#                DJANGO_DB_HOST, DJANGO_DB_PORT and DJANGO_DB_POOL_SIZE
+DB_PROFILE = os.environ.get('DJANGO_DB_PROFILE', 'development')
+
 DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
     }
 }
+SQLITE_PRAGMAS = {}
+
+if DB_PROFILE == 'sqlite':
+    DATABASES['default'].update({
+        # Persistent connections keep the per-connection PRAGMAs and page cache warm
+        'CONN_MAX_AGE': int(os.environ.get('DJANGO_CONN_MAX_AGE', '600')),
+        'CONN_HEALTH_CHECKS': True,
+        'OPTIONS': {
+            # Seconds a writer waits for the lock before "database is locked"
+            'timeout': 20,
+            # Take the write lock up front so two transactions never deadlock upgrading from read
+            'transaction_mode': 'IMMEDIATE',
+        },
+    })
+    SQLITE_PRAGMAS = {
+        'journal_mode': 'WAL',
+        'synchronous': 'NORMAL',
+        'busy_timeout': 20000,
+        'cache_size': -20000,
+        'mmap_size': 256 * 1024 * 1024,
+        'temp_store': 'MEMORY',
+        'journal_size_limit': 64 * 1024 * 1024,
+    }
+elif DB_PROFILE == 'postgres':
+    DATABASES['default'] = {
+        'ENGINE': 'django.db.backends.postgresql',
+        'NAME': os.environ.get('DJANGO_DB_NAME', 'fresh_app'),
+        'USER': os.environ.get('DJANGO_DB_USER', 'fresh_app'),
+        'PASSWORD': os.environ.get('DJANGO_DB_PASSWORD', ''),
+        'HOST': os.environ.get('DJANGO_DB_HOST', '127.0.0.1'),
+        'PORT': os.environ.get('DJANGO_DB_PORT', '5432'),
+        # The pool replaces persistent connections, so CONN_MAX_AGE stays 0
+        'CONN_HEALTH_CHECKS': True,
+        'OPTIONS': {
+            'pool': {
+                'min_size': 2,
+                'max_size': int(os.environ.get('DJANGO_DB_POOL_SIZE', '10')),
+                'timeout': 10,
+            },
+        },
+    }
+elif DB_PROFILE != 'development':
+    raise ImproperlyConfigured(f'Unknown DJANGO_DB_PROFILE {DB_PROFILE!r}')
+
+# Read replicas: DJANGO_DB_REPLICAS is a comma-separated list of SQLite files
+# (refresh them from the primary with sync_replicas) or, under the postgres
+# profile, replica hosts. Reads are routed by portal.database.ReplicaRouter.
+DATABASE_REPLICAS = []
+for _number, _location in enumerate(filter(None, os.environ.get('DJANGO_DB_REPLICAS', '').split(',')), 1):
+    _replica = copy.deepcopy(DATABASES['default'])
+    _replica['NAME' if DB_PROFILE != 'postgres' else 'HOST'] = _location.strip()
+    _replica['TEST'] = {'MIRROR': 'default'}
+    DATABASES[f'replica_{_number}'] = _replica
+    DATABASE_REPLICAS.append(f'replica_{_number}')
+if DATABASE_REPLICAS:
+    DATABASE_ROUTERS = ['portal.database.ReplicaRouter']
+DATABASE_REPLICA_STICKY_SECONDS = 15
+DATABASE_REPLICA_HEALTH_CHECK_SECONDS = 10
+
+
+# Cache
+# Pick the backend with DJANGO_CACHE_BACKEND=locmem|file|redis; DJANGO_CACHE_LOCATION
+# overrides the default location (the redis backend works with any Redis-compatible server).
+
+CACHE_BACKENDS = {
+    'locmem': ('django.core.cache.backends.locmem.LocMemCache', 'fresh-app'),
+    'file': ('django.core.cache.backends.filebased.FileBasedCache', str(BASE_DIR / 'cache')),
+    'redis': ('django.core.cache.backends.redis.RedisCache', 'redis://127.0.0.1:6379/1'),
+}
+_cache_backend, _cache_location = CACHE_BACKENDS[os.environ.get('DJANGO_CACHE_BACKEND', 'locmem')]
+
+CACHES = {
+    'default': {
+        'BACKEND': _cache_backend,
+        'LOCATION': os.environ.get('DJANGO_CACHE_LOCATION', _cache_location),
+        'TIMEOUT': 300,
+    }
+}
+if 'redis' not in _cache_backend:
+    # Room for a few thousand rendered cards
+    CACHES['default']['OPTIONS'] = {'MAX_ENTRIES': 10000}
+
+CARD_CACHE_SECONDS = 6 * 60 * 60
+
+# Sessions are read from the cache and written back to the table in batches (see portal/sessions.py)
+# when the cache is shared between processes; locmem is private to each worker, so sessions write
+# through there. Set DJANGO_SESSION_WRITE_BEHIND=0|1 to override. Purge expired rows with purge_sessions.
+SESSION_ENGINE = 'portal.sessions'
+_shared_cache = 'locmem' not in _cache_backend
+SESSION_WRITE_BEHIND = os.environ.get('DJANGO_SESSION_WRITE_BEHIND', '1' if _shared_cache else '0') == '1'
+SESSION_FLUSH_INTERVAL = 1.0
+
+# The signed-in user and their profile are cached between requests (see portal/auth.py)
+AUTHENTICATION_BACKENDS = ['portal.auth.CachedModelBackend']
+AUTH_USER_CACHE_SECONDS = 5 * 60
+
+
+# Request instrumentation (see portal/instrumentation.py); off unless enabled
+INSTRUMENTATION_ENABLED = os.environ.get('DJANGO_INSTRUMENTATION', '') == '1'
+INSTRUMENTATION_PROFILE_RATE = float(os.environ.get('DJANGO_PROFILE_RATE', '0'))
 
 
 # Password validation
@@ -120,6 +239,9 @@ USE_TZ = True
 # https://docs.djangoproject.com/en/5.2/howto/static-files/
 
 STATIC_URL = 'static/'
+# Filled by collectstatic (see build_assets); served by portal.delivery.serve_static
+# unless the front proxy serves it directly
+STATIC_ROOT = Path(os.environ.get('DJANGO_STATIC_ROOT', BASE_DIR / 'staticfiles'))
 
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
@@ -129,6 +251,28 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 MEDIA_URL = '/media/'
 MEDIA_ROOT = BASE_DIR / 'media'
 
+STORAGES = {
+    # Media URLs carry a content hash so they can be cached as immutable
+    'default': {
+        'BACKEND': 'portal.storage.HashedURLFileSystemStorage',
+    },
+    # Contribution uploads, stored once per distinct file by content hash; gc_media reclaims orphans
+    'blobs': {
+        'BACKEND': 'portal.storage.ContentAddressedStorage',
+    },
+    # Hashed names plus .gz/.br siblings, cached as immutable
+    'staticfiles': {
+        'BACKEND': 'portal.storage.CompressedManifestStaticFilesStorage',
+    },
+}
+
+# Unreferenced media is kept this long before gc_media deletes it
+MEDIA_GC_GRACE_HOURS = 24
+
+# Let the front proxy stream media: None, 'x-accel-redirect' (nginx) or 'x-sendfile'
+MEDIA_OFFLOAD = None
+MEDIA_ACCEL_PREFIX = '/protected-media/'
+
 LOGIN_REDIRECT_URL = 'profile'
 
 # fresh_app/settings.py
@@ -1,8 +1,8 @@
 # fresh_app/urls.py
 from django.contrib import admin
-from django.urls import path, include
+from django.urls import path, re_path, include
 from django.conf import settings
-from django.conf.urls.static import static
+from portal.delivery import serve_media, serve_static
 from portal.views import admin_dashboard
 
 # This line tells the admin site to use our custom view as its homepage.
@@ -15,7 +15,9 @@ urlpatterns = [
     
     path('accounts/', include('django.contrib.auth.urls')),
     path('', include('portal.urls')),
-]
 
-if settings.DEBUG:
-    urlpatterns += static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
+    # Media with range/conditional GET support; see portal.delivery for proxy offload
+    re_path(r'^%s(?P<path>.+)$' % settings.MEDIA_URL.lstrip('/'), serve_media, name='media'),
+    # Collected assets with precompressed variants and immutable caching; run build_assets first
+    re_path(r'^%s(?P<path>.+)$' % settings.STATIC_URL.lstrip('/'), serve_static, name='static'),
+]
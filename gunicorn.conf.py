@@ -0,0 +1,61 @@
+"""
+Gunicorn config for serving fresh_app.
+
+    gunicorn -c gunicorn.conf.py
+
+DJANGO_SERVER=asgi (the default) runs fresh_app.asgi under uvicorn workers,
+which the async feed, profile and notification views and the events/ stream
+need to serve many slow clients per worker. DJANGO_SERVER=wsgi runs the
+classic threaded WSGI workers instead, for comparison with
+
+    python manage.py run_benchmark --base-url http://127.0.0.1:8000
+
+Several workers need a cache they share (DJANGO_CACHE_BACKEND=redis or
+file); with the default locmem cache the config runs one worker and refuses
+more.
+
+Needs ``gunicorn`` and, for ASGI, ``uvicorn[standard]``. Run
+``python manage.py build_assets`` first so STATIC_ROOT holds the hashed,
+precompressed assets.
+"""
+import multiprocessing
+import os
+
+SERVER = os.environ.get('DJANGO_SERVER', 'asgi')
+CACHE_BACKEND = os.environ.get('DJANGO_CACHE_BACKEND', 'locmem')
+
+bind = os.environ.get('GUNICORN_BIND', '127.0.0.1:8000')
+if CACHE_BACKEND == 'locmem':
+    # A locmem cache is private to each worker, so sessions and cached users saved
+    # in one would stay stale in the others; it only works with a single worker
+    workers = int(os.environ.get('GUNICORN_WORKERS', 1))
+    if workers > 1:
+        raise ValueError('DJANGO_CACHE_BACKEND=locmem is per process; use redis or file to run several workers')
+else:
+    workers = int(os.environ.get('GUNICORN_WORKERS', multiprocessing.cpu_count() * 2 + 1))
+# SSE connections stay open; don't let the arbiter kill workers that hold them
+timeout = 120
+graceful_timeout = 30
+keepalive = 5
+max_requests = 5000
+max_requests_jitter = 500
+accesslog = '-'
+
+if SERVER == 'asgi':
+    wsgi_app = 'fresh_app.asgi:application'
+    worker_class = 'uvicorn.workers.UvicornWorker'
+    # Async views run sync code in a thread per request, so connections can't be
+    # reused across requests; use the database's pool instead of CONN_MAX_AGE
+    raw_env = ['DJANGO_CONN_MAX_AGE=0']
+elif SERVER == 'wsgi':
+    wsgi_app = 'fresh_app.wsgi:application'
+    worker_class = 'gthread'
+    threads = int(os.environ.get('GUNICORN_THREADS', 8))
+else:
+    raise ValueError(f'Unknown DJANGO_SERVER {SERVER!r}')
+
+
+def worker_exit(server, worker):
+    # Write the sessions portal.sessions still has queued before the worker's threads die with it
+    from portal import sessions
+    sessions.flush()
@@ -2,6 +2,7 @@ from django.contrib import admin
 from django.contrib.auth.admin import UserAdmin as BaseUserAdmin
 from django.contrib.auth.models import User
 from .models import State, Contribution
+from . import search
 
 # Unregister the default User admin
 admin.site.unregister(User)
@@ -34,8 +35,15 @@ class StateAdmin(admin.ModelAdmin):
 
 @admin.register(Contribution)
 class ContributionAdmin(admin.ModelAdmin):
-    list_display = ('author', 'state', 'category', 'submitted_at')
+    list_display = ('author', 'state', 'category', 'submitted_at', 'likes_count', 'comments_count')
+    readonly_fields = ('likes_count', 'comments_count')
     list_filter = ('state', 'category', 'author')
+    # Kept so the changelist shows a search box; matching goes through the full-text index
     search_fields = ('text_content', 'author__username')
     date_hierarchy = 'submitted_at'
 
+    def get_search_results(self, request, queryset, search_term):
+        if not search_term:
+            return queryset, False
+        return search.filter_queryset(queryset, search_term), False
+
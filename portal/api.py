@@ -0,0 +1,318 @@
+# portal/api.py
+"""
+Read-only JSON API for the mobile clients, under ``/api/v1/``.
+
+    GET contributions/                  ?feed=explore|home|trending|week|state-<id>|category-<code>
+                                        (explore also takes ?state=<id>, ?category=<code>, ?author=<username>)
+    GET contributions/<id>/
+    GET contributions/<id>/comments/
+    GET states/
+    GET users/<username>/
+    GET notifications/                  signed in only
+
+Lists are ``{"data": [...], "next_cursor": ..., "has_more": ...}`` and take
+the same opaque ``cursor`` and ``page_size`` as the feed pages. Every
+resource takes ``?fields=a,b`` to return only those top-level fields; the
+per-viewer fields (``viewer_has_liked``, ``viewer_follows_author``,
+``comment_preview``, ``viewer_follows``) cost a query each per page and are
+skipped when they aren't asked for. Related rows are joined or batched, so a
+page costs the same number of queries whatever its size.
+
+Media come as absolute URLs of the renditions written by ``portal.media``,
+falling back to the original upload while they are processed.
+
+Responses carry a strong ``ETag`` (a hash of the body, suffixed with the
+content coding when compressed) and ``Cache-Control: private, no-cache``, so
+clients revalidate with ``If-None-Match`` and get an empty ``304`` when
+nothing changed. Bodies over ``API_COMPRESS_MIN_BYTES`` are sent brotli
+compressed (if ``brotli`` is installed) or gzipped, as the client accepts.
+"""
+import gzip
+import hashlib
+import json
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.files.storage import default_storage
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import HttpResponse, HttpResponseNotModified, JsonResponse
+from django.utils.cache import patch_vary_headers
+from django.utils.http import quote_etag
+from django.views.decorators.http import require_GET
+
+from . import feed, graph, notifications, ranking, timeline
+from .delivery import accepted_encodings, etag_matches
+from .models import Comment, Contribution, UserProfile
+from .pagination import InvalidCursor, after_cursor, clamp_page_size, split_page
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+COMPRESS_MIN_BYTES = getattr(settings, 'API_COMPRESS_MIN_BYTES', 512)
+# Responses are compressed per request, so trade a little ratio for speed
+BROTLI_QUALITY = 5
+GZIP_LEVEL = 6
+
+
+# --- Responses ---
+
+def _error(message, status):
+    return JsonResponse({'error': message}, status=status)
+
+
+def _encoding(request, body):
+    if len(body) < COMPRESS_MIN_BYTES:
+        return None
+    accepted = accepted_encodings(request)
+    if brotli is not None and 'br' in accepted:
+        return 'br'
+    if 'gzip' in accepted:
+        return 'gzip'
+    return None
+
+
+def _compress(body, encoding):
+    if encoding == 'br':
+        return brotli.compress(body, quality=BROTLI_QUALITY)
+    return gzip.compress(body, compresslevel=GZIP_LEVEL, mtime=0)
+
+
+def _respond(request, payload):
+    body = json.dumps(payload, cls=DjangoJSONEncoder, separators=(',', ':')).encode()
+    encoding = _encoding(request, body)
+    # Each content coding is a different representation, so it gets its own strong validator
+    digest = hashlib.sha256(body).hexdigest()[:32]
+    etag = quote_etag(f'{digest}-{encoding}' if encoding else digest)
+    if etag_matches(request.META.get('HTTP_IF_NONE_MATCH'), etag):
+        response = HttpResponseNotModified()
+    else:
+        response = HttpResponse(_compress(body, encoding) if encoding else body, content_type='application/json')
+        if encoding:
+            response['Content-Encoding'] = encoding
+    response['ETag'] = etag
+    response['Cache-Control'] = 'private, no-cache'
+    patch_vary_headers(response, ('Accept-Encoding', 'Cookie'))
+    return response
+
+
+def _respond_page(request, data, next_cursor):
+    return _respond(request, {'data': data, 'next_cursor': next_cursor, 'has_more': next_cursor is not None})
+
+
+def _fields(request):
+    """The ``?fields=`` sparse fieldset, or None for every field."""
+    fields = {name.strip() for name in request.GET.get('fields', '').split(',') if name.strip()}
+    return fields or None
+
+
+def _select(data, fields):
+    if fields is None:
+        return data
+    return {name: value for name, value in data.items() if name in fields}
+
+
+def _wants(fields, name):
+    return fields is None or name in fields
+
+
+# --- Serializers ---
+# Each takes a page of rows whose related rows are already joined and batches whatever else it needs
+
+def _user_ref(user):
+    return {'id': user.pk, 'username': user.username} if user else None
+
+
+def _url(request, name):
+    return request.build_absolute_uri(default_storage.url(name))
+
+
+def _media(request, contribution):
+    media = {}
+    images = contribution.media_renditions.get('image')
+    if images:
+        media['image'] = {
+            'url': _url(request, images[-1]['name']),
+            'renditions': [
+                {'url': _url(request, r['name']), 'width': r['width'], 'height': r['height']} for r in images
+            ],
+        }
+    elif contribution.image_content:
+        media['image'] = {'url': request.build_absolute_uri(contribution.image_content.url), 'renditions': []}
+    video_url = contribution.display_video_url()
+    if video_url:
+        poster_url = contribution.video_poster_url()
+        media['video'] = {
+            'url': request.build_absolute_uri(video_url),
+            'poster': request.build_absolute_uri(poster_url) if poster_url else None,
+        }
+    audio_url = contribution.display_audio_url()
+    if audio_url:
+        media['audio'] = {'url': request.build_absolute_uri(audio_url)}
+    return media
+
+
+def _comment(comment):
+    return {
+        'id': comment.pk,
+        'author': _user_ref(comment.author),
+        'text': comment.text,
+        'created_at': comment.created_at,
+    }
+
+
+def serialize_contributions(request, items, fields=None):
+    viewer = request.user
+    ids = [item.pk for item in items]
+    liked = feed.liked_ids(viewer, ids) if _wants(fields, 'viewer_has_liked') else set()
+    followed = (
+        feed.followed_author_ids(viewer, {item.author_id for item in items})
+        if _wants(fields, 'viewer_follows_author') else set()
+    )
+    previews = feed.comment_previews(ids) if _wants(fields, 'comment_preview') else {}
+    data = []
+    for item in items:
+        data.append(_select({
+            'id': item.pk,
+            'author': _user_ref(item.author),
+            'state': {'id': item.state_id, 'name': item.state.name},
+            'category': item.category,
+            'text': item.text_content or '',
+            'submitted_at': item.submitted_at,
+            'likes_count': item.likes_count,
+            'comments_count': item.comments_count,
+            'media_status': item.media_status,
+            'media': _media(request, item) if _wants(fields, 'media') else None,
+            'viewer_has_liked': item.pk in liked,
+            'viewer_follows_author': item.author_id in followed,
+            'comment_preview': [_comment(c) for c in previews.get(item.pk, [])],
+        }, fields))
+    return data
+
+
+def serialize_comments(comments, fields=None):
+    return [_select(_comment(comment), fields) for comment in comments]
+
+
+def serialize_user(request, user, fields=None):
+    try:
+        profile = user.userprofile
+    except UserProfile.DoesNotExist:
+        profile = None
+    viewer = request.user
+    follows = (
+        viewer.is_authenticated and viewer.pk != user.pk and graph.follows(viewer.pk, user.pk)
+        if _wants(fields, 'viewer_follows') else False
+    )
+    return _select({
+        'id': user.pk,
+        'username': user.username,
+        'date_joined': user.date_joined,
+        'followers_count': profile.followers_count if profile else 0,
+        'following_count': profile.following_count if profile else 0,
+        'viewer_follows': follows,
+    }, fields)
+
+
+def serialize_notifications(items, fields=None):
+    return [_select({
+        'id': n.pk,
+        'verb': n.verb,
+        'text': notifications.describe(n, n.sender.username if n.sender else 'Someone'),
+        'sender': _user_ref(n.sender),
+        'actor_count': n.actor_count,
+        'target_id': n.target_id,
+        'is_read': n.is_read,
+        'timestamp': n.timestamp,
+    }, fields) for n in items]
+
+
+# --- Views ---
+
+def _explore_queryset(request):
+    queryset = Contribution.objects.all()
+    state = request.GET.get('state')
+    if state:
+        if not state.isdigit():
+            raise ValueError('state must be an id')
+        queryset = queryset.filter(state_id=int(state))
+    category = request.GET.get('category')
+    if category:
+        queryset = queryset.filter(category=category)
+    author = request.GET.get('author')
+    if author:
+        queryset = queryset.filter(author__username=author)
+    return queryset
+
+
+@require_GET
+def contributions(request):
+    name = request.GET.get('feed', 'explore')
+    cursor, page_size = request.GET.get('cursor'), request.GET.get('page_size')
+    try:
+        if name == 'explore':
+            items, next_cursor = feed.paginate(_explore_queryset(request), cursor, page_size)
+        elif name == 'home':
+            if not request.user.is_authenticated:
+                return _error('Authentication required', 401)
+            ids, next_cursor = timeline.page_ids(request.user, cursor, page_size)
+            items = feed.in_display_order(ids)
+        elif ranking.is_list(name):
+            ids, next_cursor = ranking.page_ids(name, cursor, page_size)
+            items = feed.in_display_order(ids)
+        else:
+            return _error('Unknown feed', 404)
+    except InvalidCursor:
+        return _error('Invalid cursor', 400)
+    except ValueError as exc:
+        return _error(str(exc), 400)
+    return _respond_page(request, serialize_contributions(request, items, _fields(request)), next_cursor)
+
+
+@require_GET
+def contribution_detail(request, contribution_id):
+    items = list(feed.with_card_data(Contribution.objects.filter(pk=contribution_id)))
+    if not items:
+        return _error('Not found', 404)
+    return _respond(request, {'data': serialize_contributions(request, items, _fields(request))[0]})
+
+
+@require_GET
+def contribution_comments(request, contribution_id):
+    if not Contribution.objects.filter(pk=contribution_id).exists():
+        return _error('Not found', 404)
+    page_size = clamp_page_size(request.GET.get('page_size'))
+    queryset = Comment.objects.filter(contribution_id=contribution_id)
+    try:
+        queryset = after_cursor(queryset, request.GET.get('cursor'), time_field='created_at')
+        rows = list(queryset.select_related('author').order_by('-created_at', '-id')[:page_size + 1])
+    except InvalidCursor:
+        return _error('Invalid cursor', 400)
+    comments, next_cursor = split_page(rows, page_size, key=lambda c: (c.created_at, c.pk))
+    return _respond_page(request, serialize_comments(comments, _fields(request)), next_cursor)
+
+
+@require_GET
+def states(request):
+    fields = _fields(request)
+    return _respond(request, {'data': [_select({'id': pk, 'name': name}, fields) for pk, name in ranking.states()]})
+
+
+@require_GET
+def user_detail(request, username):
+    user = User.objects.select_related('userprofile').filter(username=username).first()
+    if user is None:
+        return _error('Not found', 404)
+    return _respond(request, {'data': serialize_user(request, user, _fields(request))})
+
+
+@require_GET
+def notification_list(request):
+    if not request.user.is_authenticated:
+        return _error('Authentication required', 401)
+    try:
+        items, next_cursor = notifications.page(request.user.pk, request.GET.get('cursor'), request.GET.get('page_size'))
+    except InvalidCursor:
+        return _error('Invalid cursor', 400)
+    return _respond_page(request, serialize_notifications(items, _fields(request)), next_cursor)
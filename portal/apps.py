@@ -4,3 +4,7 @@ from django.apps import AppConfig
 class PortalConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'portal'
+
+    def ready(self):
+        # Connects the search index, card cache, ranking, follow graph, user cache, media refcount and connection setup signal handlers
+        from . import auth, blobs, cards, database, graph, ranking, search  # noqa: F401
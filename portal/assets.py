@@ -0,0 +1,403 @@
+# portal/assets.py
+"""
+Front-end build behind ``build_assets``.
+
+The pages used to load the Tailwind Play CDN, which compiles CSS in the
+browser on every page view, plus both font families from Google Fonts.
+Instead the build writes, into ``portal/static/portal/``:
+
+* ``css/app.css``: ``assets/base.css`` (a small preflight),
+  ``assets/site.css`` (the portal's own components) and the utility classes
+  the templates and scripts actually use, minified. Utilities come from a
+  Tailwind-compatible rule table (``utility_rules``); candidate class names
+  are every token in the templates, ``static/portal/js`` and
+  ``MARKUP_MODULES``, the way Tailwind's own content scan works, so unknown
+  tokens simply produce nothing.
+* ``css/admin.css``: the utilities alone, for the admin pages, which keep
+  Django's admin styles.
+* ``fonts/*.woff2``: the Noto Sans Telugu and Poppins faces listed in
+  ``FONTS``, cut down to Latin, the Telugu block and any other character
+  in the templates. Needs ``fontTools`` (and ``brotli`` for WOFF2) and the
+  source files in ``ASSET_FONT_DIR``; without them the font stacks fall
+  back to locally installed fonts.
+
+``collectstatic`` then stores everything under content-hashed names with
+gzip and brotli siblings (``portal.storage.CompressedManifestStaticFilesStorage``),
+and ``portal.delivery.serve_static`` serves them with far-future caching.
+"""
+import re
+from pathlib import Path
+
+from django.conf import settings
+
+try:
+    from fontTools import subset as font_subset
+except ImportError:
+    font_subset = None
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+APP_DIR = Path(__file__).resolve().parent
+SOURCE_DIR = APP_DIR / 'assets'
+TEMPLATE_DIRS = [APP_DIR / 'templates']
+SCRIPT_DIR = APP_DIR / 'static' / 'portal' / 'js'
+# Python modules that build markup themselves
+MARKUP_MODULES = [APP_DIR / 'cards.py']
+OUTPUT_DIR = APP_DIR / 'static' / 'portal'
+FONT_DIR = Path(getattr(settings, 'ASSET_FONT_DIR', SOURCE_DIR / 'fonts'))
+
+# (family, weight, source file in FONT_DIR)
+FONTS = [
+    ('Poppins', 400, 'Poppins-Regular.ttf'),
+    ('Poppins', 600, 'Poppins-SemiBold.ttf'),
+    ('Noto Sans Telugu', 400, 'NotoSansTelugu-Regular.ttf'),
+    ('Noto Sans Telugu', 700, 'NotoSansTelugu-Bold.ttf'),
+]
+# Always kept in font subsets: printable ASCII, Latin-1, general punctuation and the Telugu block
+FONT_RANGES = [(0x20, 0x7E), (0xA0, 0xFF), (0x2000, 0x206F), (0x0C00, 0x0C7F)]
+
+BREAKPOINTS = {'sm': 640, 'md': 768, 'lg': 1024, 'xl': 1280, '2xl': 1536}
+PSEUDO_CLASSES = {'hover': ':hover', 'focus': ':focus'}
+
+
+# --- Theme ---
+
+COLORS = {
+    'white': '#fff',
+    'black': '#000',
+    'transparent': 'transparent',
+    'current': 'currentColor',
+    'primary': '#0D9488',
+    'secondary': '#F97316',
+}
+_PALETTE = {
+    'gray': '#f9fafb #f3f4f6 #e5e7eb #d1d5db #9ca3af #6b7280 #4b5563 #374151 #1f2937 #111827',
+    'red': '#fef2f2 #fee2e2 #fecaca #fca5a5 #f87171 #ef4444 #dc2626 #b91c1c #991b1b #7f1d1d',
+    'orange': '#fff7ed #ffedd5 #fed7aa #fdba74 #fb923c #f97316 #ea580c #c2410c #9a3412 #7c2d12',
+    'yellow': '#fefce8 #fef9c3 #fef08a #fde047 #facc15 #eab308 #ca8a04 #a16207 #854d0e #713f12',
+    'green': '#f0fdf4 #dcfce7 #bbf7d0 #86efac #4ade80 #22c55e #16a34a #15803d #166534 #14532d',
+    'teal': '#f0fdfa #ccfbf1 #99f6e4 #5eead4 #2dd4bf #14b8a6 #0d9488 #0f766e #115e59 #134e4a',
+    'blue': '#eff6ff #dbeafe #bfdbfe #93c5fd #60a5fa #3b82f6 #2563eb #1d4ed8 #1e40af #1e3a8a',
+    'indigo': '#eef2ff #e0e7ff #c7d2fe #a5b4fc #818cf8 #6366f1 #4f46e5 #4338ca #3730a3 #312e81',
+    'purple': '#faf5ff #f3e8ff #e9d5ff #d8b4fe #c084fc #a855f7 #9333ea #7e22ce #6b21a8 #581c87',
+}
+for _family, _shades in _PALETTE.items():
+    for _shade, _value in zip((50, 100, 200, 300, 400, 500, 600, 700, 800, 900), _shades.split()):
+        COLORS[f'{_family}-{_shade}'] = _value
+
+SPACING = {'0': '0px', 'px': '1px'}
+for _step in (0.5, 1, 1.5, 2, 2.5, 3, 3.5, 4, 5, 6, 7, 8, 9, 10, 11, 12, 14, 16, 20, 24, 28, 32, 36, 40, 44, 48, 56, 64, 72, 80, 96):
+    SPACING[f'{_step:g}'] = f'{_step / 4:g}rem'
+
+FONT_SIZES = {
+    'xs': ('.75rem', '1rem'), 'sm': ('.875rem', '1.25rem'), 'base': ('1rem', '1.5rem'),
+    'lg': ('1.125rem', '1.75rem'), 'xl': ('1.25rem', '1.75rem'), '2xl': ('1.5rem', '2rem'),
+    '3xl': ('1.875rem', '2.25rem'), '4xl': ('2.25rem', '2.5rem'), '5xl': ('3rem', '1'),
+}
+FONT_WEIGHTS = {'normal': 400, 'medium': 500, 'semibold': 600, 'bold': 700}
+MAX_WIDTHS = {
+    'xs': '20rem', 'sm': '24rem', 'md': '28rem', 'lg': '32rem', 'xl': '36rem', '2xl': '42rem',
+    '3xl': '48rem', '4xl': '56rem', '5xl': '64rem', '6xl': '72rem', '7xl': '80rem', 'full': '100%', 'none': 'none',
+}
+RADII = {'none': '0px', 'sm': '.125rem', '': '.25rem', 'md': '.375rem', 'lg': '.5rem', 'xl': '.75rem', '2xl': '1rem', 'full': '9999px'}
+SHADOWS = {
+    '': '0 1px 3px 0 rgb(0 0 0 / .1), 0 1px 2px -1px rgb(0 0 0 / .1)',
+    'md': '0 4px 6px -1px rgb(0 0 0 / .1), 0 2px 4px -2px rgb(0 0 0 / .1)',
+    'lg': '0 10px 15px -3px rgb(0 0 0 / .1), 0 4px 6px -4px rgb(0 0 0 / .1)',
+    'xl': '0 20px 25px -5px rgb(0 0 0 / .1), 0 8px 10px -6px rgb(0 0 0 / .1)',
+    'none': '0 0 #0000',
+}
+TRANSITION = (
+    'transition-property:color,background-color,border-color,text-decoration-color,fill,stroke,opacity,'
+    'box-shadow,transform,filter;transition-timing-function:cubic-bezier(.4,0,.2,1);transition-duration:150ms'
+)
+KEYFRAMES = {'animate-spin': '@keyframes spin{to{transform:rotate(360deg)}}'}
+
+STATIC_UTILITIES = {
+    'block': 'display:block', 'inline-block': 'display:inline-block', 'inline': 'display:inline',
+    'flex': 'display:flex', 'inline-flex': 'display:inline-flex', 'grid': 'display:grid',
+    'table': 'display:table', 'hidden': 'display:none',
+    'static': 'position:static', 'relative': 'position:relative', 'absolute': 'position:absolute',
+    'fixed': 'position:fixed', 'sticky': 'position:sticky',
+    'flex-row': 'flex-direction:row', 'flex-col': 'flex-direction:column', 'flex-wrap': 'flex-wrap:wrap',
+    'flex-1': 'flex:1 1 0%', 'flex-grow': 'flex-grow:1', 'grow': 'flex-grow:1',
+    'flex-shrink-0': 'flex-shrink:0', 'shrink-0': 'flex-shrink:0',
+    'items-start': 'align-items:flex-start', 'items-center': 'align-items:center', 'items-end': 'align-items:flex-end',
+    'justify-start': 'justify-content:flex-start', 'justify-center': 'justify-content:center',
+    'justify-end': 'justify-content:flex-end', 'justify-between': 'justify-content:space-between',
+    'text-left': 'text-align:left', 'text-center': 'text-align:center', 'text-right': 'text-align:right',
+    'align-top': 'vertical-align:top', 'align-middle': 'vertical-align:middle',
+    'font-sans': "font-family:ui-sans-serif,system-ui,sans-serif",
+    'font-mono': 'font-family:ui-monospace,SFMono-Regular,Menlo,Monaco,Consolas,monospace',
+    'italic': 'font-style:italic', 'underline': 'text-decoration-line:underline', 'uppercase': 'text-transform:uppercase',
+    'truncate': 'overflow:hidden;text-overflow:ellipsis;white-space:nowrap', 'whitespace-pre-wrap': 'white-space:pre-wrap',
+    'break-words': 'overflow-wrap:break-word',
+    'overflow-hidden': 'overflow:hidden', 'overflow-auto': 'overflow:auto',
+    'overflow-x-auto': 'overflow-x:auto', 'overflow-y-auto': 'overflow-y:auto',
+    'cursor-pointer': 'cursor:pointer', 'pointer-events-none': 'pointer-events:none',
+    'w-full': 'width:100%', 'w-auto': 'width:auto', 'w-screen': 'width:100vw',
+    'h-full': 'height:100%', 'h-auto': 'height:auto', 'min-h-screen': 'min-height:100vh',
+    'mx-auto': 'margin-left:auto;margin-right:auto',
+    'border': 'border-width:1px', 'border-0': 'border-width:0px', 'border-2': 'border-width:2px',
+    'border-t': 'border-top-width:1px', 'border-b': 'border-bottom-width:1px',
+    'border-l': 'border-left-width:1px', 'border-r': 'border-right-width:1px',
+    'border-l-2': 'border-left-width:2px', 'border-l-4': 'border-left-width:4px',
+    'transition': TRANSITION,
+    'animate-spin': 'animation:spin 1s linear infinite',
+    'object-cover': 'object-fit:cover',
+    'sr-only': 'position:absolute;width:1px;height:1px;padding:0;margin:-1px;overflow:hidden;clip:rect(0,0,0,0);white-space:nowrap;border-width:0',
+}
+
+_STATIC_ORDER = {name: position for position, name in enumerate(STATIC_UTILITIES)}
+# Display utilities are listed first; hidden must come after all of them
+_STATIC_ORDER['hidden'] = len(_STATIC_ORDER)
+
+_SIDES = {
+    '': ('',), 'x': ('-left', '-right'), 'y': ('-top', '-bottom'),
+    't': ('-top',), 'r': ('-right',), 'b': ('-bottom',), 'l': ('-left',),
+}
+_INSETS = {'top': ('top',), 'right': ('right',), 'bottom': ('bottom',), 'left': ('left',), 'inset': ('top', 'right', 'bottom', 'left')}
+
+
+# --- Utilities ---
+
+def _spacing_rule(name):
+    match = re.fullmatch(r'(-?)([pm])([xytrbl]?)-(.+)', name)
+    if not match:
+        return None
+    negative, kind, side, size = match.groups()
+    value = SPACING.get(size) or ('auto' if kind == 'm' and size == 'auto' else None)
+    if value is None or (negative and kind == 'p'):
+        return None
+    if negative:
+        value = f'-{value}'
+    prop = 'padding' if kind == 'p' else 'margin'
+    return ';'.join(f'{prop}{suffix}:{value}' for suffix in _SIDES[side])
+
+
+def _space_between_rule(name):
+    match = re.fullmatch(r'space-([xy])-(.+)', name)
+    if not match or match[2] not in SPACING:
+        return None
+    side = 'left' if match[1] == 'x' else 'top'
+    return f'margin-{side}:{SPACING[match[2]]}', ' > :not([hidden]) ~ :not([hidden])'
+
+
+def _size_rule(name):
+    match = re.fullmatch(r'(w|h|gap|gap-x|gap-y|top|right|bottom|left|inset)-(.+)', name)
+    if not match:
+        return None
+    kind, size = match.groups()
+    fraction = re.fullmatch(r'(\d+)/(\d+)', size)
+    if fraction and kind in ('w', 'h') and int(fraction[2]):
+        value = f'{int(fraction[1]) / int(fraction[2]) * 100:g}%'
+    else:
+        value = SPACING.get(size)
+    if value is None:
+        return None
+    if kind in _INSETS:
+        return ';'.join(f'{prop}:{value}' for prop in _INSETS[kind])
+    prop = {'w': 'width', 'h': 'height', 'gap': 'gap', 'gap-x': 'column-gap', 'gap-y': 'row-gap'}[kind]
+    return f'{prop}:{value}'
+
+
+def _color_rule(name):
+    match = re.fullmatch(r'(bg|text|border|ring)-(.+)', name)
+    if not match or match[2] not in COLORS:
+        return None
+    value = COLORS[match[2]]
+    return {
+        'bg': f'background-color:{value}',
+        'text': f'color:{value}',
+        'border': f'border-color:{value}',
+        'ring': f'--tw-ring-color:{value}',
+    }[match[1]]
+
+
+def _typography_rule(name):
+    if name.startswith('text-') and name[5:] in FONT_SIZES:
+        size, line_height = FONT_SIZES[name[5:]]
+        return f'font-size:{size};line-height:{line_height}'
+    if name.startswith('font-') and name[5:] in FONT_WEIGHTS:
+        return f'font-weight:{FONT_WEIGHTS[name[5:]]}'
+    return None
+
+
+def _box_rule(name):
+    if name == 'rounded' or name.startswith('rounded-'):
+        radius = RADII.get(name[8:])
+        return radius and f'border-radius:{radius}'
+    if name == 'shadow' or name.startswith('shadow-'):
+        shadow = SHADOWS.get(name[7:])
+        return shadow and f'box-shadow:{shadow}'
+    if name.startswith('max-w-') and name[6:] in MAX_WIDTHS:
+        return f'max-width:{MAX_WIDTHS[name[6:]]}'
+    match = re.fullmatch(r'(opacity|z)-(\d+)', name)
+    if match:
+        value = int(match[2])
+        if match[1] == 'opacity' and value <= 100 and value % 5 == 0:
+            return f'opacity:{value / 100:g}'
+        if match[1] == 'z' and value % 10 == 0:
+            return f'z-index:{value}'
+    match = re.fullmatch(r'grid-cols-(\d+)', name)
+    if match and 1 <= int(match[1]) <= 12:
+        return f'grid-template-columns:repeat({match[1]},minmax(0,1fr))'
+    match = re.fullmatch(r'ring(?:-(\d))?', name)
+    if match:
+        return f'box-shadow:0 0 0 {match[1] or 3}px var(--tw-ring-color,rgb(59 130 246 / .5))'
+    return None
+
+
+def utility_rules():
+    """Rule functions in cascade order: later rules win over earlier ones, as in Tailwind."""
+    return [
+        lambda name: STATIC_UTILITIES.get(name),
+        _box_rule,
+        _size_rule,
+        _spacing_rule,
+        _space_between_rule,
+        _typography_rule,
+        _color_rule,
+    ]
+
+
+def escape_class(name):
+    return re.sub(r'([^a-zA-Z0-9_-])', r'\\\1', name)
+
+
+def utility(name):
+    """``(order, css)`` for one candidate class name, or None if it isn't a known utility."""
+    *variants, base = name.split(':')
+    if len(variants) > 1:
+        return None
+    variant = variants[0] if variants else None
+    if variant and variant not in BREAKPOINTS and variant not in PSEUDO_CLASSES:
+        return None
+    if base == 'container':
+        if variant:
+            return None
+        widths = ''.join(
+            f'@media (min-width:{width}px){{.container{{max-width:{width}px}}}}' for width in BREAKPOINTS.values()
+        )
+        return (0, -1, 0, name), '.container{width:100%}' + widths
+    for index, rule in enumerate(utility_rules()):
+        result = rule(base)
+        if not result:
+            continue
+        declarations, suffix = result if isinstance(result, tuple) else (result, '')
+        selector = '.' + escape_class(name) + PSEUDO_CLASSES.get(variant, '') + suffix
+        css = f'{selector}{{{declarations}}}'
+        group = 0
+        if variant in PSEUDO_CLASSES:
+            group = 1
+        elif variant in BREAKPOINTS:
+            group = 2 + list(BREAKPOINTS).index(variant)
+            css = f'@media (min-width:{BREAKPOINTS[variant]}px){{{css}}}'
+        # Static utilities keep their table order, so e.g. ``hidden`` beats ``flex``
+        position = _STATIC_ORDER.get(base, 0) if index == 0 else 0
+        return (group, index, position, name), css + KEYFRAMES.get(base, '')
+    return None
+
+
+# --- Build ---
+
+CANDIDATE_RE = re.compile(r'[a-z0-9:/._-]+')
+
+
+def content_files():
+    for directory in TEMPLATE_DIRS:
+        yield from sorted(directory.rglob('*.html'))
+    yield from sorted(SCRIPT_DIR.glob('*.js'))
+    yield from MARKUP_MODULES
+
+
+def candidates(paths=None):
+    names = set()
+    for path in paths or content_files():
+        names.update(token.strip('.:/') for token in CANDIDATE_RE.findall(path.read_text(encoding='utf-8')))
+    return names
+
+
+def utilities_css(names):
+    rules = sorted(filter(None, (utility(name) for name in names)))
+    return '\n'.join(css for order, css in rules)
+
+
+def minify_css(css):
+    css = re.sub(r'/\*.*?\*/', '', css, flags=re.S)
+    css = re.sub(r'\s+', ' ', css)
+    css = re.sub(r'\s*([{};,>~])\s*', r'\1', css)
+    css = re.sub(r':\s+', ':', css)
+    return css.replace(';}', '}').strip()
+
+
+def font_faces(built):
+    """``@font-face`` rules for the subsets in ``built`` (``[(family, weight, file name)]``)."""
+    return ''.join(
+        f"@font-face{{font-family:'{family}';font-style:normal;font-weight:{weight};font-display:swap;"
+        f"src:local('{family}'),url('../fonts/{filename}') format('woff2')}}"
+        for family, weight, filename in built
+    )
+
+
+def subset_fonts(text, output_dir):
+    """Write a WOFF2 subset of every available ``FONTS`` source; returns what was built and what was skipped."""
+    built, skipped = [], []
+    unicodes = {ord(char) for char in text if ord(char) > 0x20}
+    for start, end in FONT_RANGES:
+        unicodes.update(range(start, end + 1))
+    for family, weight, source in FONTS:
+        path = FONT_DIR / source
+        if font_subset is None or brotli is None:
+            skipped.append((source, 'fontTools and brotli are not installed'))
+            continue
+        if not path.exists():
+            skipped.append((source, f'not found in {FONT_DIR}'))
+            continue
+        filename = f'{path.stem}.woff2'
+        options = font_subset.Options()
+        options.flavor = 'woff2'
+        options.layout_features = ['*']
+        options.name_IDs = ['*']
+        font = font_subset.load_font(str(path), options)
+        subsetter = font_subset.Subsetter(options)
+        subsetter.populate(unicodes=unicodes)
+        subsetter.subset(font)
+        output_dir.mkdir(parents=True, exist_ok=True)
+        font_subset.save_font(font, str(output_dir / filename), options)
+        built.append((family, weight, filename))
+    return built, skipped
+
+
+def build(output_dir=OUTPUT_DIR, fonts=True):
+    """Generate the stylesheets (and font subsets); returns ``{output name: text}`` plus a list of skipped fonts."""
+    paths = list(content_files())
+    built, skipped = [], []
+    if fonts:
+        text = ''.join(path.read_text(encoding='utf-8') for path in paths)
+        built, skipped = subset_fonts(text, output_dir / 'fonts')
+    utilities = utilities_css(candidates(paths))
+    sources = [(SOURCE_DIR / name).read_text(encoding='utf-8') for name in ('base.css', 'site.css')]
+    outputs = {
+        'css/app.css': minify_css(font_faces(built) + ''.join(sources) + utilities) + '\n',
+        'css/admin.css': minify_css(utilities) + '\n',
+    }
+    return outputs, skipped
+
+
+def write(outputs, output_dir=OUTPUT_DIR):
+    for name, text in outputs.items():
+        path = output_dir / name
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(text, encoding='utf-8')
+
+
+def stale(outputs, output_dir=OUTPUT_DIR):
+    """Names in ``outputs`` whose file on disk differs (for ``build_assets --check``)."""
+    return [
+        name for name, text in outputs.items()
+        if not (output_dir / name).exists() or (output_dir / name).read_text(encoding='utf-8') != text
+    ]
@@ -0,0 +1,75 @@
+# portal/auth.py
+"""
+Authentication backend that caches each user, with their profile joined in.
+
+``AuthenticationMiddleware`` loads the signed-in user once per request; with
+this backend that load is a cache hit for ``AUTH_USER_CACHE_SECONDS`` after
+the first request, and ``request.user.userprofile`` comes with it, so views
+don't query either. Saving or deleting a user or profile drops the entry;
+counter updates that bypass ``save()`` (follows, ``last_seen``) call
+``forget`` themselves or tolerate a short-lived stale value.
+"""
+from django.conf import settings
+from django.contrib.auth.backends import ModelBackend
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .models import UserProfile
+
+CACHE_SECONDS = getattr(settings, 'AUTH_USER_CACHE_SECONDS', 5 * 60)
+
+
+def _key(user_id):
+    return f'auth-user:{user_id}'
+
+
+def _queryset():
+    return User._default_manager.select_related('userprofile')
+
+
+def forget(*user_ids):
+    cache.delete_many([_key(pk) for pk in user_ids])
+
+
+def profile_for(user):
+    """``user``'s profile, from the cached user when it was joined in; created if missing."""
+    try:
+        return user.userprofile
+    except UserProfile.DoesNotExist:
+        return UserProfile.objects.get_or_create(user=user)[0]
+
+
+class CachedModelBackend(ModelBackend):
+    def get_user(self, user_id):
+        user = cache.get(_key(user_id))
+        if user is None:
+            try:
+                user = _queryset().get(pk=user_id)
+            except User.DoesNotExist:
+                return None
+            cache.set(_key(user_id), user, CACHE_SECONDS)
+        return user if self.user_can_authenticate(user) else None
+
+    async def aget_user(self, user_id):
+        user = await cache.aget(_key(user_id))
+        if user is None:
+            try:
+                user = await _queryset().aget(pk=user_id)
+            except User.DoesNotExist:
+                return None
+            await cache.aset(_key(user_id), user, CACHE_SECONDS)
+        return user if self.user_can_authenticate(user) else None
+
+
+@receiver(post_save, sender=User, dispatch_uid='auth-forget-user')
+@receiver(post_delete, sender=User, dispatch_uid='auth-forget-deleted-user')
+def forget_user(sender, instance, **kwargs):
+    forget(instance.pk)
+
+
+@receiver(post_save, sender=UserProfile, dispatch_uid='auth-forget-profile')
+@receiver(post_delete, sender=UserProfile, dispatch_uid='auth-forget-deleted-profile')
+def forget_profile(sender, instance, **kwargs):
+    forget(instance.user_id)
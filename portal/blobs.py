@@ -0,0 +1,244 @@
+# portal/blobs.py
+"""
+Reference counts and garbage collection for contribution media.
+
+``ContentAddressedStorage`` stores every distinct upload once, under its
+SHA-256 (``images/3f/2a/3f2a….jpg``), and records it as a ``MediaBlob``.
+The receivers below keep ``MediaBlob.ref_count`` equal to the number of
+contribution file fields naming the blob, inside the transaction that
+changes them. Deleting a contribution, directly or by cascade from its
+author or state, also deletes its renditions once the transaction commits.
+
+Blob files themselves are never deleted while serving requests, since the
+same bytes may be uploaded again at any moment. ``gc_media`` reclaims them
+with a mark and sweep that streams over both sides in batches:
+
+1. ``recount``: recompute every blob's references from the database
+2. ``sweep_blobs``: delete blobs unreferenced for ``MEDIA_GC_GRACE_HOURS``
+3. ``sweep_files``: walk the media directories and delete files nothing in
+   the database names (flat pre-hashing uploads of deleted posts, rendition
+   folders of deleted contributions, copies left by interrupted writes)
+
+Files and blobs touched within the grace period are always kept, so an
+upload that isn't attached to a post yet is never swept from under it.
+"""
+import logging
+import os
+import shutil
+from collections import Counter
+from datetime import timedelta
+from itertools import islice
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.db import transaction
+from django.db.models import Count
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+from django.utils import timezone
+
+from .models import Contribution, MediaBlob, UploadSession, shifted
+from .storage import blob_storage
+
+logger = logging.getLogger(__name__)
+
+GRACE = timedelta(hours=getattr(settings, 'MEDIA_GC_GRACE_HOURS', 24))
+BATCH_SIZE = 500
+MEDIA_FIELDS = ('image_content', 'audio_content', 'video_content')
+RENDITIONS_DIR = 'renditions'
+
+
+def upload_dirs():
+    return sorted({Contribution._meta.get_field(field).upload_to.strip('/') for field in MEDIA_FIELDS})
+
+
+def media_names(contribution):
+    return [name for name in (getattr(contribution, field).name for field in MEDIA_FIELDS) if name]
+
+
+def rendition_names(renditions):
+    names = []
+    for value in (renditions or {}).values():
+        if isinstance(value, list):
+            names.extend(item['name'] for item in value)
+        elif value:
+            names.append(value)
+    return names
+
+
+# --- Reference counts ---
+
+def _adjust(counts, sign):
+    """Add ``sign * n`` to the ref_count of each blob name in the ``{name: n}`` mapping."""
+    by_amount = {}
+    for name, n in counts.items():
+        by_amount.setdefault(n, []).append(name)
+    for n, names in by_amount.items():
+        MediaBlob.objects.filter(name__in=names).update(ref_count=shifted('ref_count', sign * n))
+
+
+@receiver(pre_save, sender=Contribution, dispatch_uid='blobs-contribution-saving')
+def remember_media_names(sender, instance, raw=False, update_fields=None, **kwargs):
+    if raw or (update_fields is not None and not set(update_fields) & set(MEDIA_FIELDS)):
+        return
+    if instance._state.adding:
+        instance._stored_media_names = []
+        return
+    row = Contribution.objects.filter(pk=instance.pk).values_list(*MEDIA_FIELDS).first()
+    instance._stored_media_names = [name for name in row or () if name]
+
+
+@receiver(post_save, sender=Contribution, dispatch_uid='blobs-contribution-saved')
+def count_media_references(sender, instance, **kwargs):
+    stored = instance.__dict__.pop('_stored_media_names', None)
+    if stored is None:
+        return
+    old, new = Counter(stored), Counter(media_names(instance))
+    _adjust(new - old, 1)
+    _adjust(old - new, -1)
+
+
+@receiver(post_delete, sender=Contribution, dispatch_uid='blobs-contribution-deleted')
+def release_media(sender, instance, **kwargs):
+    _adjust(Counter(media_names(instance)), -1)
+    renditions = rendition_names(instance.media_renditions)
+    if renditions:
+        transaction.on_commit(lambda: _delete_renditions(renditions))
+
+
+def _delete_renditions(names):
+    for name in names:
+        try:
+            default_storage.delete(name)
+        except OSError:
+            logger.warning('Could not delete rendition %s', name)
+
+
+# --- Mark and sweep ---
+
+def _batches(iterable, size):
+    iterator = iter(iterable)
+    while batch := list(islice(iterator, size)):
+        yield batch
+
+
+def _referenced(names):
+    """``{name: n}``: how many contribution file fields name each of ``names``."""
+    counts = Counter()
+    for field in MEDIA_FIELDS:
+        counts.update(dict(
+            Contribution.objects.filter(**{f'{field}__in': names})
+            .values(field).annotate(n=Count('*')).values_list(field, 'n')
+        ))
+    return counts
+
+
+def _held_by_uploads(names):
+    """Names of finished chunked uploads that are waiting to be attached to a post."""
+    return set(
+        UploadSession.objects.filter(stored_name__in=names).exclude(status=UploadSession.ATTACHED)
+        .values_list('stored_name', flat=True)
+    )
+
+
+def recount(batch_size=BATCH_SIZE, dry_run=False):
+    """Mark: set every blob's ref_count from the database; returns ``(checked, fixed)``."""
+    checked = fixed = 0
+    last_pk = 0
+    while True:
+        batch = list(MediaBlob.objects.filter(pk__gt=last_pk).order_by('pk').values_list('pk', 'name', 'ref_count')[:batch_size])
+        if not batch:
+            break
+        last_pk = batch[-1][0]
+        counts = _referenced([name for pk, name, ref_count in batch])
+        drifted = [MediaBlob(pk=pk, ref_count=counts[name]) for pk, name, ref_count in batch if ref_count != counts[name]]
+        checked += len(batch)
+        fixed += len(drifted)
+        if drifted and not dry_run:
+            MediaBlob.objects.bulk_update(drifted, ['ref_count'])
+    return checked, fixed
+
+
+def sweep_blobs(cutoff, batch_size=BATCH_SIZE, dry_run=False):
+    """Delete blobs unreferenced since before ``cutoff``; returns ``(count, bytes)``."""
+    storage = blob_storage()
+    deleted = freed = 0
+    last_pk = 0
+    while True:
+        batch = list(
+            MediaBlob.objects.filter(ref_count=0, updated_at__lt=cutoff, pk__gt=last_pk)
+            .order_by('pk').values_list('pk', 'name', 'size')[:batch_size]
+        )
+        if not batch:
+            break
+        last_pk = batch[-1][0]
+        held = _held_by_uploads([name for pk, name, size in batch])
+        for pk, name, size in batch:
+            if name in held:
+                continue
+            if not dry_run:
+                # Conditional, so a blob referenced or uploaded again since the batch was read survives
+                if not MediaBlob.objects.filter(pk=pk, ref_count=0, updated_at__lt=cutoff).delete()[0]:
+                    continue
+                storage.delete(name)
+            deleted += 1
+            freed += size
+    return deleted, freed
+
+
+def _walk(root, top):
+    """Relative names and mtimes of the files under ``root/top``, depth first, without listing it all."""
+    for directory, dirnames, filenames in os.walk(os.path.join(root, top)):
+        dirnames.sort()
+        for filename in sorted(filenames):
+            path = os.path.join(directory, filename)
+            try:
+                mtime = os.stat(path).st_mtime
+            except FileNotFoundError:
+                continue
+            yield os.path.relpath(path, root).replace(os.sep, '/'), mtime
+
+
+def sweep_files(cutoff, batch_size=BATCH_SIZE, dry_run=False):
+    """Delete files under the upload and rendition directories that nothing references; returns ``(count, bytes)``."""
+    storage = blob_storage()
+    root = storage.location
+    cutoff = cutoff.timestamp()
+    deleted = freed = 0
+    for top in upload_dirs():
+        old_files = ((name, mtime) for name, mtime in _walk(root, top) if mtime < cutoff)
+        for batch in _batches(old_files, batch_size):
+            names = [name for name, mtime in batch]
+            live = set(MediaBlob.objects.filter(name__in=names).values_list('name', flat=True))
+            live |= set(_referenced(names)) | _held_by_uploads(names)
+            for name in names:
+                if name not in live:
+                    deleted, freed = deleted + 1, freed + storage.size(name)
+                    if not dry_run:
+                        storage.delete(name)
+    renditions_root = os.path.join(default_storage.location, RENDITIONS_DIR)
+    if os.path.isdir(renditions_root):
+        folders = (entry for entry in os.scandir(renditions_root) if entry.is_dir() and entry.name.isdigit())
+        for batch in _batches(folders, batch_size):
+            existing = set(Contribution.objects.filter(pk__in=[int(entry.name) for entry in batch]).values_list('pk', flat=True))
+            for entry in batch:
+                if int(entry.name) in existing or entry.stat().st_mtime >= cutoff:
+                    continue
+                files = [os.path.join(entry.path, filename) for filename in os.listdir(entry.path)]
+                deleted += len(files)
+                freed += sum(os.path.getsize(path) for path in files)
+                if not dry_run:
+                    shutil.rmtree(entry.path, ignore_errors=True)
+    return deleted, freed
+
+
+def collect(grace=GRACE, batch_size=BATCH_SIZE, dry_run=False):
+    """Run all three phases; returns a dict of what was found or reclaimed."""
+    cutoff = timezone.now() - grace
+    checked, fixed = recount(batch_size, dry_run)
+    blobs, blob_bytes = sweep_blobs(cutoff, batch_size, dry_run)
+    files, file_bytes = sweep_files(cutoff, batch_size, dry_run)
+    return {
+        'checked': checked, 'fixed': fixed,
+        'blobs': blobs, 'files': files, 'bytes': blob_bytes + file_bytes,
+    }
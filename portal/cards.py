@@ -0,0 +1,149 @@
+# portal/cards.py
+"""
+Cached contribution cards.
+
+The viewer-independent part of each card (header, text, media tags, comment
+preview and form) is rendered once and kept in the cache under a key per
+card template and contribution. The per-viewer parts, i.e. the follow
+button, the like heart with its count and the CSRF field, are left as
+``<!--viewer:...-->`` slots in the cached HTML and filled in with plain
+string formatting on every request, so likes never invalidate a card.
+
+Cards are dropped from the cache when their contribution is edited or
+re-processed, when a comment is added or removed, and when the author's
+username or the state's name changes. Hits and misses are counted for the
+admin dashboard.
+"""
+from django.conf import settings
+from django.contrib.auth.models import AnonymousUser, User
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from django.middleware.csrf import get_token
+from django.template.loader import get_template
+from django.urls import reverse
+from django.utils.html import format_html
+from django.utils.safestring import mark_safe
+
+from .models import Comment, Contribution, State
+
+CACHE_SECONDS = getattr(settings, 'CARD_CACHE_SECONDS', 6 * 60 * 60)
+# Bump when a card template changes so stale fragments are never served
+VERSION = 1
+VARIANTS = {
+    'feed': 'partials/contribution_card.html',
+    'profile': 'partials/profile_card.html',
+}
+FOLLOW_SLOT = '<!--viewer:follow-->'
+LIKE_SLOT = '<!--viewer:like-->'
+CSRF_SLOT = '<!--viewer:csrf-->'
+HITS_KEY = 'cards:hits'
+MISSES_KEY = 'cards:misses'
+
+
+def _key(variant, contribution_id):
+    return f'card:{VERSION}:{variant}:{contribution_id}'
+
+
+def _personalize(html, item, user, csrf_field):
+    if FOLLOW_SLOT in html:
+        follow = ''
+        if user.is_authenticated and item.author_id != user.pk:
+            follow = format_html(
+                '<a href="{}" class="btn-primary text-sm">{}</a>',
+                reverse('follow_user', args=[item.author_id]),
+                'Unfollow' if getattr(item, 'viewer_follows_author', False) else 'Follow',
+            )
+        html = html.replace(FOLLOW_SLOT, follow)
+    if LIKE_SLOT in html:
+        html = html.replace(LIKE_SLOT, format_html(
+            '<button onclick="likePost({})" class="like-btn-{} text-2xl">{}</button>\n'
+            '        <span id="likes-count-{}" class="font-bold">{} likes</span>',
+            item.pk, item.pk, '❤️' if getattr(item, 'viewer_has_liked', False) else '🤍', item.pk, item.likes_count,
+        ))
+    return html.replace(CSRF_SLOT, csrf_field)
+
+
+def render(items, variant='feed', request=None):
+    """HTML for ``items``' cards, rendering and caching only the ones not cached yet."""
+    items = list(items)
+    if not items:
+        return ''
+    keys = {item.pk: _key(variant, item.pk) for item in items}
+    cached = cache.get_many(keys.values())
+    template = get_template(VARIANTS[variant])
+    user = getattr(request, 'user', None) or AnonymousUser()
+    csrf_field = format_html('<input type="hidden" name="csrfmiddlewaretoken" value="{}">', get_token(request)) if request else ''
+    fresh, parts = {}, []
+    for item in items:
+        html = cached.get(keys[item.pk])
+        if html is None:
+            html = fresh[keys[item.pk]] = template.render({'item': item})
+        parts.append(_personalize(html, item, user, csrf_field))
+    if fresh:
+        cache.set_many(fresh, CACHE_SECONDS)
+    _count(HITS_KEY, len(items) - len(fresh))
+    _count(MISSES_KEY, len(fresh))
+    return mark_safe(''.join(parts))
+
+
+def invalidate(contribution_ids):
+    cache.delete_many([_key(variant, pk) for pk in contribution_ids for variant in VARIANTS])
+
+
+# --- Metrics ---
+
+def _count(key, amount):
+    if not amount:
+        return
+    if not cache.add(key, amount, None):
+        try:
+            cache.incr(key, amount)
+        except ValueError:
+            cache.set(key, amount, None)
+
+
+def stats():
+    counts = cache.get_many([HITS_KEY, MISSES_KEY])
+    hits, misses = counts.get(HITS_KEY, 0), counts.get(MISSES_KEY, 0)
+    total = hits + misses
+    return {'hits': hits, 'misses': misses, 'hit_rate': hits / total if total else None}
+
+
+def reset_stats():
+    cache.delete_many([HITS_KEY, MISSES_KEY])
+
+
+# --- Invalidation ---
+
+def _invalidate_on_commit(contribution_ids):
+    contribution_ids = list(contribution_ids)
+    invalidate(contribution_ids)
+    # Again after commit, in case a concurrent render cached the old card in between
+    transaction.on_commit(lambda: invalidate(contribution_ids))
+
+
+@receiver(post_save, sender=Contribution, dispatch_uid='cards-contribution-saved')
+def contribution_saved(sender, instance, created=False, **kwargs):
+    if not created:
+        _invalidate_on_commit([instance.pk])
+
+
+@receiver(post_save, sender=Comment, dispatch_uid='cards-comment-saved')
+@receiver(post_delete, sender=Comment, dispatch_uid='cards-comment-deleted')
+def comment_changed(sender, instance, **kwargs):
+    _invalidate_on_commit([instance.contribution_id])
+
+
+@receiver(post_save, sender=State, dispatch_uid='cards-state-saved')
+def state_saved(sender, instance, created=False, raw=False, **kwargs):
+    if not created and not raw:
+        _invalidate_on_commit(Contribution.objects.filter(state=instance).values_list('id', flat=True))
+
+
+@receiver(post_save, sender=User, dispatch_uid='cards-author-saved')
+def author_saved(sender, instance, created=False, raw=False, update_fields=None, **kwargs):
+    if created or raw or (update_fields is not None and 'username' not in update_fields):
+        return
+    _invalidate_on_commit(Contribution.objects.filter(author=instance).values_list('id', flat=True))
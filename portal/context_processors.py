@@ -0,0 +1,9 @@
+# portal/context_processors.py
+from . import notifications as notification_service
+
+
+def notifications(request):
+    user = getattr(request, 'user', None)
+    if user is None or not user.is_authenticated:
+        return {}
+    return {'unread_notifications_count': notification_service.unread_count(user.pk)}
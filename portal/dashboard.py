@@ -0,0 +1,60 @@
+# portal/dashboard.py
+"""Aggregate statistics for the admin dashboard, cached for a short TTL."""
+from datetime import timedelta
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db.models import Count, Q
+from django.utils import timezone
+
+from .models import Comment, Contribution, State, UserProfile
+
+STATS_CACHE_KEY = 'admin-dashboard-stats'
+STATS_CACHE_SECONDS = getattr(settings, 'ADMIN_DASHBOARD_CACHE_SECONDS', 60)
+ACTIVE_USER_WINDOW_MINUTES = getattr(settings, 'ACTIVE_USER_WINDOW_MINUTES', 15)
+ACTIVITY_WINDOWS = (
+    ('day', 'Last 24 hours', timedelta(days=1)),
+    ('week', 'Last 7 days', timedelta(days=7)),
+    ('month', 'Last 30 days', timedelta(days=30)),
+)
+
+
+def _windowed_counts(queryset, field, now):
+    aggregates = {
+        key: Count('pk', filter=Q(**{f'{field}__gte': now - delta}))
+        for key, label, delta in ACTIVITY_WINDOWS
+    }
+    return queryset.aggregate(**aggregates)
+
+
+def compute_stats():
+    now = timezone.now()
+    categories = dict(Contribution.CATEGORY_CHOICES)
+    category_counts = Contribution.objects.order_by().values('category').annotate(n=Count('pk'))
+    posts = _windowed_counts(Contribution.objects.all(), 'submitted_at', now)
+    comments = _windowed_counts(Comment.objects.all(), 'created_at', now)
+    signups = _windowed_counts(User.objects.all(), 'date_joined', now)
+    return {
+        'total_users': User.objects.count(),
+        'active_users': UserProfile.objects.filter(last_seen__gte=now - timedelta(minutes=ACTIVE_USER_WINDOW_MINUTES)).count(),
+        'active_window_minutes': ACTIVE_USER_WINDOW_MINUTES,
+        'total_contributions': Contribution.objects.count(),
+        'states': list(
+            State.objects.annotate(contribution_count=Count('contribution')).order_by('name')
+            .values('id', 'name', 'contribution_count')
+        ),
+        'categories': [
+            {'category': categories.get(row['category'], row['category']), 'count': row['n']}
+            for row in category_counts
+        ],
+        'activity': [
+            {'window': label, 'contributions': posts[key], 'comments': comments[key], 'signups': signups[key]}
+            for key, label, delta in ACTIVITY_WINDOWS
+        ],
+        'computed_at': now,
+    }
+
+
+def get_stats():
+    return cache.get_or_set(STATS_CACHE_KEY, compute_stats, STATS_CACHE_SECONDS)
@@ -0,0 +1,150 @@
+# portal/database.py
+"""
+Database connection setup and read-replica routing.
+
+SQLite keeps most tuning per connection, so under the ``sqlite`` profile in
+settings every new connection runs the PRAGMAs in ``SQLITE_PRAGMAS``: WAL
+lets readers carry on while one writer commits, ``synchronous=NORMAL`` is
+durable across application crashes in WAL mode while skipping an fsync per
+commit, and the busy timeout makes a second writer wait for the lock instead
+of failing with ``database is locked``. With ``CONN_MAX_AGE`` set this runs
+once per worker thread, not once per request.
+
+When ``DATABASE_REPLICAS`` names replica aliases, ``ReplicaRouter`` sends
+reads to a healthy replica and every write to the primary. A request that
+writes is pinned to the primary for the rest of the request, and
+``ReplicaPinningMiddleware`` keeps that browser on the primary for
+``DATABASE_REPLICA_STICKY_SECONDS`` afterwards so it reads its own writes
+while replicas catch up. Replicas are health-checked at most every
+``DATABASE_REPLICA_HEALTH_CHECK_SECONDS``; when none is usable reads fall
+back to the primary.
+"""
+import random
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, DatabaseError, connections
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+
+PRAGMAS = getattr(settings, 'SQLITE_PRAGMAS', {})
+REPLICAS = getattr(settings, 'DATABASE_REPLICAS', [])
+STICKY_SECONDS = getattr(settings, 'DATABASE_REPLICA_STICKY_SECONDS', 15)
+HEALTH_CHECK_SECONDS = getattr(settings, 'DATABASE_REPLICA_HEALTH_CHECK_SECONDS', 10)
+PIN_COOKIE = 'db_primary'
+
+
+@receiver(connection_created, dispatch_uid='database-sqlite-pragmas')
+def configure_connection(sender, connection, **kwargs):
+    if connection.vendor != 'sqlite' or not PRAGMAS:
+        return
+    with connection.cursor() as cursor:
+        for name, value in PRAGMAS.items():
+            cursor.execute(f'PRAGMA {name} = {value}')
+
+
+def describe(alias=DEFAULT_DB_ALIAS):
+    """The settings that matter for throughput on ``alias``, for benchmark reports and the dashboard."""
+    connection = connections[alias]
+    info = {
+        'profile': getattr(settings, 'DB_PROFILE', 'development'),
+        'vendor': connection.vendor,
+        'conn_max_age': connection.settings_dict['CONN_MAX_AGE'],
+        'pool': bool(connection.settings_dict['OPTIONS'].get('pool')),
+        'replicas': len(REPLICAS),
+    }
+    if connection.vendor == 'sqlite':
+        with connection.cursor() as cursor:
+            for name in ('journal_mode', 'synchronous', 'busy_timeout'):
+                cursor.execute(f'PRAGMA {name}')
+                info[name] = cursor.fetchone()[0]
+    return info
+
+
+# --- Replica routing ---
+
+class _Routing:
+    def __init__(self, pinned):
+        self.pinned = pinned
+        self.wrote = False
+
+
+_routing = ContextVar('database_routing', default=None)
+
+
+@contextmanager
+def routing(pinned=False):
+    """Track writes for the block; reads go to the primary once pinned or after the first write."""
+    state = _Routing(pinned)
+    token = _routing.set(state)
+    try:
+        yield state
+    finally:
+        _routing.reset(token)
+
+
+def primary():
+    """Send every read in the block to the primary, e.g. in background jobs acting on fresh rows."""
+    return routing(pinned=True)
+
+
+_health = {}
+_health_lock = threading.Lock()
+
+
+def _check(alias):
+    try:
+        with connections[alias].cursor() as cursor:
+            # A table rather than SELECT 1, so an empty or half-copied replica counts as down
+            cursor.execute('SELECT 1 FROM django_migrations LIMIT 1')
+        return True
+    except DatabaseError:
+        return False
+
+
+def healthy_replicas():
+    now = time.monotonic()
+    healthy = []
+    for alias in REPLICAS:
+        with _health_lock:
+            ok, checked_at = _health.get(alias, (None, None))
+        if checked_at is None or now - checked_at >= HEALTH_CHECK_SECONDS:
+            ok = _check(alias)
+            with _health_lock:
+                _health[alias] = (ok, now)
+        if ok:
+            healthy.append(alias)
+    return healthy
+
+
+def reset_health():
+    with _health_lock:
+        _health.clear()
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        state = _routing.get()
+        if state is not None and state.pinned:
+            return DEFAULT_DB_ALIAS
+        # Reads inside a transaction must see its uncommitted writes
+        if connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return DEFAULT_DB_ALIAS
+        replicas = healthy_replicas()
+        return random.choice(replicas) if replicas else DEFAULT_DB_ALIAS
+
+    def db_for_write(self, model, **hints):
+        state = _routing.get()
+        if state is not None:
+            state.pinned = state.wrote = True
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Every alias holds the same data
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db == DEFAULT_DB_ALIAS
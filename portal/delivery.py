@@ -0,0 +1,230 @@
+# portal/delivery.py
+"""
+Production media serving.
+
+``serve_media`` answers conditional requests (``If-None-Match`` /
+``If-Modified-Since``) with 304s and byte ranges with 206s, so seeking a
+``<video>`` only fetches what is played. Whole files go out through
+``FileResponse``, which the WSGI server can hand to ``os.sendfile``. URLs
+produced by ``HashedURLFileSystemStorage`` embed the file's content hash
+and are served with a year-long ``immutable`` ``Cache-Control``.
+
+With ``MEDIA_OFFLOAD`` set to ``'x-accel-redirect'`` (nginx) or
+``'x-sendfile'`` (Apache/lighttpd) Django only checks the path and the
+front proxy streams the bytes.
+
+``serve_static`` does the same for collected static files when no front
+proxy serves ``STATIC_ROOT``, picking a precompressed variant by
+``Accept-Encoding``.
+"""
+import mimetypes
+import os
+import posixpath
+import re
+from functools import lru_cache
+
+from django.conf import settings
+from django.contrib.staticfiles.storage import staticfiles_storage
+from django.core.exceptions import SuspiciousFileOperation
+from django.http import FileResponse, Http404, HttpResponse, HttpResponseNotModified
+from django.utils._os import safe_join
+from django.utils.http import http_date, parse_http_date_safe, quote_etag
+
+from .storage import BLOB_NAME_RE, HASH_LENGTH, file_digest, unhash_name
+
+OFFLOAD = getattr(settings, 'MEDIA_OFFLOAD', None)
+ACCEL_PREFIX = getattr(settings, 'MEDIA_ACCEL_PREFIX', '/protected-media/')
+IMMUTABLE_MAX_AGE = 365 * 24 * 60 * 60
+DEFAULT_MAX_AGE = getattr(settings, 'MEDIA_DEFAULT_MAX_AGE', 60 * 60)
+STREAM_BLOCK = 256 * 1024
+# Precompressed static variants, most preferred first
+STATIC_ENCODINGS = (('.br', 'br'), ('.gz', 'gzip'))
+
+RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+
+@lru_cache(maxsize=4096)
+def _digest_of_version(fullpath, size, mtime_ns):
+    return file_digest(fullpath)
+
+
+def _etag(stat):
+    return quote_etag(f'{stat.st_size:x}-{stat.st_mtime_ns:x}')
+
+
+def etag_matches(header, etag):
+    if not header:
+        return False
+    if header.strip() == '*':
+        return True
+    candidates = [tag.strip().removeprefix('W/') for tag in header.split(',')]
+    return etag in candidates
+
+
+def parse_range(header, size):
+    """Return ``(start, end)`` (inclusive) for a single byte range, or None to send the whole file."""
+    match = RANGE_RE.match(header.replace(' ', '')) if header else None
+    if not match:
+        return None
+    first, last = match.groups()
+    if not first and not last:
+        return None
+    if not first:
+        length = int(last)
+        if length == 0:
+            raise ValueError('Empty suffix range')
+        return max(size - length, 0), size - 1
+    start = int(first)
+    end = min(int(last), size - 1) if last else size - 1
+    if start >= size or start > end:
+        raise ValueError('Unsatisfiable range')
+    return start, end
+
+
+class RangeFileWrapper:
+    def __init__(self, handle, start, length):
+        self.handle = handle
+        self.handle.seek(start)
+        self.remaining = length
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        if self.remaining <= 0:
+            raise StopIteration
+        block = self.handle.read(min(STREAM_BLOCK, self.remaining))
+        if not block:
+            raise StopIteration
+        self.remaining -= len(block)
+        return block
+
+    def close(self):
+        self.handle.close()
+
+
+def _cache_headers(response, stat, etag, immutable):
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(stat.st_mtime)
+    response['Accept-Ranges'] = 'bytes'
+    if immutable:
+        response['Cache-Control'] = f'public, max-age={IMMUTABLE_MAX_AGE}, immutable'
+    else:
+        response['Cache-Control'] = f'public, max-age={DEFAULT_MAX_AGE}'
+    return response
+
+
+def _serve_file(request, fullpath, stat, immutable, content_type, encoding=None, offload_name=None):
+    etag = _etag(stat)
+    if_none_match = request.META.get('HTTP_IF_NONE_MATCH')
+    if etag_matches(if_none_match, etag) or (
+        not if_none_match and (parse_http_date_safe(request.META.get('HTTP_IF_MODIFIED_SINCE') or '') or 0) >= int(stat.st_mtime)
+    ):
+        return _cache_headers(HttpResponseNotModified(), stat, etag, immutable)
+
+    if OFFLOAD and offload_name:
+        response = HttpResponse(content_type=content_type)
+        if OFFLOAD == 'x-accel-redirect':
+            response['X-Accel-Redirect'] = ACCEL_PREFIX + offload_name
+        else:
+            response['X-Sendfile'] = fullpath
+        return _cache_headers(response, stat, etag, immutable)
+
+    byte_range = None
+    if_range = request.META.get('HTTP_IF_RANGE')
+    if not if_range or if_range == etag or parse_http_date_safe(if_range) == int(stat.st_mtime):
+        try:
+            byte_range = parse_range(request.META.get('HTTP_RANGE'), stat.st_size)
+        except ValueError:
+            response = HttpResponse(status=416)
+            response['Content-Range'] = f'bytes */{stat.st_size}'
+            return response
+
+    handle = open(fullpath, 'rb')
+    if byte_range is None:
+        response = FileResponse(handle, content_type=content_type)
+    else:
+        start, end = byte_range
+        length = end - start + 1
+        response = FileResponse(RangeFileWrapper(handle, start, length), status=206, content_type=content_type)
+        response['Content-Length'] = str(length)
+        response['Content-Range'] = f'bytes {start}-{end}/{stat.st_size}'
+    if encoding:
+        response['Content-Encoding'] = encoding
+    return _cache_headers(response, stat, etag, immutable)
+
+
+def _stat_file(root, name):
+    try:
+        fullpath = safe_join(root, name)
+    except SuspiciousFileOperation:
+        raise Http404('Invalid path')
+    try:
+        stat = os.stat(fullpath)
+    except OSError:
+        raise Http404('File not found')
+    if not os.path.isfile(fullpath):
+        raise Http404('File not found')
+    return fullpath, stat
+
+
+def serve_media(request, path, document_root=None):
+    name, digest = unhash_name(posixpath.normpath(path).lstrip('/'))
+    fullpath, stat = _stat_file(document_root or settings.MEDIA_ROOT, name)
+    # A hashed URL is only immutable if it still names these exact bytes; content-addressed names always do
+    blob = BLOB_NAME_RE.search(name)
+    current = blob['digest'][:HASH_LENGTH] if blob else _digest_of_version(fullpath, stat.st_size, stat.st_mtime_ns)
+    immutable = digest is not None and digest == current
+    content_type, encoding = mimetypes.guess_type(fullpath)
+    return _serve_file(
+        request, fullpath, stat, immutable, content_type or 'application/octet-stream', encoding, offload_name=name,
+    )
+
+
+# --- Static files ---
+
+_hashed_static = (None, frozenset())
+
+
+def _hashed_static_names():
+    """Names ``collectstatic`` wrote under a content hash, computed once per loaded manifest."""
+    global _hashed_static
+    manifest_hash, names = _hashed_static
+    if manifest_hash != getattr(staticfiles_storage, 'manifest_hash', None):
+        _hashed_static = (staticfiles_storage.manifest_hash, frozenset(staticfiles_storage.hashed_files.values()))
+    return _hashed_static[1]
+
+
+def accepted_encodings(request):
+    header = request.META.get('HTTP_ACCEPT_ENCODING', '')
+    accepted = set()
+    for part in header.split(','):
+        coding, _, params = part.strip().partition(';')
+        if params.replace(' ', '') not in ('q=0', 'q=0.0', 'q=0.00', 'q=0.000'):
+            accepted.add(coding.strip().lower())
+    return accepted
+
+
+def serve_static(request, path, document_root=None):
+    """
+    Collected static files from ``STATIC_ROOT``. Content-hashed names (see
+    ``CompressedManifestStaticFilesStorage``) get a year-long ``immutable``
+    ``Cache-Control``, and the ``.br``/``.gz`` sibling written at collect time
+    is sent to clients that accept it.
+    """
+    name = posixpath.normpath(path).lstrip('/')
+    root = document_root or settings.STATIC_ROOT
+    fullpath, stat = _stat_file(root, name)
+    content_type, _ = mimetypes.guess_type(fullpath)
+    accepted = accepted_encodings(request)
+    encoding = None
+    for suffix, coding in STATIC_ENCODINGS:
+        if coding in accepted and os.path.isfile(fullpath + suffix):
+            fullpath, stat = _stat_file(root, name + suffix)
+            encoding = coding
+            break
+    response = _serve_file(
+        request, fullpath, stat, name in _hashed_static_names(), content_type or 'application/octet-stream', encoding,
+    )
+    response['Vary'] = 'Accept-Encoding'
+    return response
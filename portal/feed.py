@@ -0,0 +1,244 @@
+# portal/feed.py
+"""
+Keyset-paginated feed pages for the home and explore views.
+
+A page is fetched with a fixed number of queries no matter how many posts it
+holds: one for the contributions (with authors and states joined in), one
+for the viewer's likes and one for a bounded preview of the latest comments
+on each post. Follows are checked against the viewer's cached follow set
+from ``portal.graph``.
+
+Ranked feeds (``trending``, ``week``, ``state-<id>``, ``category-<code>``)
+are pages of the precomputed lists in ``portal.ranking``; their cursor is an
+offset into the list.
+
+The ``a``-prefixed functions are the same queries through the async ORM for
+the async views; the per-viewer queries of a page run concurrently.
+"""
+import asyncio
+from dataclasses import dataclass
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db.models import F, Window
+from django.db.models.functions import RowNumber
+
+from . import graph, ranking, timeline
+from .models import Comment, Contribution
+from .pagination import after_cursor, clamp_page_size, split_page
+
+COMMENT_PREVIEW_SIZE = getattr(settings, 'FEED_COMMENT_PREVIEW_SIZE', 3)
+
+
+@dataclass
+class FeedPage:
+    items: list
+    next_cursor: str = None
+
+    @property
+    def has_more(self):
+        return self.next_cursor is not None
+
+
+# --- Queries ---
+
+def with_card_data(queryset):
+    """Join in everything a contribution card needs besides per-viewer state."""
+    return queryset.select_related('author', 'state')
+
+
+def _page_queryset(queryset, cursor, page_size):
+    queryset = after_cursor(queryset, cursor).order_by('-submitted_at', '-id')
+    return with_card_data(queryset)[:page_size + 1]
+
+
+def _split(items, page_size):
+    return split_page(items, page_size, key=lambda item: (item.submitted_at, item.pk))
+
+
+def paginate(queryset, cursor=None, page_size=None):
+    """Return one keyset page of ``queryset`` as ``(items, next_cursor)``."""
+    page_size = clamp_page_size(page_size)
+    return _split(list(_page_queryset(queryset, cursor, page_size)), page_size)
+
+
+def _previews_queryset(contribution_ids, size):
+    if not contribution_ids or size <= 0:
+        return None
+    return (
+        Comment.objects.filter(contribution_id__in=contribution_ids)
+        .select_related('author')
+        .annotate(position=Window(
+            RowNumber(),
+            partition_by=F('contribution_id'),
+            order_by=(F('created_at').desc(), F('id').desc()),
+        ))
+        .filter(position__lte=size)
+    )
+
+
+def _group_previews(contribution_ids, comments):
+    previews = {pk: [] for pk in contribution_ids}
+    for comment in comments:
+        previews[comment.contribution_id].append(comment)
+    for comments in previews.values():
+        comments.sort(key=lambda c: (c.created_at, c.id))
+    return previews
+
+
+def comment_previews(contribution_ids, size=COMMENT_PREVIEW_SIZE):
+    """Latest ``size`` comments per contribution, oldest first, in one query."""
+    queryset = _previews_queryset(contribution_ids, size)
+    return _group_previews(contribution_ids, queryset if queryset is not None else [])
+
+
+def _liked_queryset(viewer, contribution_ids):
+    if not viewer.is_authenticated or not contribution_ids:
+        return None
+    return (
+        Contribution.likes.through.objects
+        .filter(user_id=viewer.pk, contribution_id__in=contribution_ids)
+        .values_list('contribution_id', flat=True)
+    )
+
+
+def liked_ids(viewer, contribution_ids):
+    queryset = _liked_queryset(viewer, contribution_ids)
+    return set(queryset) if queryset is not None else set()
+
+
+def followed_author_ids(viewer, author_ids):
+    if not viewer.is_authenticated:
+        return set()
+    return graph.followed_among(viewer.pk, author_ids)
+
+
+async def afollowed_author_ids(viewer, author_ids):
+    if not viewer.is_authenticated:
+        return set()
+    return await graph.afollowed_among(viewer.pk, author_ids)
+
+
+def _attach(items, liked, followed, previews):
+    for item in items:
+        item.viewer_has_liked = item.pk in liked
+        item.viewer_follows_author = item.author_id in followed
+        item.comment_preview = previews[item.pk]
+    return items
+
+
+def hydrate(items, viewer):
+    """Attach the viewer's liked/follow state and comment previews to ``items``."""
+    ids = [item.pk for item in items]
+    liked = liked_ids(viewer, ids)
+    followed = followed_author_ids(viewer, {item.author_id for item in items})
+    previews = comment_previews(ids)
+    return _attach(items, liked, followed, previews)
+
+
+def get_page(queryset, viewer, cursor=None, page_size=None):
+    items, next_cursor = paginate(queryset, cursor, page_size)
+    return FeedPage(items=hydrate(items, viewer), next_cursor=next_cursor)
+
+
+# --- Feed sources ---
+
+def explore_page(viewer, cursor=None, page_size=None):
+    return get_page(Contribution.objects.all(), viewer, cursor, page_size)
+
+
+def in_display_order(ids):
+    """Contributions ``ids`` with their card data, in the order given; missing ids are skipped."""
+    items = with_card_data(Contribution.objects.filter(pk__in=ids)).in_bulk(ids)
+    return [items[pk] for pk in ids if pk in items]
+
+
+def page_from_ids(ids, viewer, next_cursor):
+    """Build a page from contribution ids that are already in display order."""
+    return FeedPage(items=hydrate(in_display_order(ids), viewer), next_cursor=next_cursor)
+
+
+def home_page(viewer, cursor=None, page_size=None):
+    """The viewer's precomputed timeline, see ``portal.timeline``."""
+    ids, next_cursor = timeline.page_ids(viewer, cursor, page_size)
+    return page_from_ids(ids, viewer, next_cursor)
+
+
+def ranked_page(name, viewer, cursor=None, page_size=None):
+    ids, next_cursor = ranking.page_ids(name, cursor, page_size)
+    return page_from_ids(ids, viewer, next_cursor)
+
+
+FEEDS = {
+    'home': home_page,
+    'explore': explore_page,
+}
+
+
+def is_feed(name):
+    return name in FEEDS or ranking.is_list(name)
+
+
+def get_feed(name, viewer, cursor=None, page_size=None):
+    if name in FEEDS:
+        return FEEDS[name](viewer, cursor, page_size)
+    return ranked_page(name, viewer, cursor, page_size)
+
+
+# --- Async variants ---
+
+async def _alist(queryset):
+    return [] if queryset is None else [row async for row in queryset]
+
+
+async def apaginate(queryset, cursor=None, page_size=None):
+    page_size = clamp_page_size(page_size)
+    return _split(await _alist(_page_queryset(queryset, cursor, page_size)), page_size)
+
+
+async def ahydrate(items, viewer):
+    ids = [item.pk for item in items]
+    liked, followed, comments = await asyncio.gather(
+        _alist(_liked_queryset(viewer, ids)),
+        afollowed_author_ids(viewer, {item.author_id for item in items}),
+        _alist(_previews_queryset(ids, COMMENT_PREVIEW_SIZE)),
+    )
+    return _attach(items, set(liked), followed, _group_previews(ids, comments))
+
+
+async def aget_page(queryset, viewer, cursor=None, page_size=None):
+    items, next_cursor = await apaginate(queryset, cursor, page_size)
+    return FeedPage(items=await ahydrate(items, viewer), next_cursor=next_cursor)
+
+
+async def aexplore_page(viewer, cursor=None, page_size=None):
+    return await aget_page(Contribution.objects.all(), viewer, cursor, page_size)
+
+
+async def apage_from_ids(ids, viewer, next_cursor):
+    items = await with_card_data(Contribution.objects.filter(pk__in=ids)).ain_bulk(ids)
+    items = [items[pk] for pk in ids if pk in items]
+    return FeedPage(items=await ahydrate(items, viewer), next_cursor=next_cursor)
+
+
+async def ahome_page(viewer, cursor=None, page_size=None):
+    ids, next_cursor = await timeline.apage_ids(viewer, cursor, page_size)
+    return await apage_from_ids(ids, viewer, next_cursor)
+
+
+async def aranked_page(name, viewer, cursor=None, page_size=None):
+    # A cache hit normally, but a missing list is rebuilt with a (sync) query
+    ids, next_cursor = await sync_to_async(ranking.page_ids)(name, cursor, page_size)
+    return await apage_from_ids(ids, viewer, next_cursor)
+
+
+AFEEDS = {
+    'home': ahome_page,
+    'explore': aexplore_page,
+}
+
+
+async def aget_feed(name, viewer, cursor=None, page_size=None):
+    if name in AFEEDS:
+        return await AFEEDS[name](viewer, cursor, page_size)
+    return await aranked_page(name, viewer, cursor, page_size)
@@ -4,7 +4,10 @@ from django import forms
 from django.core.exceptions import ValidationError
 from django.contrib.auth.forms import UserCreationForm, AuthenticationForm
 from django.contrib.auth.models import User
-from .models import Contribution, UserProfile
+from django.core.files.uploadedfile import UploadedFile
+from django.db import transaction
+from .models import CategorySubscription, Contribution, UploadSession, UserProfile
+from . import timeline, uploads
 
 # The form for submitting cultural content
 class ContributionForm(forms.ModelForm):
@@ -15,6 +18,11 @@ class ContributionForm(forms.ModelForm):
         label='వివరణ (Description)'
     )
 
+    # Ids of finished chunked uploads (see portal.uploads), used instead of a file field
+    image_upload = forms.UUIDField(required=False, widget=forms.HiddenInput)
+    audio_upload = forms.UUIDField(required=False, widget=forms.HiddenInput)
+    video_upload = forms.UUIDField(required=False, widget=forms.HiddenInput)
+
     class Meta:
         model = Contribution
         fields = ['state', 'category', 'text_content', 'image_content', 'audio_content', 'video_content']
@@ -26,6 +34,57 @@ class ContributionForm(forms.ModelForm):
             'video_content': 'వీడియో (Video)',
         }
 
+    def __init__(self, *args, user=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.user = user
+        self.uploads = {}
+
+    def clean(self):
+        cleaned_data = super().clean()
+        for kind in ('image', 'audio', 'video'):
+            upload = cleaned_data.get(f'{kind}_content')
+            if isinstance(upload, UploadedFile):
+                # Same check as chunked uploads: the bytes decide the type and the stored extension
+                try:
+                    content_type, extension = uploads.detect(kind, upload)
+                except uploads.UploadError as exc:
+                    self.add_error(f'{kind}_content', str(exc))
+                else:
+                    upload.name = uploads.stored_filename(upload.name, extension)
+                    upload.content_type = content_type
+            upload_id = cleaned_data.get(f'{kind}_upload')
+            if not upload_id:
+                continue
+            if cleaned_data.get(f'{kind}_content'):
+                self.add_error(f'{kind}_upload', f'Choose either a direct or a chunked {kind} upload, not both.')
+                continue
+            session = UploadSession.objects.filter(
+                id=upload_id, user=self.user, kind=kind, status=UploadSession.COMPLETE,
+            ).first()
+            if session is None:
+                self.add_error(f'{kind}_upload', f'That {kind} upload was not found or is not finished.')
+            else:
+                self.uploads[kind] = session
+        return cleaned_data
+
+    def save(self, commit=True):
+        contribution = super().save(commit=False)
+        for kind, session in self.uploads.items():
+            getattr(contribution, f'{kind}_content').name = session.stored_name
+        if commit:
+            with transaction.atomic():
+                contribution.save()
+                self._save_m2m()
+        return contribution
+
+    def _save_m2m(self):
+        super()._save_m2m()
+        # Only once the contribution is saved; until then the uploads can still be used elsewhere
+        if self.uploads:
+            UploadSession.objects.filter(
+                id__in=[s.id for s in self.uploads.values()], status=UploadSession.COMPLETE,
+            ).update(status=UploadSession.ATTACHED)
+
 # --- (The rest of the file remains the same) ---
 
 # Custom Registration Form
@@ -58,14 +117,20 @@ class ProfileEditForm(forms.ModelForm):
 
     class Meta:
         model = UserProfile
-        fields = ['followed_categories']
+        fields = []
 
-    def save(self, commit=True):
-        profile = super().save(commit=False)
-        profile.followed_categories = ",".join(self.cleaned_data.get('followed_categories', []))
-        if commit:
-            profile.save()
-        return profile
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.initial.setdefault(
+            'followed_categories', list(CategorySubscription.objects.categories_for(self.instance.user_id)),
+        )
+
+    def _save_m2m(self):
+        super()._save_m2m()
+        user_id = self.instance.user_id
+        added, removed = CategorySubscription.objects.set_for(user_id, self.cleaned_data.get('followed_categories', []))
+        timeline.add_categories(user_id, added)
+        timeline.remove_categories(user_id, removed)
 
 # Custom Login Form with "Remember Me"
 class CustomAuthenticationForm(AuthenticationForm):
@@ -0,0 +1,211 @@
+# portal/graph.py
+"""
+The follow graph.
+
+Each user's following and follower ids are cached as sorted arrays of user
+ids, so "does A follow B" is a binary search over a list already in memory
+and a feed page checks all of its authors against one cached value instead
+of loading ``userprofile.follows.all()``. ``UserProfile.followers_count`` and
+``following_count`` are kept in step with the ``follows`` table.
+
+``toggle_follow`` and any change through the ``UserProfile.follows``
+managers (forms, the admin) recount both sides and drop their cached arrays.
+Bulk inserts into the through table skip the ``m2m_changed`` signal; run
+``reconcile_counters`` afterwards and let the arrays expire.
+
+``compute_follow_suggestions`` runs in the background (e.g. nightly) and
+caches "people you may know" for active users: accounts followed by the
+people they follow, ranked by how many of those people follow them.
+"""
+from array import array
+from bisect import bisect_left
+from collections import Counter
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+from django.db.models.signals import m2m_changed
+from django.dispatch import receiver
+
+from . import auth
+from .models import UserProfile
+
+CACHE_SECONDS = getattr(settings, 'GRAPH_CACHE_SECONDS', 60 * 60)
+SUGGESTIONS = getattr(settings, 'GRAPH_SUGGESTIONS', 20)
+SUGGESTIONS_CACHE_SECONDS = getattr(settings, 'GRAPH_SUGGESTIONS_CACHE_SECONDS', 2 * 24 * 60 * 60)
+# Only this many of a user's follows are walked for suggestions, so accounts following thousands stay cheap
+SUGGESTION_FANOUT = getattr(settings, 'GRAPH_SUGGESTION_FANOUT', 500)
+
+Follow = UserProfile.follows.through
+
+
+# --- Adjacency ---
+
+def _key(kind, user_id):
+    return f'graph:{kind}:{user_id}'
+
+
+def _following_queryset(user_id):
+    return Follow.objects.filter(from_userprofile__user_id=user_id).values_list('to_userprofile__user_id', flat=True)
+
+
+def _followers_queryset(user_id):
+    return Follow.objects.filter(to_userprofile__user_id=user_id).values_list('from_userprofile__user_id', flat=True)
+
+
+QUERYSETS = {'following': _following_queryset, 'followers': _followers_queryset}
+
+
+def _pack(ids):
+    return array('q', sorted(ids))
+
+
+def _ids(kind, user_id):
+    key = _key(kind, user_id)
+    ids = cache.get(key)
+    if ids is None:
+        ids = _pack(QUERYSETS[kind](user_id))
+        cache.set(key, ids, CACHE_SECONDS)
+    return ids
+
+
+async def _aids(kind, user_id):
+    key = _key(kind, user_id)
+    ids = await cache.aget(key)
+    if ids is None:
+        ids = _pack([pk async for pk in QUERYSETS[kind](user_id)])
+        await cache.aset(key, ids, CACHE_SECONDS)
+    return ids
+
+
+def following_ids(user_id):
+    """Sorted ids of the users ``user_id`` follows."""
+    return _ids('following', user_id)
+
+
+def follower_ids(user_id):
+    """Sorted ids of the users following ``user_id``."""
+    return _ids('followers', user_id)
+
+
+def _contains(ids, pk):
+    index = bisect_left(ids, pk)
+    return index < len(ids) and ids[index] == pk
+
+
+def follows(user_id, target_id):
+    return _contains(following_ids(user_id), target_id)
+
+
+def followed_among(user_id, candidate_ids):
+    """The subset of ``candidate_ids`` that ``user_id`` follows, e.g. the authors on a feed page."""
+    if not candidate_ids:
+        return set()
+    ids = following_ids(user_id)
+    return {pk for pk in candidate_ids if _contains(ids, pk)}
+
+
+async def afollows(user_id, target_id):
+    return _contains(await _aids('following', user_id), target_id)
+
+
+async def afollowed_among(user_id, candidate_ids):
+    if not candidate_ids:
+        return set()
+    ids = await _aids('following', user_id)
+    return {pk for pk in candidate_ids if _contains(ids, pk)}
+
+
+# --- Writes ---
+
+def toggle_follow(user_id, target_id):
+    """Follow ``target_id`` or stop following it; returns whether ``user_id`` follows it now."""
+    profiles = dict(UserProfile.objects.filter(user_id__in=[user_id, target_id]).values_list('user_id', 'pk'))
+    for pk in {user_id, target_id} - profiles.keys():
+        profiles[pk] = UserProfile.objects.create(user_id=pk).pk
+    follower, followed = profiles[user_id], profiles[target_id]
+    # Like Contribution.toggle_like: try the unfollow first, so a double click can't follow twice
+    with transaction.atomic():
+        unfollowed, _ = Follow.objects.filter(from_userprofile_id=follower, to_userprofile_id=followed).delete()
+        if not unfollowed:
+            Follow.objects.bulk_create([Follow(from_userprofile_id=follower, to_userprofile_id=followed)], ignore_conflicts=True)
+        _recount({follower}, {followed})
+    _invalidate({user_id}, {target_id})
+    return not unfollowed
+
+
+def _count(field):
+    rows = Follow.objects.filter(**{field: OuterRef('pk')}).order_by().values(field).annotate(n=Count('*')).values('n')
+    return Coalesce(Subquery(rows), 0)
+
+
+def _recount(follower_profile_ids, followed_profile_ids):
+    UserProfile.objects.filter(pk__in=follower_profile_ids).update(following_count=_count('from_userprofile'))
+    UserProfile.objects.filter(pk__in=followed_profile_ids).update(followers_count=_count('to_userprofile'))
+
+
+def _invalidate(follower_ids, followed_ids):
+    keys = [_key('following', pk) for pk in follower_ids] + [_key('followers', pk) for pk in followed_ids]
+    cache.delete_many(keys)
+    # The cached users carry their profile's counts
+    auth.forget(*follower_ids, *followed_ids)
+    # Again after commit, in case a concurrent read cached the old rows in between
+    transaction.on_commit(lambda: cache.delete_many(keys))
+
+
+@receiver(m2m_changed, sender=Follow, dispatch_uid='graph-follows-changed')
+def follows_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    if action == 'pre_clear':
+        # pk_set is None for clears; remember the other side before the rows go
+        related = instance.followed_by if reverse else instance.follows
+        instance._graph_cleared = set(related.values_list('pk', flat=True))
+        return
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    others = instance.__dict__.pop('_graph_cleared', set()) if action == 'post_clear' else set(pk_set or ())
+    if not others:
+        return
+    followers, followed = (others, {instance.pk}) if reverse else ({instance.pk}, others)
+    _recount(followers, followed)
+    users = dict(UserProfile.objects.filter(pk__in=others | {instance.pk}).values_list('pk', 'user_id'))
+    _invalidate({users[pk] for pk in followers if pk in users}, {users[pk] for pk in followed if pk in users})
+
+
+# --- Suggestions ---
+
+def compute_suggestions(user_id, limit=SUGGESTIONS):
+    """
+    Accounts two hops away from ``user_id`` as ``[(user_id, mutual_count)]``,
+    best first; ties go to the account with more followers.
+    """
+    following = following_ids(user_id)
+    mutual = Counter()
+    for followed_id in following[:SUGGESTION_FANOUT]:
+        mutual.update(following_ids(followed_id))
+    mutual.pop(user_id, None)
+    for followed_id in following:
+        mutual.pop(followed_id, None)
+    if not mutual:
+        return []
+    # Rank a bounded shortlist so follower counts are only read for plausible picks
+    shortlist = dict(mutual.most_common(limit * 5))
+    popularity = dict(UserProfile.objects.filter(user_id__in=shortlist).values_list('user_id', 'followers_count'))
+    ranked = sorted(shortlist, key=lambda pk: (shortlist[pk], popularity.get(pk, 0), -pk), reverse=True)
+    return [(pk, shortlist[pk]) for pk in ranked[:limit]]
+
+
+def store_suggestions(user_id, limit=SUGGESTIONS):
+    suggestions = compute_suggestions(user_id, limit)
+    cache.set(_key('suggestions', user_id), suggestions, SUGGESTIONS_CACHE_SECONDS)
+    return suggestions
+
+
+def suggestions(user_id, limit=SUGGESTIONS):
+    """The precomputed suggestions for ``user_id``, minus anyone they followed since."""
+    stored = cache.get(_key('suggestions', user_id)) or []
+    if not stored:
+        return []
+    following = following_ids(user_id)
+    return [(pk, mutual) for pk, mutual in stored if not _contains(following, pk)][:limit]
@@ -0,0 +1,262 @@
+# portal/instrumentation.py
+"""
+Per-view request metrics collected by ``InstrumentationMiddleware``.
+
+For every request the middleware records wall time, database query count
+and time, template render time and response bytes, keyed by the resolved
+view name. Queries are also grouped by SQL signature (literals are already
+parameters; ``IN (...)`` lists are collapsed), and a signature repeated
+``INSTRUMENTATION_DUPLICATE_THRESHOLD`` times or more in one request is
+counted as a likely N+1. A fraction ``INSTRUMENTATION_PROFILE_RATE`` of
+requests also runs under cProfile, and the most recent profiles are kept.
+
+The current request's stats live in a ``ContextVar``, and every database
+connection gets a query recorder as it is opened, so queries that async
+views run in ``sync_to_async`` worker threads are counted against the
+request that made them.
+
+Metrics are held in memory per process: each worker reports its own
+numbers, which is what a Prometheus scrape per target expects.
+"""
+import cProfile
+import io
+import pstats
+import re
+import threading
+import time
+from collections import Counter, deque
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.template.backends.django import Template as DjangoTemplate
+
+ENABLED = getattr(settings, 'INSTRUMENTATION_ENABLED', False)
+PROFILE_RATE = getattr(settings, 'INSTRUMENTATION_PROFILE_RATE', 0.0)
+SAMPLE_SIZE = getattr(settings, 'INSTRUMENTATION_SAMPLE_SIZE', 1000)
+DUPLICATE_THRESHOLD = getattr(settings, 'INSTRUMENTATION_DUPLICATE_THRESHOLD', 3)
+PROFILES_KEPT = getattr(settings, 'INSTRUMENTATION_PROFILES_KEPT', 20)
+METRICS_TOKEN = getattr(settings, 'INSTRUMENTATION_METRICS_TOKEN', None)
+QUANTILES = (0.5, 0.9, 0.99)
+
+_IN_LIST = re.compile(r'IN \((?:%s, )*%s\)')
+
+_current = ContextVar('instrumentation_stats', default=None)
+
+
+def signature(sql):
+    return _IN_LIST.sub('IN (...)', sql)
+
+
+def percentile(sorted_values, quantile):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(round(quantile * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+# --- Per-request collection ---
+
+class RequestStats:
+    def __init__(self):
+        self.queries = 0
+        self.db_time = 0.0
+        self.template_time = 0.0
+        self.signatures = Counter()
+        self.template_depth = 0
+
+    def record_query(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.db_time += time.perf_counter() - start
+            self.queries += 1
+            self.signatures[signature(sql)] += 1
+
+    def duplicates(self):
+        return {sql: count for sql, count in self.signatures.items() if count >= DUPLICATE_THRESHOLD}
+
+
+def current():
+    return _current.get()
+
+
+def begin():
+    stats = RequestStats()
+    stats.token = _current.set(stats)
+    return stats
+
+
+def end(stats):
+    _current.reset(stats.token)
+
+
+def record_query(execute, sql, params, many, context):
+    stats = current()
+    if stats is None:
+        return execute(sql, params, many, context)
+    return stats.record_query(execute, sql, params, many, context)
+
+
+def _add_query_recorder(sender=None, connection=None, **kwargs):
+    if record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(record_query)
+
+
+def install_query_recorder():
+    # Connections are per thread; hook the ones open here and every one opened later
+    connection_created.connect(_add_query_recorder, dispatch_uid='instrumentation-query-recorder')
+    for connection in connections.all(initialized_only=True):
+        _add_query_recorder(connection=connection)
+
+
+_original_render = DjangoTemplate.render
+
+
+def _timed_render(self, context=None, request=None):
+    stats = current()
+    if stats is None:
+        return _original_render(self, context, request)
+    # Only the outermost render is timed so included/nested renders are not counted twice
+    stats.template_depth += 1
+    start = time.perf_counter()
+    try:
+        return _original_render(self, context, request)
+    finally:
+        stats.template_depth -= 1
+        if not stats.template_depth:
+            stats.template_time += time.perf_counter() - start
+
+
+def install_template_timer():
+    DjangoTemplate.render = _timed_render
+
+
+# --- Profiling ---
+
+_profile_lock = threading.Lock()
+profiles = deque(maxlen=PROFILES_KEPT)
+
+
+def profile(view, func):
+    """Run ``func`` under cProfile unless another request is being profiled already."""
+    if not _profile_lock.acquire(blocking=False):
+        return func()
+    profiler = cProfile.Profile()
+    try:
+        profiler.enable()
+        try:
+            return func()
+        finally:
+            profiler.disable()
+    finally:
+        _profile_lock.release()
+        output = io.StringIO()
+        pstats.Stats(profiler, stream=output).sort_stats('cumulative').print_stats(30)
+        profiles.appendleft({'view': view, 'at': time.time(), 'report': output.getvalue()})
+
+
+# --- Aggregation ---
+
+class ViewMetrics:
+    SERIES = ('duration', 'queries', 'db_time', 'template_time')
+
+    def __init__(self):
+        self.count = 0
+        self.sums = dict.fromkeys(self.SERIES, 0.0)
+        self.samples = {name: deque(maxlen=SAMPLE_SIZE) for name in self.SERIES}
+        self.bytes_sent = 0
+        self.errors = 0
+        self.duplicates = Counter()
+
+    def add(self, values, status, duplicates):
+        self.count += 1
+        for name in self.SERIES:
+            self.sums[name] += values[name]
+            self.samples[name].append(values[name])
+        if status >= 500:
+            self.errors += 1
+        for sql, count in duplicates.items():
+            self.duplicates[sql] = max(self.duplicates[sql], count)
+
+    def summary(self):
+        summary = {'count': self.count, 'bytes_sent': self.bytes_sent, 'errors': self.errors}
+        for name in self.SERIES:
+            values = sorted(self.samples[name])
+            summary[name] = {
+                'sum': self.sums[name],
+                'quantiles': {q: percentile(values, q) for q in QUANTILES},
+            }
+        summary['duplicates'] = self.duplicates.most_common(5)
+        return summary
+
+
+class Registry:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._views = {}
+
+    def record(self, view, stats, duration, status, bytes_sent):
+        values = {
+            'duration': duration,
+            'queries': stats.queries,
+            'db_time': stats.db_time,
+            'template_time': stats.template_time,
+        }
+        with self._lock:
+            metrics = self._views.setdefault(view, ViewMetrics())
+            metrics.add(values, status, stats.duplicates())
+            metrics.bytes_sent += bytes_sent
+
+    def add_bytes(self, view, bytes_sent):
+        with self._lock:
+            self._views.setdefault(view, ViewMetrics()).bytes_sent += bytes_sent
+
+    def snapshot(self):
+        with self._lock:
+            return {view: metrics.summary() for view, metrics in sorted(self._views.items())}
+
+    def reset(self):
+        with self._lock:
+            self._views.clear()
+        profiles.clear()
+
+
+registry = Registry()
+
+
+# --- Export ---
+
+_SERIES_HELP = {
+    'duration': ('portal_request_duration_seconds', 'Wall time per request.'),
+    'queries': ('portal_request_queries', 'Database queries per request.'),
+    'db_time': ('portal_request_db_seconds', 'Database time per request.'),
+    'template_time': ('portal_request_template_seconds', 'Template render time per request.'),
+}
+
+
+def _label(value):
+    return value.replace('\\', '\\\\').replace('"', '\\"')
+
+
+def prometheus(snapshot=None):
+    snapshot = registry.snapshot() if snapshot is None else snapshot
+    lines = []
+    for series, (metric, help_text) in _SERIES_HELP.items():
+        lines += [f'# HELP {metric} {help_text}', f'# TYPE {metric} summary']
+        for view, summary in snapshot.items():
+            label = f'view="{_label(view)}"'
+            for quantile, value in summary[series]['quantiles'].items():
+                lines.append(f'{metric}{{{label},quantile="{quantile}"}} {value:g}')
+            lines.append(f'{metric}_sum{{{label}}} {summary[series]["sum"]:g}')
+            lines.append(f'{metric}_count{{{label}}} {summary["count"]}')
+    for metric, key, help_text in (
+        ('portal_response_bytes_total', 'bytes_sent', 'Response bytes sent.'),
+        ('portal_request_errors_total', 'errors', 'Requests answered with a 5xx status.'),
+    ):
+        lines += [f'# HELP {metric} {help_text}', f'# TYPE {metric} counter']
+        for view, summary in snapshot.items():
+            lines.append(f'{metric}{{view="{_label(view)}"}} {summary[key]}')
+    return '\n'.join(lines) + '\n'
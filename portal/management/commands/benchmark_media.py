@@ -0,0 +1,83 @@
+import json
+import os
+import statistics
+import tempfile
+import time
+
+from django.core.management.base import BaseCommand
+from django.test import RequestFactory
+from django.views.static import serve
+
+from portal.delivery import serve_media
+from portal.storage import file_digest, hashed_name
+
+
+class Command(BaseCommand):
+    help = (
+        'Compare django.views.static.serve (the old DEBUG media route) with portal.delivery.serve_media '
+        'on throughput and time-to-first-byte for full, ranged and conditional requests. Runs in-process, '
+        'so the server-side sendfile path is not exercised; use a load tool against a real server for that.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--size-mb', type=int, default=16, help='Size of the generated test file.')
+        parser.add_argument('--requests', type=int, default=50, help='Requests per scenario.')
+        parser.add_argument('--json', dest='json_path', help='Also write the results to this file.')
+
+    def measure(self, view, request, **kwargs):
+        started = time.perf_counter()
+        response = view(request, **kwargs)
+        first_byte = None
+        size = 0
+        if response.streaming:
+            for block in response.streaming_content:
+                if first_byte is None:
+                    first_byte = time.perf_counter()
+                size += len(block)
+        else:
+            size = len(response.content)
+        finished = time.perf_counter()
+        response.close()
+        return (first_byte or finished) - started, finished - started, size
+
+    def run(self, label, view, headers, **kwargs):
+        factory = RequestFactory()
+        ttfb, totals, sizes = [], [], []
+        for _ in range(self.requests):
+            request = factory.get('/media/bench', headers=headers)
+            first, total, size = self.measure(view, request, **kwargs)
+            ttfb.append(first)
+            totals.append(total)
+            sizes.append(size)
+        result = {
+            'scenario': label,
+            'ttfb_ms_p50': statistics.median(ttfb) * 1000,
+            'total_ms_p50': statistics.median(totals) * 1000,
+            'bytes_per_request': int(statistics.mean(sizes)),
+            'throughput_mb_s': sum(sizes) / sum(totals) / 1024 / 1024 if sum(totals) else 0,
+        }
+        self.stdout.write(
+            f"{label:<40} ttfb p50 {result['ttfb_ms_p50']:8.2f} ms   total p50 {result['total_ms_p50']:8.2f} ms   "
+            f"{result['bytes_per_request']:>10} B   {result['throughput_mb_s']:8.1f} MB/s"
+        )
+        return result
+
+    def handle(self, *args, **options):
+        self.requests = options['requests']
+        with tempfile.TemporaryDirectory() as root:
+            name = 'bench.mp4'
+            with open(os.path.join(root, name), 'wb') as handle:
+                handle.write(os.urandom(options['size_mb'] * 1024 * 1024))
+            hashed = hashed_name(name, file_digest(os.path.join(root, name)))
+            etag = serve_media(RequestFactory().get('/'), hashed, document_root=root)['ETag']
+            seek = {'Range': 'bytes=1048576-2097151'}
+            results = [
+                self.run('static.serve full GET', serve, {}, path=name, document_root=root),
+                self.run('serve_media full GET', serve_media, {}, path=hashed, document_root=root),
+                self.run('static.serve seek (no range support)', serve, seek, path=name, document_root=root),
+                self.run('serve_media seek (206, 1 MB)', serve_media, seek, path=hashed, document_root=root),
+                self.run('serve_media revalidation (304)', serve_media, {'If-None-Match': etag}, path=hashed, document_root=root),
+            ]
+        if options['json_path']:
+            with open(options['json_path'], 'w') as handle:
+                json.dump(results, handle, indent=2)
@@ -0,0 +1,37 @@
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+
+from portal import assets
+
+
+class Command(BaseCommand):
+    help = (
+        'Build the front-end assets: minified CSS with only the utility classes the templates use, and '
+        'Telugu/Latin font subsets (needs fontTools, brotli and the source fonts). Then run collectstatic, '
+        'which writes content-hashed copies with gzip/brotli variants to STATIC_ROOT.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--no-fonts', action='store_true', help='Skip font subsetting.')
+        parser.add_argument('--no-collect', action='store_true', help="Only build; don't run collectstatic.")
+        parser.add_argument(
+            '--check', action='store_true',
+            help='Exit with an error if the committed stylesheets are out of date with the templates.',
+        )
+
+    def handle(self, *args, **options):
+        outputs, skipped_fonts = assets.build(fonts=not options['no_fonts'] and not options['check'])
+        if options['check']:
+            stale = assets.stale(outputs)
+            if stale:
+                raise CommandError(f'Out of date: {", ".join(stale)}; run build_assets.')
+            self.stdout.write('Assets are up to date.')
+            return
+        assets.write(outputs)
+        for name, text in outputs.items():
+            self.stdout.write(f'Wrote {name} ({len(text.encode())} bytes).')
+        for source, reason in skipped_fonts:
+            self.stdout.write(self.style.WARNING(f'Skipped font {source}: {reason}.'))
+        if not options['no_collect']:
+            call_command('collectstatic', interactive=False, verbosity=options['verbosity'], stdout=self.stdout)
+        self.stdout.write(self.style.SUCCESS('Done.'))
@@ -0,0 +1,31 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from portal import graph
+from portal.models import UserProfile
+
+
+class Command(BaseCommand):
+    help = (
+        'Cache "people you may know" for recently active users, from the accounts followed by the people they '
+        'follow. Run it nightly from cron; the suggestions are kept for GRAPH_SUGGESTIONS_CACHE_SECONDS.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('usernames', nargs='*', help='Only these users (default: everyone seen in --active-days).')
+        parser.add_argument('--active-days', type=int, default=30)
+        parser.add_argument('--limit', type=int, default=graph.SUGGESTIONS)
+
+    def handle(self, *args, **options):
+        profiles = UserProfile.objects.all()
+        if options['usernames']:
+            profiles = profiles.filter(user__username__in=options['usernames'])
+        else:
+            profiles = profiles.filter(last_seen__gte=timezone.now() - timedelta(days=options['active_days']))
+        computed = suggested = 0
+        for user_id in profiles.filter(following_count__gt=0).values_list('user_id', flat=True).iterator():
+            suggested += len(graph.store_suggestions(user_id, options['limit']))
+            computed += 1
+        self.stdout.write(self.style.SUCCESS(f'Stored {suggested} suggestion(s) for {computed} user(s).'))
@@ -0,0 +1,26 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+
+from portal import blobs
+
+
+class Command(BaseCommand):
+    help = (
+        'Mark and sweep contribution media: recount blob references from the database, then delete blobs and '
+        'files that nothing has referenced for --grace-hours. Streams over the tables and the media directories '
+        'in batches. Run it nightly from cron.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--grace-hours', type=float, default=blobs.GRACE.total_seconds() / 3600)
+        parser.add_argument('--batch-size', type=int, default=blobs.BATCH_SIZE)
+        parser.add_argument('--dry-run', action='store_true', help='Report what would be reclaimed without deleting it.')
+
+    def handle(self, *args, **options):
+        result = blobs.collect(timedelta(hours=options['grace_hours']), options['batch_size'], options['dry_run'])
+        verb = 'Would reclaim' if options['dry_run'] else 'Reclaimed'
+        self.stdout.write(f"Checked {result['checked']} blob(s); {result['fixed']} had drifted reference counts.")
+        self.stdout.write(self.style.SUCCESS(
+            f"{verb} {result['blobs']} blob(s) and {result['files']} orphaned file(s), {result['bytes']} bytes."
+        ))
@@ -0,0 +1,29 @@
+from django.core.management.base import BaseCommand
+from django.db.models import Q
+
+from portal import media
+from portal.models import Contribution
+
+
+class Command(BaseCommand):
+    help = 'Build media renditions for contributions that are pending (or all, with --all).'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--all', action='store_true', help='Reprocess every contribution with media.')
+        parser.add_argument('--failed', action='store_true', help='Also retry contributions that failed before.')
+
+    def handle(self, *args, **options):
+        if options['all']:
+            contributions = Contribution.objects.filter(
+                Q(image_content__gt='') | Q(video_content__gt='') | Q(audio_content__gt='')
+            )
+        else:
+            statuses = [Contribution.MEDIA_PENDING]
+            if options['failed']:
+                statuses.append(Contribution.MEDIA_FAILED)
+            contributions = Contribution.objects.filter(media_status__in=statuses)
+        processed = 0
+        for pk in contributions.order_by('pk').values_list('pk', flat=True).iterator():
+            media.process(pk)
+            processed += 1
+        self.stdout.write(self.style.SUCCESS(f'Processed media for {processed} contribution(s).'))
@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from portal import notifications
+
+
+class Command(BaseCommand):
+    help = 'Delete read notifications older than the retention window. Meant to run daily from cron.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=30, help='Keep read notifications this many days.')
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        deleted = notifications.prune(options['days'], options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f'Deleted {deleted} read notification(s).'))
@@ -0,0 +1,29 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from portal import uploads
+from portal.models import UploadSession
+
+
+class Command(BaseCommand):
+    help = (
+        'Delete chunked uploads that were abandoned or never attached to a contribution. '
+        'Their stored files are reclaimed by the next gc_media run.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--hours', type=int, default=24, help='Age after which an unattached upload is abandoned.')
+
+    def handle(self, *args, **options):
+        cutoff = timezone.now() - timedelta(hours=options['hours'])
+        stale = UploadSession.objects.filter(
+            status__in=[UploadSession.OPEN, UploadSession.COMPLETE], updated_at__lt=cutoff,
+        )
+        purged = 0
+        for session in stale.iterator():
+            uploads.discard(session)
+            purged += 1
+        attached = UploadSession.objects.filter(status=UploadSession.ATTACHED, updated_at__lt=cutoff).delete()[0]
+        self.stdout.write(self.style.SUCCESS(f'Purged {purged} abandoned upload(s) and {attached} attached session record(s).'))
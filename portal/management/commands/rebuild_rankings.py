@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+
+from portal import ranking
+
+
+class Command(BaseCommand):
+    help = (
+        'Rebuild the cached trending, top-this-week, per-state and per-category lists from the database. '
+        'Run it every few minutes from cron. --rescore first recomputes every trending score from the like '
+        'and comment counters, for data loaded without going through the models.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rescore', action='store_true', help='Recompute trending scores from the counters first.')
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        if options['rescore']:
+            rescored = ranking.rescore(options['batch_size'])
+            self.stdout.write(f'Rescored {rescored} contribution(s).')
+        names = ranking.rebuild_all()
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt {len(names)} ranking list(s).'))
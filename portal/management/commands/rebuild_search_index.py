@@ -0,0 +1,12 @@
+from django.core.management.base import BaseCommand
+
+from portal import search
+from portal.models import Contribution
+
+
+class Command(BaseCommand):
+    help = 'Recreate the contribution full-text search index from scratch.'
+
+    def handle(self, *args, **options):
+        search.get_backend().rebuild()
+        self.stdout.write(self.style.SUCCESS(f'Indexed {Contribution.objects.count()} contribution(s).'))
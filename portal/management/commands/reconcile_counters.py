@@ -0,0 +1,59 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count
+
+from portal.models import Comment, Contribution, UserProfile
+
+
+def _counts(rows, key, ids):
+    """``{id: n}``: how many of ``rows`` point at each of ``ids`` through ``key``."""
+    return dict(rows.filter(**{f'{key}__in': ids}).values(key).annotate(n=Count('*')).values_list(key, 'n'))
+
+
+class Command(BaseCommand):
+    help = (
+        'Recompute Contribution.likes_count/comments_count from the likes and comments tables and '
+        'UserProfile.followers_count/following_count from the follows table.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500)
+        parser.add_argument('--dry-run', action='store_true', help='Report drift without fixing it.')
+
+    def handle(self, *args, **options):
+        Follow = UserProfile.follows.through
+        self._reconcile(Contribution, {
+            'likes_count': (Contribution.likes.through.objects.all(), 'contribution_id'),
+            'comments_count': (Comment.objects.all(), 'contribution_id'),
+        }, options, 'contribution(s)')
+        self._reconcile(UserProfile, {
+            'followers_count': (Follow.objects.all(), 'to_userprofile_id'),
+            'following_count': (Follow.objects.all(), 'from_userprofile_id'),
+        }, options, 'profile(s)')
+
+    def _reconcile(self, model, counters, options, label):
+        """Set each ``{field: (rows, key)}`` counter of ``model`` to its count of ``rows``, a batch at a time."""
+        fields = list(counters)
+        checked = fixed = 0
+        last_pk = 0
+        while True:
+            batch = list(
+                model.objects.filter(pk__gt=last_pk).order_by('pk').values_list('pk', *fields)[:options['batch_size']]
+            )
+            if not batch:
+                break
+            last_pk = batch[-1][0]
+            ids = [row[0] for row in batch]
+            counts = {field: _counts(rows, key, ids) for field, (rows, key) in counters.items()}
+            drifted = []
+            for pk, *stored in batch:
+                actual = [counts[field].get(pk, 0) for field in fields]
+                if stored != actual:
+                    drifted.append(model(pk=pk, **dict(zip(fields, actual))))
+            checked += len(batch)
+            fixed += len(drifted)
+            if drifted and not options['dry_run']:
+                with transaction.atomic():
+                    model.objects.bulk_update(drifted, fields)
+        verb = 'Found' if options['dry_run'] else 'Fixed'
+        self.stdout.write(self.style.SUCCESS(f'Checked {checked} {label}. {verb} {fixed} with drifted counters.'))
@@ -0,0 +1,328 @@
+import asyncio
+import json
+import re
+import secrets
+import statistics
+import subprocess
+import threading
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from importlib import import_module
+from urllib.parse import urlencode
+
+from django.conf import settings
+from django.contrib.auth import BACKEND_SESSION_KEY, HASH_SESSION_KEY, SESSION_KEY
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import AsyncClient, Client, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from portal import database, throttle
+from portal.models import Contribution, Notification, State
+
+QUANTILES = (0.5, 0.9, 0.99)
+SERVER_TIMING_QUERIES = re.compile(r'db;desc="(\d+) queries"')
+
+
+def percentile(values, quantile):
+    values = sorted(values)
+    if not values:
+        return 0.0
+    return values[min(len(values) - 1, int(round(quantile * (len(values) - 1))))]
+
+
+def request_kwargs(data):
+    # Dict payloads are sent as a form, strings as a JSON body
+    if isinstance(data, str):
+        return {'data': data, 'content_type': 'application/json'}
+    return {'data': data or {}}
+
+
+def allowed_host():
+    # With DEBUG and no ALLOWED_HOSTS Django accepts localhost; otherwise use the first concrete host
+    hosts = [host for host in settings.ALLOWED_HOSTS if host != '*' and not host.startswith('.')]
+    return hosts[0] if hosts else 'localhost'
+
+
+class InProcessDriver:
+    """Runs requests through the Django test client, one client per thread, counting queries directly."""
+
+    def __init__(self, user):
+        self.user = user
+        self.local = threading.local()
+
+    def client(self):
+        if not hasattr(self.local, 'client'):
+            self.local.client = Client(raise_request_exception=False, HTTP_HOST=allowed_host())
+            self.local.client.force_login(self.user)
+        return self.local.client
+
+    def request(self, method, url, data):
+        queries = 0
+
+        def count(execute, sql, params, many, context):
+            nonlocal queries
+            queries += 1
+            return execute(sql, params, many, context)
+
+        with connection.execute_wrapper(count):
+            response = getattr(self.client(), method)(url, **request_kwargs(data))
+        if response.streaming:
+            b''.join(response.streaming_content)
+        return response.status_code, queries
+
+
+class ASGIDriver:
+    """
+    Runs requests through Django's ASGI handler with AsyncClient, as concurrent
+    tasks on one event loop. Query counts come from the Server-Timing header,
+    so they are only reported with DJANGO_INSTRUMENTATION=1.
+    """
+
+    is_async = True
+
+    def __init__(self, user):
+        self.user = user
+        self._client = None
+
+    async def client(self):
+        if self._client is None:
+            self._client = AsyncClient(raise_request_exception=False)
+            await self._client.aforce_login(self.user)
+        return self._client
+
+    async def arequest(self, method, url, data):
+        client = await self.client()
+        response = await getattr(client, method)(url, **request_kwargs(data))
+        if response.streaming:
+            async for chunk in response.streaming_content:
+                pass
+        match = SERVER_TIMING_QUERIES.search(response.get('Server-Timing', ''))
+        return response.status_code, int(match.group(1)) if match else None
+
+
+class HTTPDriver:
+    """Sends real HTTP requests to a running server with a session created for the benchmark user."""
+
+    def __init__(self, user, base_url):
+        self.base_url = base_url.rstrip('/')
+        store = import_module(settings.SESSION_ENGINE).SessionStore()
+        store[SESSION_KEY] = str(user.pk)
+        store[BACKEND_SESSION_KEY] = settings.AUTHENTICATION_BACKENDS[0]
+        store[HASH_SESSION_KEY] = user.get_session_auth_hash()
+        store.create()
+        self.csrf = secrets.token_hex(16)
+        self.cookies = f'{settings.SESSION_COOKIE_NAME}={store.session_key}; {settings.CSRF_COOKIE_NAME}={self.csrf}'
+
+    def request(self, method, url, data):
+        if isinstance(data, str):
+            body, content_type = data.encode(), 'application/json'
+        else:
+            body, content_type = urlencode(data or {}).encode(), 'application/x-www-form-urlencoded'
+        request = urllib.request.Request(self.base_url + url, data=body if method == 'post' else None, method=method.upper(), headers={
+            'Cookie': self.cookies,
+            'X-CSRFToken': self.csrf,
+            'Content-Type': content_type,
+        })
+        opener = urllib.request.build_opener(_NoRedirect)
+        try:
+            with opener.open(request, timeout=30) as response:
+                response.read()
+                status, timing = response.status, response.headers.get('Server-Timing', '')
+        except urllib.error.HTTPError as error:
+            status, timing = error.code, error.headers.get('Server-Timing', '')
+        # Query counts are only known when the server runs InstrumentationMiddleware
+        match = SERVER_TIMING_QUERIES.search(timing)
+        return status, int(match.group(1)) if match else None
+
+
+class _NoRedirect(urllib.request.HTTPRedirectHandler):
+    def redirect_request(self, *args, **kwargs):
+        return None
+
+
+class Command(BaseCommand):
+    help = (
+        'Drive every portal view at a given concurrency and report latency percentiles, queries per request '
+        'and throughput. Runs in-process through the test client by default, or against a running server with '
+        '--base-url. Write-heavy views (like, comment, follow, notification reads) change the data they hit; '
+        'skip them with --read-only, or run only them with --write-only to compare write throughput between '
+        'DJANGO_DB_PROFILE settings. The events/ stream is long-lived and is not benchmarked. Use seed_data '
+        'first for a realistic dataset.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', default='seed_bench', help='User to benchmark as (needs staff for admin views).')
+        parser.add_argument('--requests', type=int, default=50, help='Requests per scenario.')
+        parser.add_argument('--concurrency', type=int, default=4)
+        parser.add_argument('--base-url', help='Benchmark a running server (e.g. http://127.0.0.1:8000) instead.')
+        parser.add_argument(
+            '--asgi', action='store_true',
+            help='Run in-process through the ASGI handler on an event loop instead of WSGI worker threads.',
+        )
+        parser.add_argument('--only', nargs='*', help='Only run these scenarios.')
+        parser.add_argument('--read-only', action='store_true', help='Skip scenarios that write.')
+        parser.add_argument('--write-only', action='store_true', help='Only run scenarios that write.')
+        parser.add_argument(
+            '--keep-throttle', action='store_true',
+            help='Keep the per-user like limits for in-process runs (they are lifted by default to measure the write path).',
+        )
+        parser.add_argument('--json', dest='json_path', help='Write the results to this file.')
+        parser.add_argument('--compare', help='A previous --json file to print deltas against.')
+
+    def scenarios(self, user):
+        post = Contribution.objects.order_by('-likes_count').first()
+        other = Contribution.objects.exclude(author=user).order_by('-submitted_at').first()
+        author = User.objects.exclude(pk=user.pk).filter(userprofile__isnull=False, contribution__isnull=False).order_by('pk').first()
+        state = State.objects.filter(contribution__isnull=False).first()
+        notification = Notification.objects.filter(recipient=user).first()
+        if not (post and other and author and state):
+            raise CommandError('Not enough data to benchmark; run seed_data first.')
+        word = (post.text_content or 'festival').split()[0]
+        read = [
+            ('home', 'get', reverse('home'), None),
+            ('explore', 'get', reverse('explore'), None),
+            ('feed_more', 'get', reverse('feed_more', args=['explore']), None),
+            ('search', 'get', reverse('search'), {'q': word}),
+            ('profile', 'get', reverse('profile'), None),
+            ('public_profile', 'get', reverse('public_profile', args=[author.username]), None),
+            ('edit_profile', 'get', reverse('edit_profile'), None),
+            ('create_post', 'get', reverse('create_post'), None),
+            ('notifications', 'get', reverse('notifications'), None),
+            ('admin_dashboard', 'get', reverse('admin:index'), None),
+            ('admin_state_contributions', 'get', reverse('admin_state_contributions', args=[state.pk]), None),
+            ('instrumentation_report', 'get', reverse('instrumentation_report'), None),
+            ('login', 'get', reverse('login'), None),
+            ('register', 'get', reverse('register'), None),
+        ]
+        write = [
+            ('like_contribution', 'post', reverse('like_contribution', args=[other.pk]), None),
+            ('like_batch', 'post', reverse('like_batch'), json.dumps({'likes': [
+                {'id': pk, 'liked': bool(i % 2)}
+                for i, pk in enumerate(Contribution.objects.exclude(author=user).values_list('pk', flat=True)[:10])
+            ]})),
+            ('add_comment', 'post', reverse('add_comment', args=[other.pk]), {'comment_text': 'Benchmark comment'}),
+            ('follow_user', 'get', reverse('follow_user', args=[author.pk]), None),
+        ]
+        if notification:
+            write.append(('mark_notification_as_read', 'get', reverse('mark_notification_as_read', args=[notification.pk]), None))
+        if self.write_only:
+            return write
+        return read + ([] if self.read_only else write)
+
+    def run(self, driver, name, method, url, data):
+        def one(_):
+            started = time.perf_counter()
+            status, queries = driver.request(method, url, data)
+            return time.perf_counter() - started, status, queries
+
+        started = time.perf_counter()
+        if getattr(driver, 'is_async', False):
+            # AsyncClient always sends Host: testserver
+            with override_settings(ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, 'testserver']):
+                samples = asyncio.run(self.run_async(driver, method, url, data))
+        elif self.concurrency == 1:
+            samples = [one(i) for i in range(self.requests)]
+        else:
+            with ThreadPoolExecutor(max_workers=self.concurrency) as pool:
+                samples = list(pool.map(one, range(self.requests)))
+        elapsed = time.perf_counter() - started
+        latencies = [latency for latency, status, queries in samples]
+        queries = [q for latency, status, q in samples if q is not None]
+        result = {
+            'scenario': name,
+            'url': url,
+            'requests': len(samples),
+            'errors': sum(1 for latency, status, q in samples if status >= 400 and status != 429),
+            'throttled': sum(1 for latency, status, q in samples if status == 429),
+            'throughput_rps': len(samples) / elapsed if elapsed else 0,
+            'latency_ms': {f'p{round(q * 100)}': percentile(latencies, q) * 1000 for q in QUANTILES},
+            'latency_ms_mean': statistics.mean(latencies) * 1000,
+            'queries_per_request': statistics.mean(queries) if queries else None,
+        }
+        latency = result['latency_ms']
+        self.stdout.write(
+            f"{name:<28} p50 {latency['p50']:8.1f} ms  p90 {latency['p90']:8.1f} ms  p99 {latency['p99']:8.1f} ms  "
+            f"{result['throughput_rps']:7.1f} req/s  "
+            f"{'-' if result['queries_per_request'] is None else format(result['queries_per_request'], '.1f'):>5} queries  "
+            f"{result['errors']} errors  {result['throttled']} throttled"
+        )
+        return result
+
+    async def run_async(self, driver, method, url, data):
+        # Log in before the tasks start so none of them uses a half-initialised client
+        await driver.client()
+        semaphore = asyncio.Semaphore(self.concurrency)
+
+        async def one(_):
+            async with semaphore:
+                started = time.perf_counter()
+                status, queries = await driver.arequest(method, url, data)
+                return time.perf_counter() - started, status, queries
+
+        return await asyncio.gather(*(one(i) for i in range(self.requests)))
+
+    def commit(self):
+        try:
+            return subprocess.run(
+                ['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, cwd=settings.BASE_DIR, check=True,
+            ).stdout.strip()
+        except (OSError, subprocess.CalledProcessError):
+            return None
+
+    def compare(self, path, results):
+        with open(path) as handle:
+            previous = {r['scenario']: r for r in json.load(handle)['results']}
+        self.stdout.write(f'\nChange in p50 latency against {path}:')
+        for result in results:
+            before = previous.get(result['scenario'])
+            if before and before['latency_ms']['p50']:
+                change = (result['latency_ms']['p50'] / before['latency_ms']['p50'] - 1) * 100
+                self.stdout.write(f"{result['scenario']:<28} {before['latency_ms']['p50']:8.1f} -> {result['latency_ms']['p50']:8.1f} ms ({change:+.0f}%)")
+
+    def handle(self, *args, **options):
+        try:
+            user = User.objects.get(username=options['user'])
+        except User.DoesNotExist:
+            raise CommandError(f"No user {options['user']!r}; run seed_data or pass --user.")
+        self.requests = options['requests']
+        self.concurrency = options['concurrency']
+        self.read_only = options['read_only']
+        if not options['base_url'] and not options['keep_throttle']:
+            throttle.likes.rate = throttle.likes.capacity = 10 ** 9
+        self.write_only = options['write_only']
+        if self.read_only and self.write_only:
+            raise CommandError('--read-only and --write-only are mutually exclusive.')
+        db = database.describe()
+        self.stdout.write('Database: ' + ', '.join(f'{key}={value}' for key, value in db.items()))
+        if options['base_url']:
+            driver = HTTPDriver(user, options['base_url'])
+        elif options['asgi']:
+            driver = ASGIDriver(user)
+        else:
+            driver = InProcessDriver(user)
+        scenarios = [s for s in self.scenarios(user) if not options['only'] or s[0] in options['only']]
+        started = time.perf_counter()
+        results = [self.run(driver, *scenario) for scenario in scenarios]
+        elapsed = time.perf_counter() - started
+        total = sum(r['requests'] for r in results)
+        self.stdout.write(self.style.SUCCESS(f'{total} requests in {elapsed:.1f}s ({total / elapsed:.1f} req/s overall).'))
+        report = {
+            'commit': self.commit(),
+            'run_at': timezone.now().isoformat(),
+            'mode': 'http' if options['base_url'] else 'asgi' if options['asgi'] else 'in-process',
+            'base_url': options['base_url'],
+            'concurrency': self.concurrency,
+            'requests_per_scenario': self.requests,
+            'database': {**db, 'contributions': Contribution.objects.count(), 'users': User.objects.count()},
+            'results': results,
+        }
+        if options['json_path']:
+            with open(options['json_path'], 'w') as handle:
+                json.dump(report, handle, indent=2)
+        if options['compare']:
+            self.compare(options['compare'], results)
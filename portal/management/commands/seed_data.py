@@ -0,0 +1,177 @@
+import random
+from datetime import timedelta
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+
+from portal.models import CategorySubscription, Comment, Contribution, Notification, State, UserProfile
+
+WORDS = (
+    'festival temple dance harvest rangoli sweets monsoon river fort village bazaar kolam pongal bonalu '
+    'bathukamma ugadi sankranti kuchipudi bharatanatyam kathakali biryani pulihora pesarattu handloom '
+    'పండుగ ఆలయం నృత్యం పంట ముగ్గు స్వీట్లు వర్షం నది కోట గ్రామం సంత'
+).split()
+
+
+class Command(BaseCommand):
+    help = (
+        'Generate a large synthetic dataset for load testing: users with a power-law (Zipf) follow graph, '
+        'contributions across every state and category, likes, comments and notifications. Seeded users are '
+        'named <prefix>_<n> and can be removed again with --reset. Also creates <prefix>_bench, a staff user '
+        'that follows the most popular accounts, for run_benchmark.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=1000)
+        parser.add_argument('--posts-per-user', type=float, default=5, help='Average; popular users post more.')
+        parser.add_argument('--likes-per-post', type=float, default=8, help='Average; popular posts get more.')
+        parser.add_argument('--comments-per-post', type=float, default=2)
+        parser.add_argument('--follows-per-user', type=float, default=30, help='Average out-degree of the follow graph.')
+        parser.add_argument('--zipf', type=float, default=1.1, help='Exponent of the popularity distribution.')
+        parser.add_argument('--days', type=int, default=90, help='Spread post times over this many days.')
+        parser.add_argument('--prefix', default='seed')
+        parser.add_argument('--seed', type=int, default=42, help='Random seed, for reproducible datasets.')
+        parser.add_argument('--batch-size', type=int, default=2000)
+        parser.add_argument('--reset', action='store_true', help='Delete previously seeded users (and their content) first.')
+
+    def log(self, message):
+        self.stdout.write(message)
+
+    def zipf_weights(self, n):
+        return [1 / (rank + 1) ** self.zipf for rank in range(n)]
+
+    def bulk(self, model, objects, **kwargs):
+        created = []
+        for start in range(0, len(objects), self.batch_size):
+            created += model.objects.bulk_create(objects[start:start + self.batch_size], **kwargs)
+        return created
+
+    def handle(self, *args, **options):
+        self.rng = random.Random(options['seed'])
+        self.zipf = options['zipf']
+        self.batch_size = options['batch_size']
+        prefix = options['prefix']
+        seeded = User.objects.filter(username__startswith=f'{prefix}_')
+        if options['reset']:
+            deleted = seeded.delete()[0]
+            self.log(f'Deleted {deleted} seeded row(s).')
+        elif seeded.exists():
+            raise CommandError(f'Users named {prefix}_* already exist; pass --reset or another --prefix.')
+        states = list(State.objects.values_list('pk', flat=True))
+        if not states:
+            raise CommandError('No State rows; run migrations first.')
+        categories = [value for value, label in Contribution.CATEGORY_CHOICES]
+
+        with transaction.atomic():
+            users = self.create_users(prefix, options['users'])
+            self.create_follows(users, options['follows_per_user'])
+            posts = self.create_contributions(users, states, categories, options['posts_per_user'], options['days'])
+            self.create_likes(users, posts, options['likes_per_post'])
+            self.create_comments(users, posts, options['comments_per_post'])
+            self.create_subscriptions(users, categories)
+            self.create_bench_user(prefix, users, categories)
+
+        self.log('Rebuilding counters, search index, rankings and timelines...')
+        call_command('reconcile_counters', stdout=self.stdout)
+        call_command('rebuild_rankings', rescore=True, stdout=self.stdout)
+        call_command('rebuild_search_index', stdout=self.stdout)
+        call_command('rebuild_timelines', *User.objects.filter(username__startswith=f'{prefix}_').values_list('username', flat=True), stdout=self.stdout)
+        self.stdout.write(self.style.SUCCESS('Done.'))
+
+    def create_users(self, prefix, count):
+        password = make_password(None)
+        now = timezone.now()
+        users = self.bulk(User, [
+            User(username=f'{prefix}_{i}', password=password, date_joined=now) for i in range(count)
+        ])
+        # bulk_create skips the post_save hook that normally creates profiles
+        self.bulk(UserProfile, [UserProfile(user=user) for user in users])
+        self.log(f'Created {len(users)} users.')
+        return users
+
+    def create_follows(self, users, average):
+        Follow = UserProfile.follows.through
+        profiles = dict(UserProfile.objects.filter(user__in=users).values_list('user_id', 'pk'))
+        # Rank 0 is the most popular account; followers pick targets by Zipf weight
+        weights = self.zipf_weights(len(users))
+        follows = set()
+        for user in users:
+            degree = min(len(users) - 1, int(self.rng.paretovariate(1.5) * average / 3))
+            for target in self.rng.choices(users, weights=weights, k=degree):
+                if target.pk != user.pk:
+                    follows.add((profiles[user.pk], profiles[target.pk]))
+        self.bulk(Follow, [Follow(from_userprofile_id=a, to_userprofile_id=b) for a, b in follows], ignore_conflicts=True)
+        self.log(f'Created {len(follows)} follows.')
+
+    def text(self, words):
+        return ' '.join(self.rng.choice(WORDS) for _ in range(words)).capitalize()
+
+    def create_contributions(self, users, states, categories, average, days):
+        weights = self.zipf_weights(len(users))
+        count = int(len(users) * average)
+        authors = self.rng.choices(users, weights=weights, k=count)
+        posts = self.bulk(Contribution, [
+            Contribution(
+                author=author, state_id=self.rng.choice(states), category=self.rng.choice(categories),
+                text_content=self.text(self.rng.randint(5, 40)),
+            )
+            for author in authors
+        ])
+        # submitted_at is auto_now_add, so spread the timestamps afterwards
+        now = timezone.now()
+        for post in posts:
+            post.submitted_at = now - timedelta(seconds=self.rng.uniform(0, days * 86400))
+        for start in range(0, len(posts), self.batch_size):
+            Contribution.objects.bulk_update(posts[start:start + self.batch_size], ['submitted_at'])
+        self.log(f'Created {len(posts)} contributions.')
+        return posts
+
+    def create_likes(self, users, posts, average):
+        Like = Contribution.likes.through
+        weights = self.zipf_weights(len(posts))
+        likes = set()
+        notifications = []
+        for post in self.rng.choices(posts, weights=weights, k=int(len(posts) * average)):
+            user = self.rng.choice(users)
+            if (post.pk, user.pk) not in likes:
+                likes.add((post.pk, user.pk))
+                if user.pk != post.author_id and self.rng.random() < 0.3:
+                    notifications.append(Notification(recipient_id=post.author_id, sender=user, verb='liked your post', target=post))
+        self.bulk(Like, [Like(contribution_id=c, user_id=u) for c, u in likes], ignore_conflicts=True)
+        self.bulk(Notification, notifications)
+        self.log(f'Created {len(likes)} likes and {len(notifications)} like notifications.')
+
+    def create_comments(self, users, posts, average):
+        weights = self.zipf_weights(len(posts))
+        commented = self.rng.choices(posts, weights=weights, k=int(len(posts) * average))
+        comments = self.bulk(Comment, [
+            Comment(contribution=post, author=self.rng.choice(users), text=self.text(self.rng.randint(2, 15)))
+            for post in commented
+        ])
+        # created_at is auto_now_add as well
+        for comment, post in zip(comments, commented):
+            comment.created_at = min(timezone.now(), post.submitted_at + timedelta(minutes=self.rng.randint(1, 2000)))
+        for start in range(0, len(comments), self.batch_size):
+            Comment.objects.bulk_update(comments[start:start + self.batch_size], ['created_at'])
+        self.log(f'Created {len(comments)} comments.')
+
+    def create_subscriptions(self, users, categories):
+        subscriptions = [
+            CategorySubscription(user=user, category=category)
+            for user in users for category in categories if self.rng.random() < 0.15
+        ]
+        self.bulk(CategorySubscription, subscriptions, ignore_conflicts=True)
+        self.log(f'Created {len(subscriptions)} category subscriptions.')
+
+    def create_bench_user(self, prefix, users, categories):
+        bench = User.objects.create_user(f'{prefix}_bench', is_staff=True, is_superuser=True)
+        bench.userprofile.follows.add(*UserProfile.objects.filter(user__in=users[:50]))
+        CategorySubscription.objects.set_for(bench.pk, categories[:1])
+        Notification.objects.bulk_create([
+            Notification(recipient=bench, sender=user, verb='started following you') for user in users[:100]
+        ])
+        self.log(f'Created benchmark user {bench.username}.')
@@ -0,0 +1,35 @@
+import sqlite3
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, connections
+
+from portal import database
+
+
+class Command(BaseCommand):
+    help = (
+        'Copy the primary SQLite database into every replica file in DJANGO_DB_REPLICAS, standing in for '
+        'replication when trying the replica router locally. Run it again (e.g. every few seconds from a loop) '
+        'to let replicas catch up. Server databases replicate on their own and are not touched.'
+    )
+
+    def handle(self, *args, **options):
+        if not database.REPLICAS:
+            raise CommandError('No replicas configured; set DJANGO_DB_REPLICAS.')
+        primary = connections[DEFAULT_DB_ALIAS]
+        if primary.vendor != 'sqlite':
+            raise CommandError('sync_replicas only copies SQLite files.')
+        source = sqlite3.connect(primary.settings_dict['NAME'])
+        try:
+            for alias in database.REPLICAS:
+                connections[alias].close()
+                target = sqlite3.connect(connections[alias].settings_dict['NAME'])
+                try:
+                    # The backup API takes a consistent snapshot even while the primary is being written
+                    source.backup(target)
+                finally:
+                    target.close()
+                self.stdout.write(f'Copied {DEFAULT_DB_ALIAS} to {alias}.')
+        finally:
+            source.close()
+        self.stdout.write(self.style.SUCCESS(f'Synced {len(database.REPLICAS)} replica(s).'))
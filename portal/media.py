@@ -0,0 +1,189 @@
+# portal/media.py
+"""
+Post-upload media processing.
+
+Once a contribution with media is committed, its files are handed to a local
+thread pool which writes renditions under ``MEDIA_ROOT/renditions/<pk>/``:
+
+* images: WebP copies at each of ``MEDIA_IMAGE_WIDTHS`` (never upscaled)
+* video: a JPEG poster frame and an H.264 transcode capped at
+  ``MEDIA_VIDEO_MAX_HEIGHT`` / ``MEDIA_VIDEO_MAX_BITRATE``
+* audio: a loudness-normalized AAC file at ``MEDIA_AUDIO_BITRATE``
+
+Video and audio need an ``ffmpeg`` binary; without one those renditions are
+skipped and the originals keep being served. The resulting names are stored
+in ``Contribution.media_renditions``. Contributions left ``PENDING`` (e.g. by
+a restart) are picked up again by the ``process_media`` command.
+"""
+import io
+import logging
+import os
+import shutil
+import subprocess
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.files.base import ContentFile, File
+from django.core.files.storage import default_storage
+from django.db import close_old_connections, transaction
+from PIL import Image, ImageOps
+
+from . import cards, database
+from .models import Contribution
+
+logger = logging.getLogger(__name__)
+
+ASYNC = getattr(settings, 'MEDIA_PROCESSING_ASYNC', True)
+WORKERS = getattr(settings, 'MEDIA_PROCESSING_WORKERS', 2)
+IMAGE_WIDTHS = getattr(settings, 'MEDIA_IMAGE_WIDTHS', (320, 640, 1280))
+IMAGE_QUALITY = getattr(settings, 'MEDIA_IMAGE_QUALITY', 80)
+VIDEO_MAX_HEIGHT = getattr(settings, 'MEDIA_VIDEO_MAX_HEIGHT', 720)
+VIDEO_MAX_BITRATE = getattr(settings, 'MEDIA_VIDEO_MAX_BITRATE', '1500k')
+AUDIO_BITRATE = getattr(settings, 'MEDIA_AUDIO_BITRATE', '128k')
+FFMPEG = getattr(settings, 'FFMPEG_BINARY', 'ffmpeg')
+
+_executor = None
+
+
+def _get_executor():
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=WORKERS, thread_name_prefix='media')
+    return _executor
+
+
+def has_media(contribution):
+    return bool(contribution.image_content or contribution.video_content or contribution.audio_content)
+
+
+def schedule(contribution):
+    """Mark ``contribution`` pending and process it once the current transaction commits."""
+    if not has_media(contribution):
+        return
+    Contribution.objects.filter(pk=contribution.pk).update(media_status=Contribution.MEDIA_PENDING)
+    pk = contribution.pk
+    if ASYNC:
+        transaction.on_commit(lambda: _get_executor().submit(_run_in_worker, pk))
+    else:
+        transaction.on_commit(lambda: process(pk))
+
+
+def _run_in_worker(pk):
+    try:
+        # The row was committed moments ago and may not have reached a replica yet
+        with database.primary():
+            process(pk)
+    except Exception:
+        logger.exception('Media processing failed for contribution %s', pk)
+    finally:
+        close_old_connections()
+
+
+# --- Renditions ---
+
+def _rendition_name(contribution, filename):
+    return f'renditions/{contribution.pk}/{filename}'
+
+
+def _save(name, content):
+    if default_storage.exists(name):
+        default_storage.delete(name)
+    return default_storage.save(name, content)
+
+
+def render_image(contribution):
+    with contribution.image_content.open('rb') as source:
+        image = ImageOps.exif_transpose(Image.open(source))
+        image.load()
+    if image.mode not in ('RGB', 'RGBA'):
+        image = image.convert('RGBA' if 'transparency' in image.info else 'RGB')
+    renditions = []
+    for width in sorted(set(IMAGE_WIDTHS)):
+        width = min(width, image.width)
+        resized = image.copy()
+        resized.thumbnail((width, image.height), Image.LANCZOS)
+        buffer = io.BytesIO()
+        resized.save(buffer, 'WEBP', quality=IMAGE_QUALITY, method=6)
+        name = _save(_rendition_name(contribution, f'image-{resized.width}w.webp'), ContentFile(buffer.getvalue()))
+        renditions.append({'name': name, 'width': resized.width, 'height': resized.height})
+        if width == image.width:
+            break
+    return renditions
+
+
+def _ffmpeg(*args):
+    subprocess.run([FFMPEG, '-hide_banner', '-loglevel', 'error', '-y', *args], check=True, timeout=30 * 60)
+
+
+def _ffmpeg_to_storage(contribution, source, filename, *args):
+    """Run ffmpeg on ``source`` and store its output; None if it wrote nothing."""
+    suffix = os.path.splitext(filename)[1]
+    with tempfile.NamedTemporaryFile(suffix=suffix) as output:
+        _ffmpeg('-i', source, *args, output.name)
+        if not os.path.getsize(output.name):
+            return None
+        # Storage copies from the temporary file in chunks; transcodes can be large
+        return _save(_rendition_name(contribution, filename), File(output))
+
+
+def render_poster(contribution, source, scale):
+    """A frame a second in, or the first frame of clips shorter than that."""
+    for seek in (('-ss', '00:00:01'), ()):
+        poster = _ffmpeg_to_storage(contribution, source, 'poster.jpg', *seek, '-frames:v', '1', '-vf', scale)
+        if poster:
+            return poster
+    return None
+
+
+def render_video(contribution):
+    source = contribution.video_content.path
+    scale = f"scale=-2:'min({VIDEO_MAX_HEIGHT},ih)'"
+    renditions = {
+        'video': _ffmpeg_to_storage(
+            contribution, source, f'video-{VIDEO_MAX_HEIGHT}p.mp4',
+            '-vf', scale, '-c:v', 'libx264', '-preset', 'veryfast', '-b:v', VIDEO_MAX_BITRATE,
+            '-maxrate', VIDEO_MAX_BITRATE, '-bufsize', VIDEO_MAX_BITRATE,
+            '-c:a', 'aac', '-b:a', AUDIO_BITRATE, '-movflags', '+faststart',
+        ),
+    }
+    # The transcode is what matters; without a poster the player shows its first frame
+    try:
+        poster = render_poster(contribution, source, scale)
+    except (OSError, subprocess.SubprocessError):
+        logger.exception('Could not build a poster for contribution %s', contribution.pk)
+        poster = None
+    if poster:
+        renditions['poster'] = poster
+    return renditions
+
+
+def render_audio(contribution):
+    return _ffmpeg_to_storage(
+        contribution, contribution.audio_content.path, 'audio.m4a',
+        '-vn', '-af', 'loudnorm=I=-16:TP=-1.5:LRA=11', '-c:a', 'aac', '-b:a', AUDIO_BITRATE,
+    )
+
+
+def process(pk):
+    """Build every rendition for one contribution and record the result."""
+    contribution = Contribution.objects.get(pk=pk)
+    renditions = {}
+    status = Contribution.MEDIA_READY
+    can_transcode = shutil.which(FFMPEG) is not None
+    try:
+        if contribution.image_content:
+            renditions['image'] = render_image(contribution)
+        if contribution.video_content and can_transcode:
+            renditions.update(render_video(contribution))
+        if contribution.audio_content and can_transcode:
+            renditions['audio'] = render_audio(contribution)
+    # Not just I/O and ffmpeg errors: Pillow raises DecompressionBombError, ValueError and others on
+    # hostile or odd files, and the contribution must not stay PENDING for process_media to retry forever
+    except Exception:
+        logger.exception('Could not build renditions for contribution %s', pk)
+        status = Contribution.MEDIA_FAILED
+    # update() rather than save() so concurrent counter updates are not overwritten
+    Contribution.objects.filter(pk=pk).update(media_renditions=renditions, media_status=status)
+    cards.invalidate([pk])
+    return renditions
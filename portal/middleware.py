@@ -0,0 +1,164 @@
+# portal/middleware.py
+import random
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import MiddlewareNotUsed
+from django.utils import timezone
+
+from . import database, instrumentation
+from .models import UserProfile
+
+LAST_SEEN_THROTTLE_SECONDS = getattr(settings, 'LAST_SEEN_THROTTLE_SECONDS', 300)
+
+
+class LastSeenMiddleware:
+    """
+    Records when each authenticated user was last active. The write is
+    throttled through the cache so a busy user costs one UPDATE per
+    LAST_SEEN_THROTTLE_SECONDS rather than one per request.
+    """
+
+    sync_capable = async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        response = self.get_response(request)
+        user = getattr(request, 'user', None)
+        if user is not None and user.is_authenticated:
+            if cache.add(f'last-seen:{user.pk}', True, LAST_SEEN_THROTTLE_SECONDS):
+                UserProfile.objects.filter(user_id=user.pk).update(last_seen=timezone.now())
+        return response
+
+    async def __acall__(self, request):
+        response = await self.get_response(request)
+        if not hasattr(request, 'auser'):
+            return response
+        user = await request.auser()
+        if user.is_authenticated:
+            if await cache.aadd(f'last-seen:{user.pk}', True, LAST_SEEN_THROTTLE_SECONDS):
+                await UserProfile.objects.filter(user_id=user.pk).aupdate(last_seen=timezone.now())
+        return response
+
+
+class ReplicaPinningMiddleware:
+    """
+    Routes each request's reads through ``portal.database.ReplicaRouter``.
+    Unsafe methods and browsers carrying the pin cookie read from the
+    primary; a request that writes sets the cookie for
+    DATABASE_REPLICA_STICKY_SECONDS so the user sees their own changes.
+    Only installed when DATABASE_REPLICAS is configured.
+    """
+
+    SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+    sync_capable = async_capable = True
+
+    def __init__(self, get_response):
+        if not database.REPLICAS:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def _pinned(self, request):
+        return request.method not in self.SAFE_METHODS or database.PIN_COOKIE in request.COOKIES
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        with database.routing(self._pinned(request)) as state:
+            response = self.get_response(request)
+        return self._pin(response, state)
+
+    async def __acall__(self, request):
+        # The routing state is a ContextVar, which sync_to_async carries into the ORM's threads
+        with database.routing(self._pinned(request)) as state:
+            response = await self.get_response(request)
+        return self._pin(response, state)
+
+    def _pin(self, response, state):
+        if state.wrote:
+            response.set_cookie(
+                database.PIN_COOKIE, '1', max_age=database.STICKY_SECONDS, httponly=True, samesite='Lax',
+            )
+        return response
+
+
+class InstrumentationMiddleware:
+    """
+    Records per-view timings, query counts and response sizes into
+    ``portal.instrumentation.registry`` and adds a ``Server-Timing`` header.
+    Only installed when INSTRUMENTATION_ENABLED is set; otherwise Django
+    drops it from the chain at startup and it costs nothing.
+    """
+
+    sync_capable = async_capable = True
+
+    def __init__(self, get_response):
+        if not instrumentation.ENABLED:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+        instrumentation.install_template_timer()
+        instrumentation.install_query_recorder()
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        stats = instrumentation.begin()
+        start = time.perf_counter()
+        try:
+            if random.random() < instrumentation.PROFILE_RATE:
+                response = instrumentation.profile(request.path, lambda: self.get_response(request))
+            else:
+                response = self.get_response(request)
+        finally:
+            instrumentation.end(stats)
+        return self._finish(request, response, stats, time.perf_counter() - start)
+
+    async def __acall__(self, request):
+        stats = instrumentation.begin()
+        start = time.perf_counter()
+        try:
+            # Not profiled: cProfile would also see every other request sharing the event loop
+            response = await self.get_response(request)
+        finally:
+            instrumentation.end(stats)
+        return self._finish(request, response, stats, time.perf_counter() - start)
+
+    def _finish(self, request, response, stats, duration):
+        match = getattr(request, 'resolver_match', None)
+        view = match.view_name if match else 'unresolved'
+        if not response.streaming:
+            bytes_sent = len(response.content)
+        elif response.has_header('Content-Length'):
+            bytes_sent = int(response['Content-Length'])
+        else:
+            bytes_sent = 0
+            if not response.is_async:
+                response.streaming_content = self._count_bytes(view, response.streaming_content)
+        instrumentation.registry.record(view, stats, duration, response.status_code, bytes_sent)
+        response['Server-Timing'] = (
+            f'db;desc="{stats.queries} queries";dur={stats.db_time * 1000:.1f}, '
+            f'tpl;dur={stats.template_time * 1000:.1f}, total;dur={duration * 1000:.1f}'
+        )
+        return response
+
+    def _count_bytes(self, view, chunks):
+        sent = 0
+        try:
+            for chunk in chunks:
+                sent += len(chunk)
+                yield chunk
+        finally:
+            instrumentation.registry.add_bytes(view, sent)
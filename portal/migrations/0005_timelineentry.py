@@ -0,0 +1,49 @@
+# Generated by Django 5.2.18 on 2026-10-18 14:43
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+def populate_timelines(apps, schema_editor):
+    """
+    Fan out every existing contribution so current users start with a full home feed.
+    """
+    UserProfile = apps.get_model('portal', 'UserProfile')
+    Contribution = apps.get_model('portal', 'Contribution')
+    TimelineEntry = apps.get_model('portal', 'TimelineEntry')
+    for profile in UserProfile.objects.all():
+        categories = [c for c in profile.followed_categories.split(',') if c]
+        authors = profile.follows.values_list('user_id', flat=True)
+        contributions = Contribution.objects.filter(
+            models.Q(author_id__in=authors) | models.Q(category__in=categories)
+        ).exclude(author_id=profile.user_id).distinct()
+        TimelineEntry.objects.bulk_create(
+            [TimelineEntry(user_id=profile.user_id, contribution_id=c.pk, submitted_at=c.submitted_at) for c in contributions],
+            ignore_conflicts=True,
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('portal', '0004_notification'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TimelineEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('submitted_at', models.DateTimeField()),
+                ('contribution', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='timeline_entries', to='portal.contribution')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='timeline_entries', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['user', '-submitted_at', '-contribution'], name='timeline_user_recent_idx')],
+                'constraints': [models.UniqueConstraint(fields=('user', 'contribution'), name='unique_timeline_entry')],
+            },
+        ),
+        migrations.RunPython(populate_timelines, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,39 @@
+# Generated by Django 5.2.18 on 2026-10-18 14:44
+
+from django.db import migrations, models
+
+
+def populate_counters(apps, schema_editor):
+    """
+    Seed the new counters from the existing likes and comments.
+    """
+    Contribution = apps.get_model('portal', 'Contribution')
+    Comment = apps.get_model('portal', 'Comment')
+    Like = Contribution.likes.through
+    likes = Like.objects.values('contribution_id').annotate(n=models.Count('*')).values_list('contribution_id', 'n')
+    comments = Comment.objects.values('contribution_id').annotate(n=models.Count('*')).values_list('contribution_id', 'n')
+    for pk, n in likes:
+        Contribution.objects.filter(pk=pk).update(likes_count=n)
+    for pk, n in comments:
+        Contribution.objects.filter(pk=pk).update(comments_count=n)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('portal', '0005_timelineentry'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='contribution',
+            name='comments_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='contribution',
+            name='likes_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(populate_counters, migrations.RunPython.noop),
+    ]
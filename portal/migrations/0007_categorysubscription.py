@@ -0,0 +1,58 @@
+# Generated by Django 5.2.18 on 2026-10-18 14:44
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+def copy_followed_categories(apps, schema_editor):
+    """
+    Turn each profile's comma-separated followed_categories into subscription rows.
+    """
+    UserProfile = apps.get_model('portal', 'UserProfile')
+    CategorySubscription = apps.get_model('portal', 'CategorySubscription')
+    valid = {'PLACES', 'DANCE', 'FOOD', 'TRADITION'}
+    subscriptions = [
+        CategorySubscription(user_id=user_id, category=category)
+        for user_id, categories in UserProfile.objects.values_list('user_id', 'followed_categories').iterator()
+        for category in {c.strip() for c in categories.split(',')} & valid
+    ]
+    CategorySubscription.objects.bulk_create(subscriptions, batch_size=1000, ignore_conflicts=True)
+
+
+def restore_followed_categories(apps, schema_editor):
+    UserProfile = apps.get_model('portal', 'UserProfile')
+    CategorySubscription = apps.get_model('portal', 'CategorySubscription')
+    for profile in UserProfile.objects.all():
+        categories = CategorySubscription.objects.filter(user_id=profile.user_id).values_list('category', flat=True)
+        profile.followed_categories = ','.join(sorted(categories))
+        profile.save(update_fields=['followed_categories'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('portal', '0006_contribution_counters'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CategorySubscription',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('category', models.CharField(choices=[('PLACES', 'Places'), ('DANCE', 'Dance'), ('FOOD', 'Food'), ('TRADITION', 'Tradition')], max_length=10)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='category_subscriptions', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['category', 'user'], name='subscription_category_idx')],
+                'constraints': [models.UniqueConstraint(fields=('user', 'category'), name='unique_category_subscription')],
+            },
+        ),
+        migrations.RunPython(copy_followed_categories, restore_followed_categories),
+        migrations.RemoveField(
+            model_name='userprofile',
+            name='followed_categories',
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-18 14:49
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('portal', '0009_userprofile_last_seen'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='contribution',
+            name='media_renditions',
+            field=models.JSONField(blank=True, default=dict, editable=False),
+        ),
+        migrations.AddField(
+            model_name='contribution',
+            name='media_status',
+            field=models.CharField(blank=True, choices=[('PENDING', 'Pending'), ('READY', 'Ready'), ('FAILED', 'Failed')], editable=False, max_length=10),
+        ),
+    ]
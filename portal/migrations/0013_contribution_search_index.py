@@ -0,0 +1,45 @@
+import unicodedata
+
+from django.db import migrations
+
+FTS_TABLE = 'portal_contribution_fts'
+
+
+def create_index(apps, schema_editor):
+    """
+    Create and fill the FTS5 table behind ``portal.search`` (SQLite only).
+    """
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    Contribution = apps.get_model('portal', 'Contribution')
+    labels = dict(Contribution._meta.get_field('category').choices)
+    normalize = lambda text: unicodedata.normalize('NFC', text or '')
+    schema_editor.execute(
+        f'CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5('
+        "text_content, state, category, author, tokenize = 'unicode61 remove_diacritics 2 categories ''L* N* Co M*''')"
+    )
+    rows = Contribution.objects.values_list('id', 'text_content', 'state__name', 'category', 'author__username')
+    with schema_editor.connection.cursor() as cursor:
+        cursor.executemany(
+            f'INSERT INTO {FTS_TABLE} (rowid, text_content, state, category, author) VALUES (%s, %s, %s, %s, %s)',
+            [
+                (pk, normalize(text), normalize(state), f'{category} {labels.get(category, "")}', normalize(author))
+                for pk, text, state, category, author in rows.iterator()
+            ],
+        )
+
+
+def drop_index(apps, schema_editor):
+    if schema_editor.connection.vendor == 'sqlite':
+        schema_editor.execute(f'DROP TABLE IF EXISTS {FTS_TABLE}')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('portal', '0012_notification_actor_count'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_index, drop_index),
+    ]
@@ -0,0 +1,53 @@
+# Generated by Django 5.2.18 on 2026-10-18 15:24
+
+import math
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+def backfill_scores(apps, schema_editor):
+    """
+    Score existing posts as if all their likes and comments arrived with the
+    post; see ``portal.ranking.initial_score``.
+    """
+    Contribution = apps.get_model('portal', 'Contribution')
+    half_life = getattr(settings, 'RANKING_HALF_LIFE_HOURS', 24) * 60 * 60
+    batch = []
+    for post in Contribution.objects.only('id', 'likes_count', 'comments_count', 'submitted_at').iterator():
+        weight = 1 + post.likes_count + 2 * post.comments_count
+        post.trending_score = math.log2(weight) + post.submitted_at.timestamp() / half_life
+        batch.append(post)
+        if len(batch) >= 1000:
+            Contribution.objects.bulk_update(batch, ['trending_score'])
+            batch = []
+    Contribution.objects.bulk_update(batch, ['trending_score'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('portal', '0013_contribution_search_index'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='contribution',
+            name='trending_score',
+            field=models.FloatField(default=0, editable=False),
+        ),
+        migrations.RunPython(backfill_scores, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='contribution',
+            index=models.Index(fields=['-trending_score', '-id'], name='contribution_trending_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='contribution',
+            index=models.Index(fields=['state', '-trending_score', '-id'], name='contribution_state_trend_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='contribution',
+            index=models.Index(fields=['category', '-trending_score', '-id'], name='contribution_cat_trend_idx'),
+        ),
+    ]
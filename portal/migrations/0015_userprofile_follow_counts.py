@@ -0,0 +1,39 @@
+# Generated by Django 5.2.18 on 2026-10-18 16:02
+
+from django.db import migrations, models
+from django.db.models.functions import Coalesce
+
+
+def populate_counts(apps, schema_editor):
+    """
+    Seed the new counters from the existing follows.
+    """
+    UserProfile = apps.get_model('portal', 'UserProfile')
+    Follow = UserProfile.follows.through
+
+    def count(field):
+        rows = Follow.objects.filter(**{field: models.OuterRef('pk')}).order_by().values(field).annotate(n=models.Count('*')).values('n')
+        return Coalesce(models.Subquery(rows), 0)
+
+    UserProfile.objects.update(followers_count=count('to_userprofile'), following_count=count('from_userprofile'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('portal', '0014_contribution_trending_score'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='userprofile',
+            name='followers_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='userprofile',
+            name='following_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(populate_counts, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,43 @@
+# Generated by Django 5.2.18 on 2026-10-18 15:43
+
+import portal.storage
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('portal', '0015_userprofile_follow_counts'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='contribution',
+            name='audio_content',
+            field=models.FileField(blank=True, null=True, storage=portal.storage.blob_storage, upload_to='audio/'),
+        ),
+        migrations.AlterField(
+            model_name='contribution',
+            name='image_content',
+            field=models.ImageField(blank=True, null=True, storage=portal.storage.blob_storage, upload_to='images/'),
+        ),
+        migrations.AlterField(
+            model_name='contribution',
+            name='video_content',
+            field=models.FileField(blank=True, null=True, storage=portal.storage.blob_storage, upload_to='videos/'),
+        ),
+        migrations.CreateModel(
+            name='MediaBlob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=255, unique=True)),
+                ('size', models.PositiveBigIntegerField()),
+                ('ref_count', models.PositiveIntegerField(default=0)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['ref_count', 'updated_at'], name='mediablob_gc_idx')],
+            },
+        ),
+    ]
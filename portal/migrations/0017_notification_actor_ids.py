@@ -0,0 +1,35 @@
+# Generated by Django 5.2.18 on 2026-10-18 19:40
+
+from django.db import migrations, models
+
+
+def populate_actor_ids(apps, schema_editor):
+    """
+    Earlier actors of coalesced rows weren't recorded; start from the latest sender.
+    """
+    Notification = apps.get_model('portal', 'Notification')
+    batch = []
+    for notification in Notification.objects.filter(sender__isnull=False).only('pk', 'sender_id').iterator(chunk_size=1000):
+        notification.actor_ids = [notification.sender_id]
+        batch.append(notification)
+        if len(batch) >= 1000:
+            Notification.objects.bulk_update(batch, ['actor_ids'])
+            batch = []
+    if batch:
+        Notification.objects.bulk_update(batch, ['actor_ids'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('portal', '0016_mediablob'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='notification',
+            name='actor_ids',
+            field=models.JSONField(default=list, editable=False),
+        ),
+        migrations.RunPython(populate_actor_ids, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,41 @@
+import unicodedata
+
+from django.db import migrations
+
+FTS_TABLE = 'portal_contribution_fts'
+
+
+def recreate_index(apps, schema_editor):
+    """
+    Rebuild the FTS5 table so combining marks stay inside tokens (SQLite only).
+    """
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    Contribution = apps.get_model('portal', 'Contribution')
+    labels = dict(Contribution._meta.get_field('category').choices)
+    normalize = lambda text: unicodedata.normalize('NFC', text or '')
+    schema_editor.execute(f'DROP TABLE IF EXISTS {FTS_TABLE}')
+    schema_editor.execute(
+        f'CREATE VIRTUAL TABLE {FTS_TABLE} USING fts5('
+        "text_content, state, category, author, tokenize = 'unicode61 remove_diacritics 2 categories ''L* N* Co M*''')"
+    )
+    rows = Contribution.objects.values_list('id', 'text_content', 'state__name', 'category', 'author__username')
+    with schema_editor.connection.cursor() as cursor:
+        cursor.executemany(
+            f'INSERT INTO {FTS_TABLE} (rowid, text_content, state, category, author) VALUES (%s, %s, %s, %s, %s)',
+            [
+                (pk, normalize(text), normalize(state), f'{category} {labels.get(category, "")}', normalize(author))
+                for pk, text, state, category, author in rows.iterator()
+            ],
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('portal', '0017_notification_actor_ids'),
+    ]
+
+    operations = [
+        migrations.RunPython(recreate_index, migrations.RunPython.noop),
+    ]
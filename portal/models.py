@@ -1,8 +1,24 @@
 # portal/models.py
-from django.db import models
+import uuid
+
+from django.db import IntegrityError, models, transaction
+from django.db.models import Count, F
+from django.db.models.functions import Greatest
 from django.contrib.auth.models import User
+from django.core.files.storage import default_storage
 from django.db.models.signals import post_save
-from django.dispatch import receiver
+from django.dispatch import Signal, receiver
+
+from .storage import blob_storage
+
+# Sent after likes are added or removed, with the ``user`` and the ``added`` and ``removed`` contribution ids
+likes_changed = Signal()
+
+
+def shifted(field, delta):
+    """``field + delta`` for an ``update()``, floored at 0 so a drifted counter can't fail its unsigned check."""
+    return Greatest(F(field) + delta, 0)
+
 
 # ... (State, Contribution, Comment, UserProfile models remain the same) ...
 class State(models.Model):
@@ -10,6 +26,37 @@ class State(models.Model):
     def __str__(self):
         return self.name
 
+class ContributionQuerySet(models.QuerySet):
+    def set_likes(self, user, desired):
+        """
+        Make ``user``'s likes match ``desired`` (``{contribution_id: liked}``)
+        in one transaction. Ids that don't exist are skipped and toggles that
+        are already in effect change nothing, so replaying a batch is safe.
+        Returns ``({contribution_id: (liked, likes_count)}, newly_liked)``
+        where ``newly_liked`` holds the contributions liked by this call.
+        """
+        Like = Contribution.likes.through
+        with transaction.atomic():
+            # A no-op write first: it row-locks the user so two of their batches can't count the same
+            # like twice, and on SQLite takes the write lock before any read, avoiding lock-upgrade deadlocks
+            User.objects.filter(pk=user.pk).update(last_login=F('last_login'))
+            authors = dict(self.filter(pk__in=desired).values_list('pk', 'author_id'))
+            liked = set(
+                Like.objects.filter(user_id=user.pk, contribution_id__in=authors).values_list('contribution_id', flat=True)
+            )
+            to_add = [pk for pk in authors if desired[pk] and pk not in liked]
+            to_remove = [pk for pk in authors if not desired[pk] and pk in liked]
+            if to_remove:
+                Like.objects.filter(user_id=user.pk, contribution_id__in=to_remove).delete()
+                self.filter(pk__in=to_remove).update(likes_count=shifted('likes_count', -1))
+            if to_add:
+                Like.objects.bulk_create([Like(contribution_id=pk, user_id=user.pk) for pk in to_add])
+                self.filter(pk__in=to_add).update(likes_count=shifted('likes_count', 1))
+            counts = dict(self.filter(pk__in=authors).values_list('pk', 'likes_count'))
+            likes_changed.send(sender=Contribution, user=user, added=to_add, removed=to_remove)
+        results = {pk: (bool(desired[pk]), counts[pk]) for pk in authors}
+        return results, [self.model(pk=pk, author_id=authors[pk]) for pk in to_add]
+
 class Contribution(models.Model):
     CATEGORY_CHOICES = [
         ('PLACES', 'Places'),
@@ -17,21 +64,112 @@ class Contribution(models.Model):
         ('FOOD', 'Food'),
         ('TRADITION', 'Tradition'),
     ]
+    MEDIA_PENDING = 'PENDING'
+    MEDIA_READY = 'READY'
+    MEDIA_FAILED = 'FAILED'
+    MEDIA_STATUS_CHOICES = [
+        (MEDIA_PENDING, 'Pending'),
+        (MEDIA_READY, 'Ready'),
+        (MEDIA_FAILED, 'Failed'),
+    ]
     author = models.ForeignKey(User, on_delete=models.CASCADE)
     state = models.ForeignKey(State, on_delete=models.CASCADE)
     category = models.CharField(max_length=10, choices=CATEGORY_CHOICES)
     text_content = models.TextField(blank=True, null=True)
-    image_content = models.ImageField(upload_to='images/', blank=True, null=True)
-    audio_content = models.FileField(upload_to='audio/', blank=True, null=True)
-    video_content = models.FileField(upload_to='videos/', blank=True, null=True)
+    # Stored once per distinct file, by content hash (see portal.storage and portal.blobs)
+    image_content = models.ImageField(upload_to='images/', storage=blob_storage, blank=True, null=True)
+    audio_content = models.FileField(upload_to='audio/', storage=blob_storage, blank=True, null=True)
+    video_content = models.FileField(upload_to='videos/', storage=blob_storage, blank=True, null=True)
     submitted_at = models.DateTimeField(auto_now_add=True)
     likes = models.ManyToManyField(User, related_name='liked_contributions', blank=True)
+    # Denormalized counters, kept in step with F() updates (see reconcile_counters)
+    likes_count = models.PositiveIntegerField(default=0, editable=False)
+    comments_count = models.PositiveIntegerField(default=0, editable=False)
+    # Resized/transcoded copies written by portal.media, keyed by kind
+    media_renditions = models.JSONField(default=dict, blank=True, editable=False)
+    media_status = models.CharField(max_length=10, choices=MEDIA_STATUS_CHOICES, blank=True, editable=False)
+    # Time-decayed popularity in log2 space, maintained by portal.ranking
+    trending_score = models.FloatField(default=0, editable=False)
+
+    objects = ContributionQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            # Keyset feed order, and the same order scoped by each list filter
+            models.Index(fields=['-submitted_at', '-id'], name='contribution_recent_idx'),
+            models.Index(fields=['author', '-submitted_at', '-id'], name='contribution_author_idx'),
+            models.Index(fields=['state', '-submitted_at', '-id'], name='contribution_state_idx'),
+            models.Index(fields=['category', '-submitted_at', '-id'], name='contribution_category_idx'),
+            # Top-K lists of portal.ranking
+            models.Index(fields=['-trending_score', '-id'], name='contribution_trending_idx'),
+            models.Index(fields=['state', '-trending_score', '-id'], name='contribution_state_trend_idx'),
+            models.Index(fields=['category', '-trending_score', '-id'], name='contribution_cat_trend_idx'),
+        ]
 
     def __str__(self):
         return f'{self.author.username} - {self.category} for {self.state.name}'
 
     def total_likes(self):
-        return self.likes.count()
+        return self.likes_count
+
+    def toggle_like(self, user):
+        """Like or unlike for ``user``; returns ``(liked, likes_count)``."""
+        Like = Contribution.likes.through
+        with transaction.atomic():
+            deleted, _ = Like.objects.filter(contribution_id=self.pk, user_id=user.pk).delete()
+            if deleted:
+                liked, delta = False, -1
+            else:
+                try:
+                    with transaction.atomic():
+                        Like.objects.create(contribution_id=self.pk, user_id=user.pk)
+                    liked, delta = True, 1
+                except IntegrityError:
+                    # A concurrent request liked it first; nothing to count
+                    liked, delta = True, 0
+            if delta:
+                Contribution.objects.filter(pk=self.pk).update(likes_count=shifted('likes_count', delta))
+                likes_changed.send(
+                    sender=Contribution, user=user,
+                    added=[self.pk] if delta > 0 else [], removed=[self.pk] if delta < 0 else [],
+                )
+            self.likes_count = Contribution.objects.values_list('likes_count', flat=True).get(pk=self.pk)
+        return liked, self.likes_count
+
+    # --- Media renditions, falling back to the uploaded originals ---
+
+    def image_srcset(self):
+        return ', '.join(
+            f"{default_storage.url(r['name'])} {r['width']}w" for r in self.media_renditions.get('image', [])
+        )
+
+    def display_image_url(self):
+        renditions = self.media_renditions.get('image')
+        if renditions:
+            return default_storage.url(renditions[-1]['name'])
+        return self.image_content.url if self.image_content else ''
+
+    def video_poster_url(self):
+        poster = self.media_renditions.get('poster')
+        return default_storage.url(poster) if poster else ''
+
+    def display_video_url(self):
+        video = self.media_renditions.get('video')
+        if video:
+            return default_storage.url(video)
+        return self.video_content.url if self.video_content else ''
+
+    def display_audio_url(self):
+        audio = self.media_renditions.get('audio')
+        if audio:
+            return default_storage.url(audio)
+        return self.audio_content.url if self.audio_content else ''
+
+    def add_comment(self, author, text):
+        with transaction.atomic():
+            comment = Comment.objects.create(contribution=self, author=author, text=text)
+            Contribution.objects.filter(pk=self.pk).update(comments_count=shifted('comments_count', 1))
+        return comment
 
 class Comment(models.Model):
     contribution = models.ForeignKey(Contribution, on_delete=models.CASCADE, related_name='comments')
@@ -39,22 +177,176 @@ class Comment(models.Model):
     text = models.TextField()
     created_at = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['contribution', 'created_at', 'id'], name='comment_thread_idx'),
+        ]
+
     def __str__(self):
         return f'Comment by {self.author.username} on {self.contribution}'
 
 class UserProfile(models.Model):
     user = models.OneToOneField(User, on_delete=models.CASCADE)
     follows = models.ManyToManyField('self', related_name='followed_by', symmetrical=False, blank=True)
-    followed_categories = models.TextField(blank=True, help_text="Comma-separated list of categories")
+    # Written at most once per LAST_SEEN_THROTTLE_SECONDS by LastSeenMiddleware
+    last_seen = models.DateTimeField(null=True, blank=True, db_index=True)
+    # Kept in step with ``follows`` by portal.graph
+    followers_count = models.PositiveIntegerField(default=0, editable=False)
+    following_count = models.PositiveIntegerField(default=0, editable=False)
 
     def __str__(self):
         return self.user.username
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_values = instance._field_values()
+        return instance
+
+    def _field_values(self):
+        # Only fields already in __dict__, so deferred ones aren't fetched
+        return {field.attname: self.__dict__[field.attname] for field in self._meta.concrete_fields if field.attname in self.__dict__}
+
+    def changed_fields(self):
+        """Names of the fields changed since the row was loaded or saved."""
+        loaded = getattr(self, '_loaded_values', {})
+        return [
+            name for name, value in self._field_values().items()
+            if name != self._meta.pk.attname and (name not in loaded or loaded[name] != value)
+        ]
+
+    def save(self, *args, **kwargs):
+        # A loaded profile writes only what changed (nothing at all if nothing did), so a stale copy,
+        # e.g. from the user cache, can't put back old counters
+        if self.pk and hasattr(self, '_loaded_values') and not args and not kwargs:
+            kwargs['update_fields'] = self.changed_fields()
+        super().save(*args, **kwargs)
+        self._loaded_values = self._field_values()
+
+class CategorySubscriptionQuerySet(models.QuerySet):
+    def subscriber_ids(self, category):
+        return self.filter(category=category).values_list('user_id', flat=True)
+
+    def categories_for(self, user_id):
+        return self.filter(user_id=user_id).values_list('category', flat=True)
+
+    def subscriber_counts(self):
+        counts = dict(self.values('category').annotate(n=Count('*')).values_list('category', 'n'))
+        return {category: counts.get(category, 0) for category, label in Contribution.CATEGORY_CHOICES}
+
+    def set_for(self, user_id, categories):
+        """Make ``categories`` the user's subscriptions; returns ``(added, removed)``."""
+        current = set(self.categories_for(user_id))
+        added, removed = set(categories) - current, current - set(categories)
+        if removed:
+            self.filter(user_id=user_id, category__in=removed).delete()
+        if added:
+            self.bulk_create([self.model(user_id=user_id, category=c) for c in added], ignore_conflicts=True)
+        return added, removed
+
+class CategorySubscription(models.Model):
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='category_subscriptions')
+    category = models.CharField(max_length=10, choices=Contribution.CATEGORY_CHOICES)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    objects = CategorySubscriptionQuerySet.as_manager()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'category'], name='unique_category_subscription'),
+        ]
+        indexes = [
+            models.Index(fields=['category', 'user'], name='subscription_category_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.user_id} follows {self.category}'
+
+class TimelineEntry(models.Model):
+    # A contribution fanned out to a user's home feed when it was posted
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='timeline_entries')
+    contribution = models.ForeignKey(Contribution, on_delete=models.CASCADE, related_name='timeline_entries')
+    # Copied from the contribution so a feed page is a single index range scan
+    submitted_at = models.DateTimeField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'contribution'], name='unique_timeline_entry'),
+        ]
+        indexes = [
+            models.Index(fields=['user', '-submitted_at', '-contribution'], name='timeline_user_recent_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.contribution_id} in {self.user_id}\'s timeline'
+
+class UploadSession(models.Model):
+    # A resumable chunked upload, see portal.uploads
+    OPEN = 'OPEN'
+    COMPLETE = 'COMPLETE'
+    ATTACHED = 'ATTACHED'
+    STATUS_CHOICES = [
+        (OPEN, 'Open'),
+        (COMPLETE, 'Complete'),
+        (ATTACHED, 'Attached'),
+    ]
+    KIND_CHOICES = [
+        ('image', 'Image'),
+        ('audio', 'Audio'),
+        ('video', 'Video'),
+    ]
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='upload_sessions')
+    kind = models.CharField(max_length=5, choices=KIND_CHOICES)
+    filename = models.CharField(max_length=255)
+    content_type = models.CharField(max_length=100)
+    total_size = models.PositiveBigIntegerField()
+    received_size = models.PositiveBigIntegerField(default=0)
+    # Optional checksum of the whole file, verified on completion
+    sha256 = models.CharField(max_length=64, blank=True)
+    status = models.CharField(max_length=8, choices=STATUS_CHOICES, default=OPEN)
+    stored_name = models.CharField(max_length=255, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'updated_at'], name='upload_status_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.filename} ({self.received_size}/{self.total_size})'
+
+class MediaBlob(models.Model):
+    # One file of portal.storage.ContentAddressedStorage; ref_count is kept by portal.blobs
+    name = models.CharField(max_length=255, unique=True)
+    size = models.PositiveBigIntegerField()
+    ref_count = models.PositiveIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+    # Last stored or uploaded again; gc_media leaves recently touched blobs alone
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['ref_count', 'updated_at'], name='mediablob_gc_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.name} ({self.ref_count} refs)'
+
 @receiver(post_save, sender=User)
-def create_or_update_user_profile(sender, instance, created, **kwargs):
+def create_or_update_user_profile(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
     if created:
         UserProfile.objects.create(user=instance)
-    instance.userprofile.save()
+        return
+    # Only a profile already loaded on this user can carry edits; saving the user (e.g. each login's
+    # last_login update) must not fetch the profile just to write it back unchanged
+    if User.userprofile.related.is_cached(instance):
+        profile = User.userprofile.related.get_cached_value(instance)
+        if profile is not None and profile.pk:
+            profile.save()
 
 
 # --- NEW Notification Model ---
@@ -65,6 +357,10 @@ class Notification(models.Model):
     sender = models.ForeignKey(User, on_delete=models.CASCADE, null=True, related_name='+')
     # The type of notification
     verb = models.CharField(max_length=255)
+    # How many people this (coalesced) notification stands for; sender is the latest
+    actor_count = models.PositiveIntegerField(default=1)
+    # Their distinct user ids, so a repeat actor isn't counted again
+    actor_ids = models.JSONField(default=list, editable=False)
     # A link to the relevant object (e.g., the post that was liked)
     target = models.ForeignKey(Contribution, on_delete=models.CASCADE, null=True, blank=True)
     # Read/unread status
@@ -74,5 +370,13 @@ class Notification(models.Model):
     def __str__(self):
         return f'{self.sender} -> {self.recipient}: {self.verb}'
 
+    @property
+    def other_actors(self):
+        return self.actor_count - 1
+
     class Meta:
         ordering = ['-timestamp']
+        indexes = [
+            models.Index(fields=['recipient', 'is_read', '-timestamp'], name='notification_inbox_idx'),
+            models.Index(fields=['recipient', '-timestamp'], name='notification_recent_idx'),
+        ]
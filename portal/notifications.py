@@ -0,0 +1,237 @@
+# portal/notifications.py
+"""
+Notification pipeline.
+
+Views call ``notify()``; events are queued once the surrounding transaction
+commits and a background writer thread flushes them in batches. Within a
+batch, and against unread notifications from the last
+``NOTIFICATION_COALESCE_HOURS``, events with the same recipient, verb and
+target are merged into one row ("X and 41 others liked your post").
+
+Each user's unread count is kept in the cache and adjusted as rows are
+created or read, so the navigation badge costs no query. New notifications
+and unread counts are also pushed to open pages, see ``portal.realtime``.
+"""
+import logging
+import queue
+import threading
+from datetime import timedelta
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db import close_old_connections, transaction
+from django.utils import timezone
+
+from . import realtime
+from .models import Notification
+from .pagination import after_cursor, clamp_page_size, split_page
+
+logger = logging.getLogger(__name__)
+
+ASYNC = getattr(settings, 'NOTIFICATIONS_ASYNC', True)
+BATCH_SIZE = getattr(settings, 'NOTIFICATION_BATCH_SIZE', 200)
+FLUSH_INTERVAL = getattr(settings, 'NOTIFICATION_FLUSH_INTERVAL', 0.5)
+COALESCE_WINDOW = timedelta(hours=getattr(settings, 'NOTIFICATION_COALESCE_HOURS', 24))
+UNREAD_CACHE_SECONDS = getattr(settings, 'NOTIFICATION_UNREAD_CACHE_SECONDS', 60 * 60)
+
+_queue = queue.Queue()
+_writer = None
+_writer_lock = threading.Lock()
+
+
+def notify(recipient_id, sender_id, verb, target_id=None):
+    """Queue a notification for writing after the current transaction commits."""
+    if recipient_id == sender_id:
+        return
+    event = (recipient_id, sender_id, verb, target_id)
+    transaction.on_commit(lambda: _enqueue(event))
+
+
+def _enqueue(event):
+    if not ASYNC:
+        write_batch([event])
+        return
+    _queue.put(event)
+    _ensure_writer()
+
+
+def _ensure_writer():
+    global _writer
+    with _writer_lock:
+        if _writer is None or not _writer.is_alive():
+            _writer = threading.Thread(target=_write_forever, name='notification-writer', daemon=True)
+            _writer.start()
+
+
+def _write_forever():
+    while True:
+        batch = [_queue.get()]
+        try:
+            while len(batch) < BATCH_SIZE:
+                batch.append(_queue.get(timeout=FLUSH_INTERVAL))
+        except queue.Empty:
+            pass
+        try:
+            write_batch(batch)
+        except Exception:
+            logger.exception('Dropped a batch of %d notifications', len(batch))
+        finally:
+            close_old_connections()
+
+
+def flush():
+    """Write everything queued so far in the calling thread (used by tests and shutdown hooks)."""
+    batch = []
+    while True:
+        try:
+            batch.append(_queue.get_nowait())
+        except queue.Empty:
+            break
+    if batch:
+        write_batch(batch)
+
+
+def write_batch(events):
+    """Coalesce ``events`` and write them, merging into recent unread rows where possible."""
+    groups = {}
+    for recipient_id, sender_id, verb, target_id in events:
+        senders = groups.setdefault((recipient_id, verb, target_id), [])
+        if sender_id in senders:
+            senders.remove(sender_id)
+        senders.append(sender_id)
+
+    now = timezone.now()
+    with transaction.atomic():
+        candidates = Notification.objects.filter(
+            recipient_id__in={key[0] for key in groups},
+            verb__in={key[1] for key in groups},
+            is_read=False,
+            timestamp__gte=now - COALESCE_WINDOW,
+        ).order_by('timestamp')
+        existing = {(n.recipient_id, n.verb, n.target_id): n for n in candidates}
+
+        merged, created = [], []
+        for key, senders in groups.items():
+            recipient_id, verb, target_id = key
+            notification = existing.get(key)
+            if notification is None:
+                created.append(Notification(
+                    recipient_id=recipient_id, sender_id=senders[-1], verb=verb, target_id=target_id,
+                    actor_count=len(senders), actor_ids=senders,
+                ))
+                continue
+            known = set(notification.actor_ids)
+            new_senders = [s for s in senders if s not in known]
+            if not new_senders:
+                continue
+            notification.actor_ids += new_senders
+            notification.actor_count += len(new_senders)
+            notification.sender_id = new_senders[-1]
+            notification.timestamp = now
+            merged.append(notification)
+        if merged:
+            Notification.objects.bulk_update(merged, ['sender', 'actor_count', 'actor_ids', 'timestamp'])
+        if created:
+            Notification.objects.bulk_create(created)
+
+    new_per_recipient = {}
+    for notification in created:
+        new_per_recipient[notification.recipient_id] = new_per_recipient.get(notification.recipient_id, 0) + 1
+    for recipient_id, count in new_per_recipient.items():
+        _adjust_unread(recipient_id, count)
+    _push(merged + created)
+    return merged, created
+
+
+def describe(notification, sender_name):
+    others = notification.actor_count - 1
+    if others:
+        sender_name = f'{sender_name} and {others} other{"s" if others > 1 else ""}'
+    return f'{sender_name} {notification.verb}'
+
+
+def _push(rows):
+    if not rows:
+        return
+    names = dict(User.objects.filter(pk__in={n.sender_id for n in rows}).values_list('id', 'username'))
+    for notification in rows:
+        realtime.publish(realtime.user_channel(notification.recipient_id), 'notification', {
+            'id': notification.pk,
+            'text': describe(notification, names.get(notification.sender_id, '')),
+        })
+    for recipient_id in {n.recipient_id for n in rows}:
+        _push_unread(recipient_id)
+
+
+def _push_unread(user_id):
+    realtime.publish(realtime.user_channel(user_id), 'unread', {'count': unread_count(user_id)})
+
+
+# --- Reads ---
+
+def _page_queryset(user_id, cursor, page_size):
+    queryset = after_cursor(Notification.objects.filter(recipient_id=user_id), cursor, time_field='timestamp')
+    return queryset.select_related('sender').defer('actor_ids').order_by('-timestamp', '-id')[:page_size + 1]
+
+
+def page(user_id, cursor=None, page_size=None):
+    """One keyset page of a user's notifications as ``(items, next_cursor)``."""
+    page_size = clamp_page_size(page_size)
+    items = list(_page_queryset(user_id, cursor, page_size))
+    return split_page(items, page_size, key=lambda n: (n.timestamp, n.pk))
+
+
+async def apage(user_id, cursor=None, page_size=None):
+    page_size = clamp_page_size(page_size)
+    items = [n async for n in _page_queryset(user_id, cursor, page_size)]
+    return split_page(items, page_size, key=lambda n: (n.timestamp, n.pk))
+
+
+# --- Unread counts ---
+
+def _unread_key(user_id):
+    return f'notifications:unread:{user_id}'
+
+
+def _adjust_unread(user_id, delta):
+    try:
+        cache.incr(_unread_key(user_id), delta)
+    except ValueError:
+        # Not cached yet; the next unread_count() call recomputes it
+        pass
+
+
+def unread_count(user_id):
+    count = cache.get(_unread_key(user_id))
+    if count is None:
+        count = Notification.objects.filter(recipient_id=user_id, is_read=False).count()
+        cache.set(_unread_key(user_id), count, UNREAD_CACHE_SECONDS)
+    return max(count, 0)
+
+
+def prune(older_than_days, batch_size=1000):
+    """Delete read notifications older than ``older_than_days``; returns how many went."""
+    cutoff = timezone.now() - timedelta(days=older_than_days)
+    stale = Notification.objects.filter(is_read=True, timestamp__lt=cutoff)
+    deleted = 0
+    while True:
+        ids = list(stale.values_list('id', flat=True)[:batch_size])
+        if not ids:
+            return deleted
+        deleted += Notification.objects.filter(id__in=ids).delete()[0]
+
+
+def mark_read(notification):
+    if Notification.objects.filter(pk=notification.pk, is_read=False).update(is_read=True):
+        _adjust_unread(notification.recipient_id, -1)
+        _push_unread(notification.recipient_id)
+    notification.is_read = True
+
+
+def mark_all_read(user_id):
+    updated = Notification.objects.filter(recipient_id=user_id, is_read=False).update(is_read=True)
+    cache.set(_unread_key(user_id), 0, UNREAD_CACHE_SECONDS)
+    if updated:
+        _push_unread(user_id)
+    return updated
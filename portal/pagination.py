@@ -0,0 +1,55 @@
+# portal/pagination.py
+"""Opaque keyset cursors over (timestamp, id) orderings."""
+import base64
+import binascii
+from datetime import datetime
+
+from django.conf import settings
+from django.db.models import Q
+
+PAGE_SIZE = getattr(settings, 'FEED_PAGE_SIZE', 20)
+MAX_PAGE_SIZE = getattr(settings, 'FEED_MAX_PAGE_SIZE', 50)
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def encode_cursor(timestamp, pk):
+    raw = f'{timestamp.isoformat()}|{pk}'.encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        timestamp, pk = base64.urlsafe_b64decode(padded).decode().split('|')
+        return datetime.fromisoformat(timestamp), int(pk)
+    except (binascii.Error, UnicodeDecodeError, ValueError) as exc:
+        raise InvalidCursor(cursor) from exc
+
+
+def after_cursor(queryset, cursor, time_field='submitted_at', pk_field='id'):
+    """Restrict a queryset ordered by (-time_field, -pk_field) to rows past ``cursor``."""
+    if not cursor:
+        return queryset
+    timestamp, pk = decode_cursor(cursor)
+    return queryset.filter(
+        Q(**{f'{time_field}__lt': timestamp}) | Q(**{time_field: timestamp, f'{pk_field}__lt': pk})
+    )
+
+
+def clamp_page_size(page_size):
+    try:
+        page_size = int(page_size or PAGE_SIZE)
+    except (TypeError, ValueError):
+        page_size = PAGE_SIZE
+    return max(1, min(page_size, MAX_PAGE_SIZE))
+
+
+def split_page(rows, page_size, key):
+    """Trim the look-ahead row off ``rows`` and return ``(rows, next_cursor)``."""
+    if len(rows) <= page_size:
+        return rows, None
+    rows = rows[:page_size]
+    return rows, encode_cursor(*key(rows[-1]))
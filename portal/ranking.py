@@ -0,0 +1,314 @@
+# portal/ranking.py
+"""
+Trending scores and precomputed "popular" lists.
+
+Every new post, like and comment adds weight to its contribution's score,
+and weight halves every ``RANKING_HALF_LIFE_HOURS``. Instead of decaying
+every row as time passes, ``Contribution.trending_score`` holds the log2 of
+the total weight expressed at a fixed epoch: an event of weight ``w`` at
+time ``t`` adds ``w * 2 ** (t / half_life)``. A row only changes when
+something happens to it, and comparing two stored scores compares their
+decayed popularity at any later moment, so the column can be indexed.
+
+Events are applied after commit in batches by a background thread, like the
+notification writer, so a burst of likes on one post becomes one update.
+Each batch also merges the changed posts into the top-K lists kept in the
+cache:
+
+* ``trending``, ``state-<id>`` and ``category-<code>``, by score
+* ``week``, posts of the last seven days by likes and weighted comments
+
+Reading a list is one cache hit. A list missing from the cache is rebuilt
+from the indexed columns, and ``rebuild_rankings`` rebuilds them all; run it
+every few minutes so unlikes, expired posts and lists updated by other
+processes don't drift for long.
+"""
+import logging
+import math
+import queue
+import threading
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import close_old_connections, transaction
+from django.db.models import F
+from django.db.models.signals import post_save
+from django.dispatch import receiver
+from django.utils import timezone
+
+from .models import Comment, Contribution, State, likes_changed
+from .pagination import InvalidCursor, clamp_page_size
+
+logger = logging.getLogger(__name__)
+
+ASYNC = getattr(settings, 'RANKING_ASYNC', True)
+HALF_LIFE = getattr(settings, 'RANKING_HALF_LIFE_HOURS', 24) * 60 * 60
+TOP_K = getattr(settings, 'RANKING_TOP_K', 100)
+LIST_CACHE_SECONDS = getattr(settings, 'RANKING_CACHE_SECONDS', 10 * 60)
+BATCH_SIZE = getattr(settings, 'RANKING_BATCH_SIZE', 500)
+FLUSH_INTERVAL = getattr(settings, 'RANKING_FLUSH_INTERVAL', 0.5)
+WEIGHTS = {'post': 1.0, 'like': 1.0, 'comment': 2.0}
+WEEK = timedelta(days=7)
+
+_queue = queue.Queue()
+_scorer = None
+_scorer_lock = threading.Lock()
+_lists_lock = threading.Lock()
+
+
+# --- Scores ---
+
+def add_weight(score, weight, at):
+    """``score`` after adding ``weight`` (negative to take it away) at unix time ``at``."""
+    now = at / HALF_LIFE
+    if weight > 0:
+        high, low = max(score, now + math.log2(weight)), min(score, now + math.log2(weight))
+        return high + math.log2(1 + 2 ** (low - high))
+    # Subtract in linear terms relative to now; scores are never more than a few hundred above it
+    remaining = 2 ** (score - now) + weight
+    if remaining <= 0:
+        return min(score, now - 64)
+    return now + math.log2(remaining)
+
+
+def initial_score(likes_count, comments_count, submitted_at):
+    """A score for existing counters, as if every like and comment arrived with the post."""
+    weight = WEIGHTS['post'] + likes_count * WEIGHTS['like'] + comments_count * WEIGHTS['comment']
+    return math.log2(weight) + submitted_at.timestamp() / HALF_LIFE
+
+
+def rescore(batch_size=1000):
+    """Reset every score to ``initial_score``, e.g. after bulk imports that skipped the signals."""
+    batch, total = [], 0
+    for post in Contribution.objects.only('id', 'likes_count', 'comments_count', 'submitted_at').iterator():
+        post.trending_score = initial_score(post.likes_count, post.comments_count, post.submitted_at)
+        batch.append(post)
+        if len(batch) >= batch_size:
+            total += len(batch)
+            Contribution.objects.bulk_update(batch, ['trending_score'])
+            batch = []
+    Contribution.objects.bulk_update(batch, ['trending_score'])
+    return total + len(batch)
+
+
+def engagement(likes_count, comments_count):
+    return likes_count * WEIGHTS['like'] + comments_count * WEIGHTS['comment']
+
+
+# --- Events ---
+
+def record(contribution_id, weight):
+    """Queue ``weight`` for a contribution's score once the current transaction commits."""
+    event = (contribution_id, weight, time.time())
+    transaction.on_commit(lambda: _enqueue(event))
+
+
+def _enqueue(event):
+    if not ASYNC:
+        apply([event])
+        return
+    _queue.put(event)
+    _ensure_scorer()
+
+
+def _ensure_scorer():
+    global _scorer
+    with _scorer_lock:
+        if _scorer is None or not _scorer.is_alive():
+            _scorer = threading.Thread(target=_score_forever, name='ranking-scorer', daemon=True)
+            _scorer.start()
+
+
+def _score_forever():
+    while True:
+        batch = [_queue.get()]
+        try:
+            while len(batch) < BATCH_SIZE:
+                batch.append(_queue.get(timeout=FLUSH_INTERVAL))
+        except queue.Empty:
+            pass
+        try:
+            apply(batch)
+        except Exception:
+            logger.exception('Dropped a batch of %d ranking events', len(batch))
+        finally:
+            close_old_connections()
+
+
+def flush():
+    """Apply everything queued so far in the calling thread (used by tests and shutdown hooks)."""
+    batch = []
+    while True:
+        try:
+            batch.append(_queue.get_nowait())
+        except queue.Empty:
+            break
+    if batch:
+        apply(batch)
+
+
+def apply(events):
+    """Fold ``(contribution_id, weight, at)`` events into scores and the cached lists."""
+    events = sorted(events, key=lambda event: event[2])
+    ids = {pk for pk, weight, at in events}
+    with transaction.atomic():
+        # A no-op write first row-locks the posts (and takes SQLite's write lock before reading)
+        Contribution.objects.filter(pk__in=ids).update(trending_score=F('trending_score'))
+        rows = {
+            row.pk: row for row in Contribution.objects.filter(pk__in=ids).only(
+                'id', 'state_id', 'category', 'submitted_at', 'likes_count', 'comments_count', 'trending_score',
+            )
+        }
+        for pk, weight, at in events:
+            if pk in rows:
+                rows[pk].trending_score = add_weight(rows[pk].trending_score, weight, at)
+        Contribution.objects.bulk_update(rows.values(), ['trending_score'])
+    _merge(rows.values())
+    return len(rows)
+
+
+@receiver(post_save, sender=Contribution, dispatch_uid='ranking-new-contribution')
+def score_new_contribution(sender, instance, created=False, raw=False, **kwargs):
+    if created and not raw:
+        record(instance.pk, WEIGHTS['post'])
+
+
+@receiver(post_save, sender=Comment, dispatch_uid='ranking-new-comment')
+def score_new_comment(sender, instance, created=False, raw=False, **kwargs):
+    if created and not raw:
+        record(instance.contribution_id, WEIGHTS['comment'])
+
+
+@receiver(likes_changed, sender=Contribution, dispatch_uid='ranking-likes')
+def score_likes(sender, added=(), removed=(), **kwargs):
+    for pk in added:
+        record(pk, WEIGHTS['like'])
+    for pk in removed:
+        record(pk, -WEIGHTS['like'])
+
+
+# --- Top-K lists ---
+
+def _key(name):
+    return f'ranking:{name}'
+
+
+def _list_queryset(name):
+    """The posts and sort key behind list ``name``; raises ``KeyError`` for unknown names."""
+    if name == 'trending':
+        return Contribution.objects.all(), 'trending_score'
+    if name == 'week':
+        since = timezone.now() - WEEK
+        queryset = Contribution.objects.filter(submitted_at__gte=since).annotate(
+            engagement=F('likes_count') * WEIGHTS['like'] + F('comments_count') * WEIGHTS['comment'],
+        )
+        return queryset, 'engagement'
+    kind, _, value = name.partition('-')
+    if kind == 'state' and value.isdigit():
+        return Contribution.objects.filter(state_id=int(value)), 'trending_score'
+    if kind == 'category' and value in dict(Contribution.CATEGORY_CHOICES):
+        return Contribution.objects.filter(category=value), 'trending_score'
+    raise KeyError(name)
+
+
+def is_list(name):
+    try:
+        _list_queryset(name)
+    except KeyError:
+        return False
+    return True
+
+
+def list_names():
+    return (
+        ['trending', 'week']
+        + [f'state-{pk}' for pk in State.objects.values_list('pk', flat=True)]
+        + [f'category-{code}' for code, label in Contribution.CATEGORY_CHOICES]
+    )
+
+
+def states():
+    """``(id, name)`` of every state, for the "Top in <State>" picker."""
+    return cache.get_or_set(
+        _key('states'), lambda: list(State.objects.order_by('name').values_list('id', 'name')), LIST_CACHE_SECONDS,
+    )
+
+
+def title(name):
+    if name == 'trending':
+        return 'Trending'
+    if name == 'week':
+        return 'Top this week'
+    kind, _, value = name.partition('-')
+    if kind == 'state':
+        return f'Top in {dict(states()).get(int(value), "this state")}'
+    return f'Top in {dict(Contribution.CATEGORY_CHOICES)[value]}'
+
+
+def rebuild(name):
+    """Recompute list ``name`` from the database and cache it."""
+    queryset, order = _list_queryset(name)
+    rows = queryset.order_by(F(order).desc(), '-id').values_list(order, 'id', 'submitted_at')[:TOP_K]
+    entries = [(float(score), pk, submitted_at.timestamp()) for score, pk, submitted_at in rows]
+    cache.set(_key(name), entries, LIST_CACHE_SECONDS)
+    return entries
+
+
+def rebuild_all():
+    names = list_names()
+    for name in names:
+        rebuild(name)
+    return names
+
+
+def _entries(name):
+    entries = cache.get(_key(name))
+    if entries is None:
+        entries = rebuild(name)
+    if name == 'week':
+        since = (timezone.now() - WEEK).timestamp()
+        entries = [entry for entry in entries if entry[2] >= since]
+    return entries
+
+
+def top_ids(name, limit=TOP_K):
+    """Ids of the top ``limit`` posts of list ``name``, best first."""
+    return [pk for score, pk, submitted_at in _entries(name)[:limit]]
+
+
+def page_ids(name, cursor=None, page_size=None):
+    """One page of list ``name`` as ``(ids, next_cursor)``; the cursor is an offset into the list."""
+    page_size = clamp_page_size(page_size)
+    if cursor and not cursor.isdigit():
+        raise InvalidCursor(cursor)
+    offset = int(cursor or 0)
+    ids = top_ids(name)
+    end = offset + page_size
+    return ids[offset:end], str(end) if end < len(ids) else None
+
+
+def _merge(rows):
+    """Merge freshly scored rows into whichever cached lists they belong to."""
+    week_since = (timezone.now() - WEEK).timestamp()
+    updates = {}
+    for row in rows:
+        submitted_at = row.submitted_at.timestamp()
+        entry = (row.trending_score, row.pk, submitted_at)
+        for name in ('trending', f'state-{row.state_id}', f'category-{row.category}'):
+            updates.setdefault(name, []).append(entry)
+        if submitted_at >= week_since:
+            updates.setdefault('week', []).append(
+                (engagement(row.likes_count, row.comments_count), row.pk, submitted_at)
+            )
+    with _lists_lock:
+        for name, changed in updates.items():
+            entries = cache.get(_key(name))
+            if entries is None:
+                # Rebuilt from the database on the next read
+                continue
+            merged = {pk: (score, pk, submitted_at) for score, pk, submitted_at in entries}
+            merged.update((entry[1], entry) for entry in changed)
+            top = sorted(merged.values(), key=lambda entry: (entry[0], entry[1]), reverse=True)[:TOP_K]
+            cache.set(_key(name), top, LIST_CACHE_SECONDS)
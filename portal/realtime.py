@@ -0,0 +1,175 @@
+# portal/realtime.py
+"""
+Server-sent events for live notifications and post counters.
+
+Browsers hold one ``EventSource`` connection to ``events/`` (served by an
+async view, so run the project under an ASGI server such as uvicorn or
+daphne) and receive:
+
+* ``unread`` and ``notification`` events on their ``user:<id>`` channel
+* ``counts`` events on ``post:<id>`` for every post currently on screen
+
+Events are fanned out by a broker. ``InProcessBroker`` is enough for a
+single worker process; with several workers set ``REALTIME_BROKER`` to
+``'portal.realtime.RedisBroker'`` and ``REALTIME_BROKER_URL`` to a Redis
+URL so a publish in one process reaches subscribers in all of them.
+"""
+import asyncio
+import json
+import logging
+import threading
+from collections import defaultdict
+
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+from .models import Contribution
+
+logger = logging.getLogger(__name__)
+
+BROKER = getattr(settings, 'REALTIME_BROKER', 'portal.realtime.InProcessBroker')
+BROKER_URL = getattr(settings, 'REALTIME_BROKER_URL', None)
+HEARTBEAT_SECONDS = getattr(settings, 'REALTIME_HEARTBEAT_SECONDS', 15)
+MAX_POSTS = getattr(settings, 'REALTIME_MAX_POSTS', 100)
+QUEUE_SIZE = 100
+
+
+def user_channel(user_id):
+    return f'user:{user_id}'
+
+
+def post_channel(contribution_id):
+    return f'post:{contribution_id}'
+
+
+# --- Brokers ---
+
+class _LocalSubscription:
+    def __init__(self, broker, channels, loop):
+        self.broker = broker
+        self.channels = channels
+        self.loop = loop
+        self.queue = asyncio.Queue(maxsize=QUEUE_SIZE)
+
+    def deliver(self, message):
+        # Called from whichever thread published; hand over to the subscriber's loop
+        try:
+            self.loop.call_soon_threadsafe(self._put, message)
+        except RuntimeError:
+            self.broker.unsubscribe(self)
+
+    def _put(self, message):
+        try:
+            self.queue.put_nowait(message)
+        except asyncio.QueueFull:
+            # A stalled client only loses intermediate updates; later events carry the current state
+            pass
+
+    async def get(self, timeout):
+        try:
+            return await asyncio.wait_for(self.queue.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+    async def close(self):
+        self.broker.unsubscribe(self)
+
+
+class InProcessBroker:
+    """Delivers events to subscribers in the current process only."""
+
+    def __init__(self, url=None):
+        self._subscribers = defaultdict(set)
+        self._lock = threading.Lock()
+
+    def publish(self, channel, event, data):
+        with self._lock:
+            subscribers = list(self._subscribers.get(channel, ()))
+        for subscription in subscribers:
+            subscription.deliver((event, data))
+
+    async def subscribe(self, channels):
+        subscription = _LocalSubscription(self, channels, asyncio.get_running_loop())
+        with self._lock:
+            for channel in channels:
+                self._subscribers[channel].add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            for channel in subscription.channels:
+                subscribers = self._subscribers.get(channel)
+                if subscribers is not None:
+                    subscribers.discard(subscription)
+                    if not subscribers:
+                        del self._subscribers[channel]
+
+
+class _RedisSubscription:
+    def __init__(self, client, pubsub):
+        self.client = client
+        self.pubsub = pubsub
+
+    async def get(self, timeout):
+        message = await self.pubsub.get_message(ignore_subscribe_messages=True, timeout=timeout)
+        if message is None:
+            return None
+        payload = json.loads(message['data'])
+        return payload['event'], payload['data']
+
+    async def close(self):
+        await self.pubsub.aclose()
+        await self.client.aclose()
+
+
+class RedisBroker:
+    """Delivers events across processes through Redis pub/sub (needs the ``redis`` package)."""
+
+    def __init__(self, url=None):
+        import redis
+
+        self.url = url or 'redis://localhost:6379/0'
+        self._client = redis.Redis.from_url(self.url)
+
+    def publish(self, channel, event, data):
+        self._client.publish(channel, json.dumps({'event': event, 'data': data}))
+
+    async def subscribe(self, channels):
+        from redis import asyncio as aioredis
+
+        client = aioredis.Redis.from_url(self.url)
+        pubsub = client.pubsub()
+        await pubsub.subscribe(*channels)
+        return _RedisSubscription(client, pubsub)
+
+
+_broker = None
+_broker_lock = threading.Lock()
+
+
+def get_broker():
+    global _broker
+    with _broker_lock:
+        if _broker is None:
+            _broker = import_string(BROKER)(BROKER_URL)
+    return _broker
+
+
+# --- Publishing ---
+
+def publish(channel, event, data):
+    try:
+        get_broker().publish(channel, event, data)
+    except Exception:
+        # Live updates are best effort; the page is still correct on reload
+        logger.exception('Could not publish %s event on %s', event, channel)
+
+
+def publish_counts(contribution_id):
+    counts = Contribution.objects.filter(pk=contribution_id).values('likes_count', 'comments_count').first()
+    if counts is not None:
+        publish(post_channel(contribution_id), 'counts', {'id': contribution_id, **counts})
+
+
+def format_event(event, data):
+    return f'event: {event}\ndata: {json.dumps(data)}\n\n'
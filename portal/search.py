@@ -0,0 +1,250 @@
+# portal/search.py
+"""
+Full-text search over contributions.
+
+On SQLite the index is an FTS5 table, ``portal_contribution_fts``, keyed by
+contribution id and holding the post text, state name, category and author
+username. It uses the ``unicode61`` tokenizer with combining marks (``M*``)
+added to its token characters: by default it only keeps letters, numbers and
+private-use characters, so Telugu and other Indic vowel signs and viramas
+would split words into bare consonants. Text and queries are NFC-normalized
+first so differently composed input still matches. Results
+are ranked with ``bm25`` (author, state and category matches weigh more than
+body text) and paginated with a ``(score, id)`` keyset cursor.
+
+The index is updated from model signals as contributions, states and
+usernames change; ``rebuild_search_index`` recreates it from scratch. Other
+databases fall back to ``SimpleBackend``'s ``icontains`` matching until a
+native backend is configured with ``SEARCH_BACKEND``.
+"""
+import base64
+import binascii
+import unicodedata
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db import connection, transaction
+from django.db.models import Q
+from django.db.models.expressions import RawSQL
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from django.utils.module_loading import import_string
+
+from .models import Contribution, State
+from .pagination import InvalidCursor, after_cursor, clamp_page_size, split_page
+
+BACKEND = getattr(settings, 'SEARCH_BACKEND', None)
+FTS_TABLE = 'portal_contribution_fts'
+# bm25 weights for (text_content, state, category, author)
+WEIGHTS = (1.0, 2.0, 2.0, 3.0)
+MAX_TERMS = 10
+BATCH_SIZE = 500
+
+
+def normalize(text):
+    return unicodedata.normalize('NFC', text or '')
+
+
+def _documents(contribution_ids):
+    labels = dict(Contribution.CATEGORY_CHOICES)
+    rows = Contribution.objects.filter(pk__in=contribution_ids).values_list(
+        'id', 'text_content', 'state__name', 'category', 'author__username',
+    )
+    for pk, text, state, category, author in rows:
+        yield pk, normalize(text), normalize(state), f'{category} {labels.get(category, "")}', normalize(author)
+
+
+def _encode_cursor(score, pk):
+    return base64.urlsafe_b64encode(f'{score!r}|{pk}'.encode()).decode().rstrip('=')
+
+
+def _decode_cursor(cursor):
+    try:
+        score, pk = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode().split('|')
+        return float(score), int(pk)
+    except (binascii.Error, UnicodeDecodeError, ValueError) as exc:
+        raise InvalidCursor(cursor) from exc
+
+
+# --- Backends ---
+
+class SQLiteFTSBackend:
+    def match_expression(self, query):
+        """Turn free text into a safe FTS5 expression: every term must match, the last as a prefix."""
+        terms = normalize(query).split()[:MAX_TERMS]
+        if not terms:
+            return None
+        quoted = ['"{}"'.format(term.replace('"', '""')) for term in terms]
+        quoted[-1] += '*'
+        return ' '.join(quoted)
+
+    def create(self, cursor):
+        cursor.execute(
+            f'CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5('
+            "text_content, state, category, author, tokenize = 'unicode61 remove_diacritics 2 categories ''L* N* Co M*''')"
+        )
+
+    def index(self, contribution_ids):
+        contribution_ids = list(contribution_ids)
+        with connection.cursor() as cursor:
+            for start in range(0, len(contribution_ids), BATCH_SIZE):
+                batch = contribution_ids[start:start + BATCH_SIZE]
+                cursor.execute(
+                    f'DELETE FROM {FTS_TABLE} WHERE rowid IN ({", ".join(["%s"] * len(batch))})', batch,
+                )
+                cursor.executemany(
+                    f'INSERT INTO {FTS_TABLE} (rowid, text_content, state, category, author) VALUES (%s, %s, %s, %s, %s)',
+                    list(_documents(batch)),
+                )
+
+    def remove(self, contribution_ids):
+        contribution_ids = list(contribution_ids)
+        if contribution_ids:
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    f'DELETE FROM {FTS_TABLE} WHERE rowid IN ({", ".join(["%s"] * len(contribution_ids))})',
+                    contribution_ids,
+                )
+
+    def rebuild(self):
+        with connection.cursor() as cursor:
+            cursor.execute(f'DROP TABLE IF EXISTS {FTS_TABLE}')
+            self.create(cursor)
+        self.index(Contribution.objects.values_list('id', flat=True).iterator())
+
+    def filter(self, queryset, query):
+        expression = self.match_expression(query)
+        if expression is None:
+            return queryset
+        return queryset.filter(pk__in=RawSQL(f'SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s', [expression]))
+
+    def search(self, query, state_id=None, category=None, cursor=None, page_size=None):
+        """One ranked page of contribution ids matching ``query`` and the next cursor."""
+        expression = self.match_expression(query)
+        if expression is None:
+            return [], None
+        page_size = clamp_page_size(page_size)
+        weights = ', '.join(str(weight) for weight in WEIGHTS)
+        conditions, params = [f'{FTS_TABLE} MATCH %s'], [expression]
+        if state_id:
+            conditions.append('c.state_id = %s')
+            params.append(state_id)
+        if category:
+            conditions.append('c.category = %s')
+            params.append(category)
+        keyset = ''
+        if cursor:
+            score, pk = _decode_cursor(cursor)
+            keyset = 'WHERE score > %s OR (score = %s AND id > %s)'
+            params += [score, score, pk]
+        sql = (
+            f'SELECT id, score FROM ('
+            f'SELECT c.id AS id, bm25({FTS_TABLE}, {weights}) AS score FROM {FTS_TABLE} '
+            f'JOIN {Contribution._meta.db_table} c ON c.id = {FTS_TABLE}.rowid '
+            f'WHERE {" AND ".join(conditions)}'
+            f') {keyset} ORDER BY score, id LIMIT %s'
+        )
+        with connection.cursor() as db_cursor:
+            db_cursor.execute(sql, params + [page_size + 1])
+            rows = db_cursor.fetchall()
+        if len(rows) <= page_size:
+            return [pk for pk, score in rows], None
+        rows = rows[:page_size]
+        pk, score = rows[-1]
+        return [pk for pk, score in rows], _encode_cursor(score, pk)
+
+
+class SimpleBackend:
+    """Unindexed ``icontains`` matching, newest first; for databases without a native backend."""
+
+    def create(self, cursor):
+        pass
+
+    def index(self, contribution_ids):
+        pass
+
+    def remove(self, contribution_ids):
+        pass
+
+    def rebuild(self):
+        pass
+
+    def _condition(self, query):
+        condition = Q()
+        for term in normalize(query).split()[:MAX_TERMS]:
+            condition &= (
+                Q(text_content__icontains=term) | Q(state__name__icontains=term)
+                | Q(category__icontains=term) | Q(author__username__icontains=term)
+            )
+        return condition
+
+    def filter(self, queryset, query):
+        return queryset.filter(self._condition(query))
+
+    def search(self, query, state_id=None, category=None, cursor=None, page_size=None):
+        if not normalize(query).split():
+            return [], None
+        page_size = clamp_page_size(page_size)
+        queryset = Contribution.objects.filter(self._condition(query))
+        if state_id:
+            queryset = queryset.filter(state_id=state_id)
+        if category:
+            queryset = queryset.filter(category=category)
+        rows = list(
+            after_cursor(queryset, cursor).order_by('-submitted_at', '-id').values_list('submitted_at', 'id')[:page_size + 1]
+        )
+        rows, next_cursor = split_page(rows, page_size, key=lambda row: row)
+        return [pk for submitted_at, pk in rows], next_cursor
+
+
+_backend = None
+
+
+def get_backend():
+    global _backend
+    if _backend is None:
+        if BACKEND:
+            _backend = import_string(BACKEND)()
+        else:
+            _backend = SQLiteFTSBackend() if connection.vendor == 'sqlite' else SimpleBackend()
+    return _backend
+
+
+def search(query, state_id=None, category=None, cursor=None, page_size=None):
+    return get_backend().search(query, state_id, category, cursor, page_size)
+
+
+def filter_queryset(queryset, query):
+    return get_backend().filter(queryset, query)
+
+
+# --- Incremental updates ---
+
+def _on_commit_index(ids):
+    transaction.on_commit(lambda: get_backend().index(ids))
+
+
+@receiver(post_save, sender=Contribution, dispatch_uid='search-index-contribution')
+def index_contribution(sender, instance, raw=False, **kwargs):
+    if not raw:
+        _on_commit_index([instance.pk])
+
+
+@receiver(post_delete, sender=Contribution, dispatch_uid='search-remove-contribution')
+def remove_contribution(sender, instance, **kwargs):
+    pk = instance.pk
+    transaction.on_commit(lambda: get_backend().remove([pk]))
+
+
+@receiver(post_save, sender=State, dispatch_uid='search-index-state')
+def reindex_state(sender, instance, created=False, raw=False, **kwargs):
+    if not created and not raw:
+        _on_commit_index(list(Contribution.objects.filter(state=instance).values_list('id', flat=True)))
+
+
+@receiver(post_save, sender=User, dispatch_uid='search-index-author')
+def reindex_author(sender, instance, created=False, raw=False, update_fields=None, **kwargs):
+    # Logins save only last_login; only a possible username change matters here
+    if created or raw or (update_fields is not None and 'username' not in update_fields):
+        return
+    _on_commit_index(list(Contribution.objects.filter(author=instance).values_list('id', flat=True)))
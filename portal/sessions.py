@@ -0,0 +1,164 @@
+# portal/sessions.py
+"""
+Session engine (SESSION_ENGINE = 'portal.sessions'): Django's ``cached_db``
+sessions with the database writes moved behind the cache.
+
+Reads come from the cache and only fall back to the ``django_session`` table
+on a miss. Creating a session (a login) still writes through, so the new key
+is known to be unique. Later saves update the cache at once and queue the row
+for a background writer, which upserts queued sessions in batches every
+``SESSION_FLUSH_INTERVAL`` seconds; repeated saves of one session before a
+flush become a single write. A session that misses the cache while its write
+is still queued is read from the queue.
+
+Deleting a session (logout, ``cycle_key``) drops its queued write and leaves a
+tombstone in the cache, so a writer in another process can't bring it back.
+As with ``cached_db``, several workers need a shared cache
+(``DJANGO_CACHE_BACKEND=redis``), and the settings only turn writing behind
+on with one. Queued writes are flushed when the process exits (and by
+gunicorn's ``worker_exit`` hook). Run ``purge_sessions`` from cron to delete
+expired rows.
+"""
+import atexit
+import logging
+import threading
+import time
+
+from django.conf import settings
+from django.contrib.sessions.backends import cached_db
+from django.core.cache import caches
+from django.db import close_old_connections
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+ASYNC = getattr(settings, 'SESSION_WRITE_BEHIND', False)
+FLUSH_INTERVAL = getattr(settings, 'SESSION_FLUSH_INTERVAL', 1.0)
+BATCH_SIZE = 500
+# Comfortably longer than a flush, so every writer sees the tombstone
+TOMBSTONE_SECONDS = 60
+
+_pending = {}
+_pending_lock = threading.Lock()
+# Held while writing a batch, so a delete can't land between a writer's check and its upsert
+_write_lock = threading.Lock()
+_writer = None
+_writer_lock = threading.Lock()
+
+
+def _cache():
+    return caches[settings.SESSION_CACHE_ALIAS]
+
+
+def _tombstone_key(session_key):
+    return f'session-deleted:{session_key}'
+
+
+class SessionStore(cached_db.SessionStore):
+    def _queued(self):
+        with _pending_lock:
+            session = _pending.get(self.session_key)
+        if session is not None and session.expire_date > timezone.now():
+            return session
+        return None
+
+    def _get_session_from_db(self):
+        return self._queued() or super()._get_session_from_db()
+
+    async def _aget_session_from_db(self):
+        return self._queued() or await super()._aget_session_from_db()
+
+    def _writes_behind(self, must_create):
+        return ASYNC and not must_create and self.session_key is not None
+
+    def save(self, must_create=False):
+        if not self._writes_behind(must_create):
+            return super().save(must_create)
+        data = self._get_session(no_load=False)
+        try:
+            self._cache.set(self.cache_key, data, self.get_expiry_age())
+        except Exception:
+            logger.exception('Error saving to cache (%s)', self._cache)
+        _enqueue(self.create_model_instance(data))
+
+    async def asave(self, must_create=False):
+        if not self._writes_behind(must_create):
+            return await super().asave(must_create)
+        data = await self._aget_session(no_load=False)
+        try:
+            await self._cache.aset(await self.acache_key(), data, await self.aget_expiry_age())
+        except Exception:
+            logger.exception('Error saving to cache (%s)', self._cache)
+        _enqueue(await self.acreate_model_instance(data))
+
+    def delete(self, session_key=None):
+        session_key = session_key or self.session_key
+        if session_key is not None:
+            _forget(session_key)
+        with _write_lock:
+            super().delete(session_key)
+
+    async def adelete(self, session_key=None):
+        session_key = session_key or self.session_key
+        if session_key is not None:
+            _forget(session_key)
+        await super().adelete(session_key)
+
+
+# --- Writer ---
+
+def _forget(session_key):
+    with _pending_lock:
+        _pending.pop(session_key, None)
+    if ASYNC:
+        _cache().set(_tombstone_key(session_key), True, TOMBSTONE_SECONDS)
+
+
+def _enqueue(session):
+    with _pending_lock:
+        _pending[session.session_key] = session
+    _ensure_writer()
+
+
+def _ensure_writer():
+    global _writer
+    with _writer_lock:
+        if _writer is None or not _writer.is_alive():
+            if _writer is None:
+                # The writer is a daemon thread, so write whatever it hasn't reached on the way out
+                atexit.register(flush)
+            _writer = threading.Thread(target=_write_forever, name='session-writer', daemon=True)
+            _writer.start()
+
+
+def _write_forever():
+    while True:
+        time.sleep(FLUSH_INTERVAL)
+        try:
+            flush()
+        except Exception:
+            logger.exception('Failed to write queued sessions')
+        finally:
+            close_old_connections()
+
+
+def flush():
+    """Write every queued session now; returns how many rows were written."""
+    with _pending_lock:
+        batch = dict(_pending)
+    if not batch:
+        return 0
+    with _write_lock:
+        deleted = _cache().get_many([_tombstone_key(key) for key in batch])
+        sessions = [session for key, session in batch.items() if _tombstone_key(key) not in deleted]
+        if sessions:
+            SessionStore.get_model_class().objects.bulk_create(
+                sessions, batch_size=BATCH_SIZE, update_conflicts=True,
+                unique_fields=['session_key'], update_fields=['session_data', 'expire_date'],
+            )
+    with _pending_lock:
+        # Keep anything saved again while the batch was being written
+        for key, session in batch.items():
+            if _pending.get(key) is session:
+                del _pending[key]
+    return len(sessions)
@@ -0,0 +1,213 @@
+// portal/static/portal/js/app.js
+// Scripts for signed-in pages, loaded once and cached: live updates,
+// batched likes and "Load more". URLs come from data attributes on <body>.
+
+// Live notification and like/comment counts, see portal/realtime.py
+const liveUpdates = (() => {
+    let source = null;
+
+    function connect() {
+        if (!window.EventSource) {
+            return;
+        }
+        if (source) {
+            source.close();
+        }
+        const ids = Array.from(document.querySelectorAll('[data-post-id]'), el => el.dataset.postId).slice(0, 100);
+        source = new EventSource(`${document.body.dataset.eventsUrl}?posts=${ids.join(',')}`);
+
+        source.addEventListener('unread', event => {
+            const badge = document.getElementById('unread-count');
+            const count = JSON.parse(event.data).count;
+            badge.innerText = count;
+            badge.hidden = count === 0;
+        });
+        source.addEventListener('counts', event => {
+            const data = JSON.parse(event.data);
+            const likes = document.getElementById(`likes-count-${data.id}`);
+            if (likes && data.likes_count !== undefined) {
+                likes.innerText = data.likes_count + ' likes';
+            }
+            const comments = document.getElementById(`comments-count-${data.id}`);
+            if (comments && data.comments_count !== undefined) {
+                comments.innerText = data.comments_count ? `(${data.comments_count})` : '';
+            }
+        });
+        source.addEventListener('notification', event => {
+            const list = document.getElementById('notification-list');
+            if (!list) {
+                return;
+            }
+            const data = JSON.parse(event.data);
+            // A coalesced notification replaces its earlier version
+            list.querySelector(`[data-notification-id="${data.id}"]`)?.remove();
+            const item = document.createElement('a');
+            item.dataset.notificationId = data.id;
+            // Rendered for id 0 by {% url %}; swap in this notification's id
+            item.href = document.body.dataset.notificationReadUrl.replace(/\/0\/$/, `/${data.id}/`);
+            item.className = 'block p-4 rounded-lg transition bg-blue-50 border-blue-200 border';
+            item.innerText = data.text + '.';
+            list.prepend(item);
+        });
+    }
+
+    connect();
+    return { reconnect: connect };
+})();
+
+function getCookie(name) {
+    let cookieValue = null;
+    if (document.cookie && document.cookie !== '') {
+        const cookies = document.cookie.split(';');
+        for (let i = 0; i < cookies.length; i++) {
+            const cookie = cookies[i].trim();
+            if (cookie.substring(0, name.length + 1) === (name + '=')) {
+                cookieValue = decodeURIComponent(cookie.substring(name.length + 1));
+                break;
+            }
+        }
+    }
+    return cookieValue;
+}
+const csrftoken = getCookie('csrftoken');
+
+// Clicks flip the button straight away and are sent in batches: rapid taps on
+// the same post cancel out locally, and a pause of LIKE_FLUSH_DELAY ms sends
+// everything still pending as one request to the like_batch URL.
+const LIKE_FLUSH_DELAY = 400;
+const pendingLikes = new Map();   // contribution id -> liked state to send
+const confirmedLikes = new Map(); // contribution id -> last state the server confirmed
+let likeFlushTimer = null;
+
+function likeButton(contributionId) {
+    return document.querySelector(`.like-btn-${contributionId}`);
+}
+
+function showLike(contributionId, liked, likesCount) {
+    const button = likeButton(contributionId);
+    if (button) {
+        button.innerHTML = liked ? '❤️' : '🤍';
+    }
+    const likesCountElem = document.getElementById(`likes-count-${contributionId}`);
+    if (likesCountElem && likesCount !== undefined) {
+        likesCountElem.innerText = likesCount + ' likes';
+    }
+}
+
+function likePost(contributionId) {
+    const button = likeButton(contributionId);
+    const shownLiked = button ? button.innerHTML.trim() === '❤️' : false;
+    if (!confirmedLikes.has(contributionId)) {
+        confirmedLikes.set(contributionId, shownLiked);
+    }
+    const liked = !shownLiked;
+    showLike(contributionId, liked);
+    if (liked === confirmedLikes.get(contributionId)) {
+        pendingLikes.delete(contributionId);
+    } else {
+        pendingLikes.set(contributionId, liked);
+    }
+    clearTimeout(likeFlushTimer);
+    likeFlushTimer = setTimeout(flushLikes, LIKE_FLUSH_DELAY);
+}
+
+function flushLikes() {
+    if (pendingLikes.size === 0) {
+        return;
+    }
+    const batch = Array.from(pendingLikes, ([id, liked]) => ({id, liked}));
+    pendingLikes.clear();
+    fetch(document.body.dataset.likesUrl, {
+        method: 'POST',
+        headers: {
+            'X-CSRFToken': csrftoken,
+            'Content-Type': 'application/json'
+        },
+        body: JSON.stringify({likes: batch}),
+    })
+    .then(response => {
+        if (response.status === 429) {
+            // Throttled: put back whatever the user hasn't changed since, and retry later
+            batch.forEach(({id, liked}) => {
+                if (!pendingLikes.has(id)) {
+                    pendingLikes.set(id, liked);
+                }
+            });
+            const retryAfter = parseInt(response.headers.get('Retry-After') || '1', 10);
+            clearTimeout(likeFlushTimer);
+            likeFlushTimer = setTimeout(flushLikes, retryAfter * 1000);
+            return null;
+        }
+        if (!response.ok) {
+            throw new Error('Network response was not ok');
+        }
+        return response.json();
+    })
+    .then(data => {
+        if (!data) {
+            return;
+        }
+        data.likes.forEach(({id, liked, likes_count}) => {
+            confirmedLikes.set(id, liked);
+            // A click made while this batch was in flight wins over the server's answer
+            showLike(id, pendingLikes.has(id) ? pendingLikes.get(id) : liked, likes_count);
+        });
+    })
+    .catch(error => {
+        console.error('Error liking posts:', error);
+        batch.forEach(({id}) => {
+            if (!pendingLikes.has(id)) {
+                showLike(id, confirmedLikes.get(id));
+            }
+        });
+    });
+}
+
+// Don't lose likes made just before leaving the page
+window.addEventListener('pagehide', () => {
+    if (pendingLikes.size === 0) {
+        return;
+    }
+    const batch = Array.from(pendingLikes, ([id, liked]) => ({id, liked}));
+    pendingLikes.clear();
+    fetch(document.body.dataset.likesUrl, {
+        method: 'POST',
+        keepalive: true,
+        headers: {
+            'X-CSRFToken': csrftoken,
+            'Content-Type': 'application/json'
+        },
+        body: JSON.stringify({likes: batch}),
+    });
+});
+
+// Feed pages: fetch the next page of cards in place
+const loadMoreLink = document.getElementById('load-more');
+if (loadMoreLink) {
+    loadMoreLink.addEventListener('click', event => {
+        event.preventDefault();
+        const url = `${loadMoreLink.dataset.feedUrl}?cursor=${encodeURIComponent(loadMoreLink.dataset.nextCursor)}`;
+        fetch(url, { headers: { 'Accept': 'application/json' } })
+        .then(response => {
+            if (!response.ok) {
+                throw new Error('Network response was not ok');
+            }
+            return response.json();
+        })
+        .then(data => {
+            document.getElementById('feed-items').insertAdjacentHTML('beforeend', data.html);
+            liveUpdates.reconnect();
+            if (data.next_cursor) {
+                loadMoreLink.dataset.nextCursor = data.next_cursor;
+                const params = new URLSearchParams(window.location.search);
+                params.set('cursor', data.next_cursor);
+                loadMoreLink.href = `?${params}`;
+            } else {
+                loadMoreLink.remove();
+            }
+        })
+        .catch(error => {
+            console.error('Error loading more posts:', error);
+        });
+    });
+}
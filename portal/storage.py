@@ -0,0 +1,178 @@
+# portal/storage.py
+"""
+Media storage whose URLs carry a content hash (``photo.3f2a9c1b7d40.webp``),
+so ``portal.delivery.serve_media`` can mark them immutable and browsers
+never have to revalidate them. Contribution uploads go one step further and
+are stored under their hash (``ContentAddressedStorage``), once per distinct
+file.
+
+Static files get the same treatment from ``CompressedManifestStaticFilesStorage``
+at ``collectstatic`` time, which also writes precompressed siblings for
+``portal.delivery.serve_static``.
+"""
+import gzip
+import hashlib
+import posixpath
+import re
+
+from django.conf import settings
+from django.contrib.staticfiles.storage import ManifestStaticFilesStorage, StaticFilesStorage
+from django.core.cache import cache
+from django.core.files.storage import FileSystemStorage, storages
+from django.utils import timezone
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+HASH_LENGTH = 12
+COMPRESSIBLE_EXTENSIONS = ('.css', '.js', '.svg', '.json', '.txt', '.map', '.xml', '.html')
+# Compressed variants that don't save at least this fraction aren't kept
+MIN_COMPRESSION_SAVING = 0.05
+HASHED_NAME_RE = re.compile(rf'^(?P<stem>.+)\.(?P<digest>[0-9a-f]{{{HASH_LENGTH}}})(?P<ext>\.[^./]+)?$')
+URL_HASH_CACHE_SECONDS = getattr(settings, 'MEDIA_URL_HASH_CACHE_SECONDS', 24 * 60 * 60)
+BLOB_NAME_RE = re.compile(r'(?:^|/)[0-9a-f]{2}/[0-9a-f]{2}/(?P<digest>[0-9a-f]{64})(?:\.[^./]+)?$')
+
+
+def file_digest(path, block_size=1024 * 1024):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as handle:
+        for block in iter(lambda: handle.read(block_size), b''):
+            digest.update(block)
+    return digest.hexdigest()[:HASH_LENGTH]
+
+
+def content_digest(content):
+    """``(sha256 hex digest, size)`` of a ``File``, read in chunks."""
+    digest = hashlib.sha256()
+    size = 0
+    for chunk in content.chunks():
+        digest.update(chunk)
+        size += len(chunk)
+    return digest.hexdigest(), size
+
+
+def blob_name(name, digest):
+    """``images/photo.JPG`` -> ``images/3f/2a/3f2a….jpg``: sharded two levels deep so no directory grows huge."""
+    directory, filename = posixpath.split(name)
+    ext = posixpath.splitext(filename)[1].lower()
+    return posixpath.join(directory, digest[:2], digest[2:4], digest + ext)
+
+
+def is_blob_name(name):
+    return BLOB_NAME_RE.search(name) is not None
+
+
+def hashed_name(name, digest):
+    stem, ext = posixpath.splitext(name)
+    return f'{stem}.{digest}{ext}'
+
+
+def unhash_name(name):
+    """Split ``a/b.<digest>.ext`` into ``('a/b.ext', digest)``; digest is None if absent."""
+    match = HASHED_NAME_RE.match(name)
+    if not match:
+        return name, None
+    return f"{match['stem']}{match['ext'] or ''}", match['digest']
+
+
+class HashedURLFileSystemStorage(FileSystemStorage):
+    def _digest_cache_key(self, name):
+        return f'media-digest:{hashlib.md5(name.encode()).hexdigest()}'
+
+    def digest(self, name):
+        key = self._digest_cache_key(name)
+        digest = cache.get(key)
+        if digest is None:
+            digest = file_digest(self.path(name))
+            cache.set(key, digest, URL_HASH_CACHE_SECONDS)
+        return digest
+
+    def url(self, name):
+        try:
+            return super().url(hashed_name(name, self.digest(name)))
+        except OSError:
+            return super().url(name)
+
+    def _save(self, name, content):
+        name = super()._save(name, content)
+        cache.delete(self._digest_cache_key(name))
+        return name
+
+    def delete(self, name):
+        super().delete(name)
+        cache.delete(self._digest_cache_key(name))
+
+
+def blob_storage():
+    """The storage of the contribution file fields (a callable, so it follows the STORAGES setting)."""
+    return storages['blobs']
+
+
+class ContentAddressedStorage(HashedURLFileSystemStorage):
+    """
+    Stores each distinct file once, under the SHA-256 of its bytes (see
+    ``blob_name``). Saving bytes that are already stored returns the existing
+    name instead of writing a copy. Every stored file is recorded as a
+    ``MediaBlob``, whose references ``portal.blobs`` counts; unreferenced
+    blobs are deleted by ``gc_media``, never here.
+    """
+
+    def _save(self, name, content):
+        # portal.models imports this module for the field storage
+        from .models import MediaBlob
+
+        digest, size = content_digest(content)
+        name = blob_name(name, digest)
+        blob, created = MediaBlob.objects.get_or_create(name=name, defaults={'size': size})
+        if not created:
+            # Uploaded again: keep gc_media's grace period from running out under the new reference
+            MediaBlob.objects.filter(pk=blob.pk).update(updated_at=timezone.now())
+        if not self.exists(name):
+            super()._save(name, content)
+        return name
+
+    def digest(self, name):
+        match = BLOB_NAME_RE.search(name)
+        if match:
+            return match['digest'][:HASH_LENGTH]
+        return super().digest(name)
+
+
+def compressed_variants(data):
+    """``[(suffix, bytes)]`` for the gzip and (if installed) brotli encodings worth keeping."""
+    variants = [('.gz', gzip.compress(data, compresslevel=9, mtime=0))]
+    if brotli is not None:
+        variants.append(('.br', brotli.compress(data, quality=11)))
+    return [(suffix, body) for suffix, body in variants if len(body) <= len(data) * (1 - MIN_COMPRESSION_SAVING)]
+
+
+class CompressedManifestStaticFilesStorage(ManifestStaticFilesStorage):
+    """
+    Content-hashed static names plus ``.gz`` and ``.br`` siblings of the
+    hashed text files. URLs for files that haven't been collected (tests,
+    ``runserver`` before ``collectstatic``) fall back to the plain name.
+    """
+    manifest_strict = False
+
+    def url(self, name, force=False):
+        try:
+            return super().url(name, force)
+        except ValueError:
+            return StaticFilesStorage.url(self, name)
+
+    def post_process(self, paths, dry_run=False, **options):
+        yield from super().post_process(paths, dry_run, **options)
+        if dry_run:
+            return
+        for name in sorted(set(self.hashed_files.values())):
+            if name.endswith(COMPRESSIBLE_EXTENSIONS):
+                self.compress(name)
+
+    def compress(self, name):
+        with self.open(name) as handle:
+            data = handle.read()
+        for suffix, body in compressed_variants(data):
+            with open(self.path(name + suffix), 'wb') as handle:
+                handle.write(body)
@@ -0,0 +1,11 @@
+from django import template
+
+from portal import cards
+
+register = template.Library()
+
+
+@register.simple_tag(takes_context=True)
+def render_cards(context, items, variant='feed'):
+    """Render contribution cards through the fragment cache, see ``portal.cards``."""
+    return cards.render(items, variant, context.get('request'))
@@ -1,3 +1,1545 @@
-from django.test import TestCase
+import asyncio
+import gzip
+import hashlib
+import io
+import json
+import os
+import runpy
+import shutil
+import subprocess
+import tempfile
+import unittest
+from datetime import timedelta
+from pathlib import Path
+from unittest import mock
 
-# Create your tests here.
+from asgiref.sync import sync_to_async
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.contrib.sessions.models import Session
+from django.core.handlers.asgi import ASGIHandler
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import connection, router
+from django.templatetags.static import static
+from django.test import Client, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from PIL import Image
+
+from . import assets, auth, cards, database, delivery, feed, graph, instrumentation, media, notifications, ranking, realtime, search, sessions, throttle, timeline, uploads
+from . import urls as portal_urls
+from .forms import ContributionForm
+from .models import CategorySubscription, Comment, Contribution, MediaBlob, Notification, State, TimelineEntry, UploadSession, UserProfile
+from .storage import blob_storage
+
+
+def setUpModule():
+    # Sessions, notifications, rankings and media are written by background threads outside the test transaction otherwise
+    for module in (sessions, notifications, ranking, media):
+        patcher = mock.patch.object(module, 'ASYNC', False)
+        patcher.start()
+        unittest.addModuleCleanup(patcher.stop)
+
+
+class FeedTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.viewer = User.objects.create_user('viewer')
+        cls.authors = [User.objects.create_user(f'author{i}') for i in range(5)]
+        cls.state = State.objects.get(name='Telangana')
+        for i in range(30):
+            author = cls.authors[i % len(cls.authors)]
+            post = Contribution.objects.create(author=author, state=cls.state, category='FOOD', text_content=f'post {i}')
+            for user in [cls.viewer, *cls.authors[:i % 3]]:
+                post.toggle_like(user)
+            for j in range(i % 5):
+                post.add_comment(cls.authors[j], f'comment {j}')
+        cls.viewer.userprofile.follows.add(cls.authors[0].userprofile)
+
+    def setUp(self):
+        cache.clear()
+        # Keep the throttled last-seen write and the unread-count, state-list, follow-set and user fills out of the query counts
+        cache.set(f'last-seen:{self.viewer.pk}', True)
+        notifications.unread_count(self.viewer.pk)
+        ranking.states()
+        graph.following_ids(self.viewer.pk)
+        self.client.force_login(self.viewer)
+        auth.CachedModelBackend().get_user(self.viewer.pk)
+
+    def test_pages_are_disjoint_and_ordered(self):
+        seen = []
+        cursor = None
+        while True:
+            page = feed.get_feed('explore', self.viewer, cursor, page_size=7)
+            seen.extend(item.pk for item in page.items)
+            if not page.has_more:
+                break
+            cursor = page.next_cursor
+        expected = list(Contribution.objects.order_by('-submitted_at', '-id').values_list('pk', flat=True))
+        self.assertEqual(seen, expected)
+
+    def test_page_hydration(self):
+        page = feed.get_feed('explore', self.viewer, page_size=30)
+        for item in page.items:
+            self.assertTrue(item.viewer_has_liked)
+            self.assertEqual(item.likes_count, item.likes.count())
+            self.assertEqual(item.comments_count, item.comments.count())
+            self.assertLessEqual(len(item.comment_preview), feed.COMMENT_PREVIEW_SIZE)
+            self.assertEqual(item.viewer_follows_author, item.author_id == self.authors[0].pk)
+
+    def test_explore_query_count_is_constant(self):
+        with self.assertNumQueries(3):
+            self.client.get(reverse('explore'), {'page_size': 5})
+        with self.assertNumQueries(3):
+            self.client.get(reverse('explore'), {'page_size': 30})
+
+    def test_feed_more_returns_fragment_and_cursor(self):
+        first = feed.get_feed('explore', self.viewer, page_size=10)
+        response = self.client.get(reverse('feed_more', args=['explore']), {'cursor': first.next_cursor, 'page_size': 10})
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        self.assertTrue(data['has_more'])
+        self.assertIn('likes-count-', data['html'])
+
+    def test_feed_more_rejects_bad_cursor(self):
+        response = self.client.get(reverse('feed_more', args=['explore']), {'cursor': '!!!'})
+        self.assertEqual(response.status_code, 400)
+
+    async def test_async_feeds_match_sync_feeds(self):
+        for name in ('home', 'explore'):
+            expected = await sync_to_async(feed.get_feed)(name, self.viewer, page_size=7)
+            page = await feed.aget_feed(name, self.viewer, page_size=7)
+            self.assertEqual([item.pk for item in page.items], [item.pk for item in expected.items])
+            self.assertEqual(page.next_cursor, expected.next_cursor)
+            for item, other in zip(page.items, expected.items):
+                self.assertEqual(item.viewer_has_liked, other.viewer_has_liked)
+                self.assertEqual(item.viewer_follows_author, other.viewer_follows_author)
+                self.assertEqual(item.comment_preview, other.comment_preview)
+
+    async def test_async_views(self):
+        await self.async_client.aforce_login(self.viewer)
+        response = await self.async_client.get(reverse('public_profile', args=[self.authors[0].username]))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.context['user_contributions']), 6)
+        response = await self.async_client.get(reverse('public_profile', args=['nobody']))
+        self.assertEqual(response.status_code, 404)
+        response = await self.async_client.get(reverse('notifications'))
+        self.assertEqual(response.status_code, 200)
+
+    def test_asgi_middleware_chain_is_not_adapted(self):
+        # With the optional middleware installed too, nothing between the server and the async views needs a thread
+        with mock.patch.object(database, 'REPLICAS', ['replica_1']), mock.patch.object(instrumentation, 'ENABLED', True):
+            # Django only logs adapted handlers with DEBUG on
+            with override_settings(DEBUG=True), self.assertNoLogs('django.request', 'DEBUG'):
+                ASGIHandler()
+
+    async def test_last_seen_is_recorded_by_async_requests(self):
+        await cache.adelete(f'last-seen:{self.viewer.pk}')
+        await self.async_client.aforce_login(self.viewer)
+        await self.async_client.get(reverse('home'))
+        profile = await UserProfile.objects.aget(user=self.viewer)
+        self.assertIsNotNone(profile.last_seen)
+
+
+class CounterTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user('author')
+        cls.fan = User.objects.create_user('fan')
+        cls.post = Contribution.objects.create(author=cls.author, state=State.objects.first(), category='DANCE')
+
+    def test_like_endpoint_toggles_counter(self):
+        self.client.force_login(self.fan)
+        url = reverse('like_contribution', args=[self.post.pk])
+        self.assertEqual(self.client.post(url).json(), {'liked': True, 'likes_count': 1})
+        self.assertEqual(self.client.post(url).json(), {'liked': False, 'likes_count': 0})
+
+    def test_unlike_with_a_drifted_counter_stays_at_zero(self):
+        self.post.toggle_like(self.fan)
+        Contribution.objects.filter(pk=self.post.pk).update(likes_count=0)
+        self.assertEqual(self.post.toggle_like(self.fan), (False, 0))
+        self.post.likes.add(self.fan)
+        self.assertEqual(Contribution.objects.set_likes(self.fan, {self.post.pk: False})[0], {self.post.pk: (False, 0)})
+
+    def test_comment_increments_counter(self):
+        self.client.force_login(self.fan)
+        self.client.post(reverse('add_comment', args=[self.post.pk]), {'comment_text': 'Kuchipudi!'})
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.comments_count, 1)
+
+    def test_reconcile_counters_fixes_drift(self):
+        self.post.likes.add(self.fan)
+        Comment.objects.create(contribution=self.post, author=self.fan, text='untracked')
+        UserProfile.objects.filter(user=self.author).update(followers_count=5)
+        call_command('reconcile_counters', batch_size=1, stdout=open(os.devnull, 'w'))
+        self.post.refresh_from_db()
+        self.assertEqual((self.post.likes_count, self.post.comments_count), (1, 1))
+        self.assertEqual(UserProfile.objects.get(user=self.author).followers_count, 0)
+
+
+class LikeBatchTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user('author')
+        cls.fan = User.objects.create_user('fan')
+        state = State.objects.first()
+        cls.posts = [Contribution.objects.create(author=cls.author, state=state, category='FOOD') for i in range(12)]
+        cls.posts[0].toggle_like(cls.fan)
+
+    def setUp(self):
+        cache.clear()
+        cache.set(f'last-seen:{self.fan.pk}', True)
+        self.client.force_login(self.fan)
+        auth.CachedModelBackend().get_user(self.fan.pk)
+
+    def send(self, likes):
+        return self.client.post(reverse('like_batch'), {'likes': likes}, content_type='application/json')
+
+    def test_batch_is_applied_idempotently(self):
+        batch = [
+            {'id': self.posts[0].pk, 'liked': False},
+            {'id': self.posts[1].pk, 'liked': True},
+            {'id': self.posts[2].pk, 'liked': False},
+            {'id': self.posts[2].pk, 'liked': True},
+            {'id': 999999, 'liked': True},
+        ]
+        expected = [
+            {'id': self.posts[0].pk, 'liked': False, 'likes_count': 0},
+            {'id': self.posts[1].pk, 'liked': True, 'likes_count': 1},
+            {'id': self.posts[2].pk, 'liked': True, 'likes_count': 1},
+        ]
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.send(batch)
+        self.assertEqual(sorted(response.json()['likes'], key=lambda like: like['id']), expected)
+        self.assertEqual(
+            sorted(Notification.objects.filter(recipient=self.author).values_list('target_id', 'actor_count')),
+            [(self.posts[1].pk, 1), (self.posts[2].pk, 1)],
+        )
+        # Replaying the batch changes nothing
+        self.assertEqual(sorted(self.send(batch).json()['likes'], key=lambda like: like['id']), expected)
+        self.assertEqual(
+            set(self.fan.liked_contributions.values_list('pk', flat=True)), {self.posts[1].pk, self.posts[2].pk},
+        )
+
+    def test_query_count_does_not_grow_with_batch_size(self):
+        for posts in (self.posts[1:3], self.posts[3:12]):
+            with self.subTest(size=len(posts)), self.assertNumQueries(8):
+                self.send([{'id': post.pk, 'liked': True} for post in posts])
+
+    def test_rejects_malformed_batches(self):
+        for likes in ([{'id': '1', 'liked': True}], [{'id': 1}], 'nope', [{'id': i, 'liked': True} for i in range(51)]):
+            with self.subTest(likes=likes):
+                self.assertEqual(self.send(likes).status_code, 400)
+
+    def test_token_bucket_throttles_likes(self):
+        with mock.patch.object(throttle.likes, 'capacity', 3), mock.patch.object(throttle.likes, 'rate', 0.5):
+            self.assertEqual(self.send([{'id': post.pk, 'liked': True} for post in self.posts[:3]]).status_code, 200)
+            response = self.send([{'id': self.posts[3].pk, 'liked': True}])
+            self.assertEqual(response.status_code, 429)
+            self.assertEqual(response['Retry-After'], '2')
+            response = self.client.post(reverse('like_contribution', args=[self.posts[3].pk]))
+            self.assertEqual(response.status_code, 429)
+        self.assertFalse(self.posts[3].likes.exists())
+
+
+class CategorySubscriptionTests(TestCase):
+    def test_edit_profile_replaces_subscriptions(self):
+        user = User.objects.create_user('foodie')
+        self.client.force_login(user)
+        self.client.post(reverse('edit_profile'), {'followed_categories': ['FOOD', 'DANCE']})
+        self.client.post(reverse('edit_profile'), {'followed_categories': ['FOOD']})
+        self.assertEqual(list(CategorySubscription.objects.subscriber_ids('FOOD')), [user.pk])
+        self.assertEqual(CategorySubscription.objects.subscriber_counts(), {'PLACES': 0, 'DANCE': 0, 'FOOD': 1, 'TRADITION': 0})
+        response = self.client.get(reverse('edit_profile'))
+        self.assertEqual(response.context['form'].initial['followed_categories'], ['FOOD'])
+
+
+class TimelineTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.reader = User.objects.create_user('reader')
+        cls.writer = User.objects.create_user('writer')
+        cls.state = State.objects.get(name='Kerala')
+        cls.food = Contribution.objects.create(author=cls.writer, state=cls.state, category='FOOD')
+        cls.dance = Contribution.objects.create(author=cls.writer, state=cls.state, category='DANCE')
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.reader)
+
+    def timeline_ids(self):
+        return set(TimelineEntry.objects.filter(user=self.reader).values_list('contribution_id', flat=True))
+
+    def test_follow_backfills_and_unfollow_prunes(self):
+        self.client.get(reverse('follow_user', args=[self.writer.pk]))
+        self.assertEqual(self.timeline_ids(), {self.food.pk, self.dance.pk})
+        self.client.post(reverse('edit_profile'), {'followed_categories': ['FOOD']})
+        self.client.get(reverse('follow_user', args=[self.writer.pk]))
+        self.assertEqual(self.timeline_ids(), {self.food.pk})
+
+    def test_new_post_is_fanned_out(self):
+        self.reader.userprofile.follows.add(self.writer.userprofile)
+        self.client.force_login(self.writer)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse('create_post'), {'state': self.state.pk, 'category': 'PLACES', 'text_content': 'Munnar'})
+        post = Contribution.objects.latest('id')
+        self.assertIn(post.pk, self.timeline_ids())
+        self.assertFalse(TimelineEntry.objects.filter(user=self.writer).exists())
+
+    def test_high_fanout_categories_are_pulled_at_read_time(self):
+        CategorySubscription.objects.create(user=self.reader, category='FOOD')
+        with mock.patch.object(timeline, 'FANOUT_SUBSCRIBER_LIMIT', 0):
+            timeline.add_categories(self.reader.pk, ['FOOD'])
+            post = Contribution.objects.create(author=self.writer, state=self.state, category='FOOD')
+            timeline.fan_out(post)
+            self.assertEqual(self.timeline_ids(), set())
+            page = feed.get_feed('home', self.reader)
+        self.assertEqual([item.pk for item in page.items], [post.pk, self.food.pk])
+
+    def test_own_posts_in_subscribed_categories_stay_in_the_home_feed(self):
+        CategorySubscription.objects.create(user=self.writer, category='FOOD')
+        timeline.add_categories(self.writer.pk, ['FOOD'])
+        post = Contribution.objects.create(author=self.writer, state=self.state, category='FOOD')
+        timeline.fan_out(post)
+        entries = TimelineEntry.objects.filter(user=self.writer).values_list('contribution_id', flat=True)
+        self.assertEqual(set(entries), {self.food.pk, post.pk})
+
+    def test_high_fanout_authors_are_pulled_at_read_time(self):
+        self.reader.userprofile.follows.add(self.writer.userprofile)
+        with mock.patch.object(timeline, 'FANOUT_FOLLOWER_LIMIT', 0):
+            timeline.backfill_author(self.reader.pk, self.writer.pk)
+            self.assertEqual(self.timeline_ids(), set())
+            page = feed.get_feed('home', self.reader)
+        self.assertEqual([item.pk for item in page.items], [self.dance.pk, self.food.pk])
+
+
+class GraphTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.alice, cls.bob, cls.carol, cls.dave = [User.objects.create_user(name) for name in ('alice', 'bob', 'carol', 'dave')]
+
+    def setUp(self):
+        cache.clear()
+
+    def counts(self, user):
+        return tuple(UserProfile.objects.filter(user=user).values_list('followers_count', 'following_count').get())
+
+    def test_toggle_keeps_sets_and_counts_in_step(self):
+        self.assertTrue(graph.toggle_follow(self.alice.pk, self.bob.pk))
+        self.assertTrue(graph.follows(self.alice.pk, self.bob.pk))
+        self.assertEqual(list(graph.follower_ids(self.bob.pk)), [self.alice.pk])
+        self.assertEqual((self.counts(self.alice), self.counts(self.bob)), ((0, 1), (1, 0)))
+        with self.assertNumQueries(0):
+            self.assertEqual(graph.followed_among(self.alice.pk, {self.bob.pk, self.carol.pk}), {self.bob.pk})
+        self.assertFalse(graph.toggle_follow(self.alice.pk, self.bob.pk))
+        self.assertFalse(graph.follows(self.alice.pk, self.bob.pk))
+        self.assertEqual(self.counts(self.bob), (0, 0))
+
+    def test_manager_changes_invalidate(self):
+        graph.following_ids(self.alice.pk)
+        self.alice.userprofile.follows.add(self.bob.userprofile, self.carol.userprofile)
+        self.assertEqual(set(graph.following_ids(self.alice.pk)), {self.bob.pk, self.carol.pk})
+        self.dave.userprofile.followed_by.add(self.alice.userprofile)
+        self.assertEqual(self.counts(self.alice), (0, 3))
+        self.alice.userprofile.follows.clear()
+        self.assertEqual((self.counts(self.alice), self.counts(self.dave)), ((0, 0), (0, 0)))
+        self.assertEqual(list(graph.following_ids(self.alice.pk)), [])
+
+    def test_profile_shows_follow_state_without_loading_follows(self):
+        graph.toggle_follow(self.alice.pk, self.bob.pk)
+        self.client.force_login(self.alice)
+        response = self.client.get(reverse('public_profile', args=['bob']))
+        self.assertTrue(response.context['viewer_follows'])
+        self.assertContains(response, '<strong>1</strong> followers')
+
+    def test_suggestions_come_from_second_degree_follows(self):
+        for follower, followed in ((self.alice, self.bob), (self.alice, self.carol), (self.bob, self.dave), (self.carol, self.dave), (self.bob, self.alice)):
+            graph.toggle_follow(follower.pk, followed.pk)
+        UserProfile.objects.filter(user=self.alice).update(last_seen=timezone.now())
+        call_command('compute_follow_suggestions', stdout=io.StringIO())
+        self.assertEqual(graph.suggestions(self.alice.pk), [(self.dave.pk, 2)])
+        self.client.force_login(self.alice)
+        self.assertContains(self.client.get(reverse('profile')), 'followed by 2 you follow')
+        graph.toggle_follow(self.alice.pk, self.dave.pk)
+        self.assertEqual(graph.suggestions(self.alice.pk), [])
+
+
+class SessionAndUserCacheTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('sita')
+
+    def setUp(self):
+        cache.clear()
+
+    def test_session_writes_are_coalesced_behind_the_cache(self):
+        with mock.patch.object(sessions, 'ASYNC', True), mock.patch.object(sessions, '_ensure_writer'):
+            store = sessions.SessionStore()
+            store['step'] = 1
+            store.create()
+            for step in (2, 3):
+                store['step'] = step
+                store.save()
+            row = Session.objects.get(pk=store.session_key)
+            self.assertEqual(row.get_decoded(), {'step': 1})
+            cache.clear()
+            self.assertEqual(sessions.SessionStore(store.session_key)['step'], 3)
+            self.assertEqual(sessions.flush(), 1)
+            row.refresh_from_db()
+            self.assertEqual(row.get_decoded(), {'step': 3})
+            store['step'] = 4
+            store.save()
+            store.delete()
+            self.assertEqual(sessions.flush(), 0)
+            self.assertFalse(Session.objects.filter(pk=store.session_key).exists())
+
+    def test_gunicorn_needs_a_shared_cache_and_flushes_sessions_on_exit(self):
+        path = settings.BASE_DIR / 'gunicorn.conf.py'
+        with mock.patch.dict(os.environ, {'DJANGO_CACHE_BACKEND': 'locmem', 'GUNICORN_WORKERS': '4'}):
+            with self.assertRaises(ValueError):
+                runpy.run_path(path)
+        with mock.patch.dict(os.environ, {'DJANGO_CACHE_BACKEND': 'redis', 'GUNICORN_WORKERS': '4'}):
+            config = runpy.run_path(path)
+        self.assertEqual(config['workers'], 4)
+        with mock.patch.object(sessions, 'ASYNC', True), mock.patch.object(sessions, '_ensure_writer'):
+            store = sessions.SessionStore()
+            store.create()
+            store['step'] = 2
+            store.save()
+            config['worker_exit'](None, None)
+        self.assertEqual(Session.objects.get(pk=store.session_key).get_decoded(), {'step': 2})
+
+    def test_signed_in_user_and_profile_come_from_the_cache(self):
+        self.client.force_login(self.user)
+        self.client.get(reverse('profile'))
+        with self.assertNumQueries(1):
+            self.client.get(reverse('profile'))
+        self.user.first_name = 'Sita'
+        self.user.save()
+        self.assertEqual(self.client.get(reverse('profile')).context['user'].first_name, 'Sita')
+
+    def test_saving_a_user_writes_the_profile_only_when_it_changed(self):
+        def profile_writes():
+            with CaptureQueriesContext(connection) as queries:
+                user.save()
+            return [query for query in queries if query['sql'].startswith('UPDATE "portal_userprofile"')]
+
+        user = User.objects.select_related('userprofile').get(pk=self.user.pk)
+        self.assertEqual(profile_writes(), [])
+        user.userprofile.last_seen = timezone.now()
+        self.assertEqual(len(profile_writes()), 1)
+        self.assertIsNotNone(UserProfile.objects.get(user=user).last_seen)
+
+    def test_purge_sessions_deletes_expired_rows(self):
+        past, future = timezone.now() - timedelta(days=1), timezone.now() + timedelta(days=1)
+        Session.objects.bulk_create(
+            [Session(session_key=f'old{i}', session_data='', expire_date=past) for i in range(5)]
+            + [Session(session_key='live', session_data='', expire_date=future)]
+        )
+        out = io.StringIO()
+        call_command('purge_sessions', batch_size=2, pause=0, stdout=out)
+        self.assertIn('Deleted 5', out.getvalue())
+        self.assertEqual(list(Session.objects.values_list('pk', flat=True)), ['live'])
+
+
+class QueryPlanTests(TestCase):
+    """
+    Seeds a few hundred rows and checks every portal URL for a bounded query
+    count and for query plans that use an index instead of a full scan or a
+    temporary sort on the large tables.
+    """
+    LARGE_TABLES = ('portal_contribution', 'portal_comment', 'portal_notification', 'portal_timelineentry')
+
+    @classmethod
+    def setUpTestData(cls):
+        # Staff, so the admin dashboard and instrumentation pages are reachable
+        cls.viewer = User.objects.create_user('viewer', is_staff=True)
+        users = [User.objects.create_user(f'user{i}') for i in range(30)]
+        states = list(State.objects.all())
+        Contribution.objects.bulk_create([
+            Contribution(author=users[i % 30], state=states[i % len(states)], category=Contribution.CATEGORY_CHOICES[i % 4][0], text_content=f'post {i}')
+            for i in range(300)
+        ])
+        posts = list(Contribution.objects.all())
+        Like = Contribution.likes.through
+        Like.objects.bulk_create([Like(contribution=p, user=u) for p in posts for u in users[:p.pk % 7]])
+        Comment.objects.bulk_create([Comment(contribution=p, author=u, text='nice') for p in posts for u in users[:p.pk % 5]])
+        Notification.objects.bulk_create([Notification(recipient=cls.viewer, sender=u, verb='liked your post', target=posts[0]) for u in users])
+        cls.viewer.userprofile.follows.add(*[u.userprofile for u in users[:10]])
+        CategorySubscription.objects.set_for(cls.viewer.pk, ['FOOD'])
+        call_command('reconcile_counters', stdout=open(os.devnull, 'w'))
+        call_command('rebuild_search_index', stdout=open(os.devnull, 'w'))
+        timeline.rebuild(cls.viewer.pk)
+        cls.post = posts[0]
+        cls.author = users[0]
+        cls.notification = Notification.objects.first()
+
+    def setUp(self):
+        cache.clear()
+        # Keep the throttled last-seen write and the unread-count, state-list, follow-set and user fills out of the query counts
+        cache.set(f'last-seen:{self.viewer.pk}', True)
+        notifications.unread_count(self.viewer.pk)
+        ranking.states()
+        graph.following_ids(self.viewer.pk)
+        auth.CachedModelBackend().get_user(self.viewer.pk)
+        self.client.force_login(self.viewer)
+        # The upload routes write files
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root)
+        settings_override = override_settings(MEDIA_ROOT=media_root)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        partial_dir = mock.patch.object(uploads, 'PARTIAL_DIR', Path(media_root) / 'partial')
+        partial_dir.start()
+        self.addCleanup(partial_dir.stop)
+
+    def capture(self, method, url, data=None, **kwargs):
+        queries = []
+
+        def record(execute, sql, params, many, context):
+            if not sql.startswith(('SAVEPOINT', 'RELEASE SAVEPOINT')):
+                queries.append((sql, params))
+            return execute(sql, params, many, context)
+
+        with connection.execute_wrapper(record):
+            response = getattr(self.client, method)(url, data or {}, **kwargs)
+        self.assertLess(response.status_code, 400, url)
+        return queries
+
+    def assert_plans_use_indexes(self, queries):
+        with connection.cursor() as cursor:
+            for sql, params in queries:
+                if not sql.lstrip().upper().startswith('SELECT'):
+                    continue
+                cursor.execute(f'EXPLAIN QUERY PLAN {sql}', params)
+                for row in cursor.fetchall():
+                    detail = row[-1]
+                    # Relevance order is computed per query, so ranked search sorts its (already matched) rows;
+                    # aggregates sort one row per group (the dashboard's per-state counts)
+                    if search.FTS_TABLE not in sql and 'GROUP BY' not in sql:
+                        self.assertNotIn('USE TEMP B-TREE FOR ORDER BY', detail, sql)
+                    for table in self.LARGE_TABLES:
+                        self.assertNotRegex(detail, rf'^SCAN {table}$', sql)
+
+    # Query bound per URL name; every route in portal/urls.py needs one
+    BOUNDS = {
+        'register': 1,
+        'profile': 4,
+        'create_post': 4,
+        'upload_start': 1,
+        'upload_detail': 3,
+        'upload_complete': 4,
+        'home': 8,
+        'edit_profile': 4,
+        'explore': 6,
+        'search': 8,
+        'feed_more': 6,
+        'public_profile': 7,
+        'notifications': 3,
+        'events': 0,
+        'mark_all_notifications_as_read': 1,
+        'mark_notification_as_read': 5,
+        'like_contribution': 8,
+        'like_batch': 4,
+        'add_comment': 6,
+        'follow_user': 9,
+        'api_contributions': 3,
+        'api_contribution': 3,
+        'api_contribution_comments': 2,
+        'api_states': 0,
+        'api_user': 1,
+        'api_notifications': 1,
+        'admin_state_contributions': 2,
+        'instrumentation_report': 0,
+        'instrumentation_metrics': 0,
+        'admin:index': 8,
+    }
+
+    def requests(self):
+        """``(url name, method, url, data, client kwargs)`` for one request to each route, reads first."""
+        chunk = b'\x00\x00\x00\x18ftypisom' + bytes(1000)
+        open_upload = uploads.start(self.viewer, 'video', 'dance.mp4', 'video/mp4', len(chunk))
+        finished = uploads.start(self.viewer, 'video', 'dance.mp4', 'video/mp4', len(chunk))
+        uploads.write_chunk(finished, io.BytesIO(chunk), f'bytes 0-{len(chunk) - 1}/{len(chunk)}', len(chunk))
+        return [
+            ('register', 'get', reverse('register'), None, {}),
+            ('profile', 'get', reverse('profile'), None, {}),
+            ('create_post', 'get', reverse('create_post'), None, {}),
+            ('home', 'get', reverse('home'), None, {}),
+            ('edit_profile', 'get', reverse('edit_profile'), None, {}),
+            ('explore', 'get', reverse('explore'), None, {}),
+            ('search', 'get', reverse('search'), {'q': 'post'}, {}),
+            ('feed_more', 'get', reverse('feed_more', args=['explore']), None, {}),
+            ('public_profile', 'get', reverse('public_profile', args=[self.author.username]), None, {}),
+            ('notifications', 'get', reverse('notifications'), None, {}),
+            ('events', 'get', reverse('events'), {'posts': self.post.pk}, {}),
+            ('api_contributions', 'get', reverse('api_contributions'), None, {}),
+            ('api_contribution', 'get', reverse('api_contribution', args=[self.post.pk]), None, {}),
+            ('api_contribution_comments', 'get', reverse('api_contribution_comments', args=[self.post.pk]), None, {}),
+            ('api_states', 'get', reverse('api_states'), None, {}),
+            ('api_user', 'get', reverse('api_user', args=[self.author.username]), None, {}),
+            ('api_notifications', 'get', reverse('api_notifications'), None, {}),
+            ('admin:index', 'get', reverse('admin:index'), None, {}),
+            ('admin_state_contributions', 'get', reverse('admin_state_contributions', args=[self.post.state_id]), None, {}),
+            ('instrumentation_report', 'get', reverse('instrumentation_report'), None, {}),
+            ('instrumentation_metrics', 'get', reverse('instrumentation_metrics'), None, {}),
+            ('upload_detail', 'get', reverse('upload_detail', args=[open_upload.pk]), None, {}),
+            ('upload_start', 'post', reverse('upload_start'), {
+                'kind': 'video', 'filename': 'dance.mp4', 'content_type': 'video/mp4', 'size': len(chunk),
+            }, {}),
+            ('upload_detail', 'put', reverse('upload_detail', args=[open_upload.pk]), chunk, {
+                'content_type': 'application/octet-stream',
+                'headers': {'Content-Range': f'bytes 0-{len(chunk) - 1}/{len(chunk)}'},
+            }),
+            ('upload_complete', 'post', reverse('upload_complete', args=[finished.pk]), None, {}),
+            ('like_contribution', 'post', reverse('like_contribution', args=[self.post.pk]), None, {}),
+            ('like_batch', 'post', reverse('like_batch'), {'likes': [{'id': self.post.pk, 'liked': True}]}, {
+                'content_type': 'application/json',
+            }),
+            ('add_comment', 'post', reverse('add_comment', args=[self.post.pk]), {'comment_text': 'wow'}, {}),
+            ('follow_user', 'get', reverse('follow_user', args=[self.author.pk]), None, {}),
+            ('mark_notification_as_read', 'get', reverse('mark_notification_as_read', args=[self.notification.pk]), None, {}),
+            ('mark_all_notifications_as_read', 'post', reverse('mark_all_notifications_as_read'), None, {}),
+        ]
+
+    def test_every_route_has_a_query_bound(self):
+        names = {pattern.name for pattern in portal_urls.urlpatterns}
+        self.assertEqual(names - self.BOUNDS.keys(), set())
+        self.assertEqual(names - {name for name, *rest in self.requests()}, set())
+
+    def test_query_counts_and_plans(self):
+        for name, method, url, data, kwargs in self.requests():
+            with self.subTest(name=name, method=method):
+                queries = self.capture(method, url, data, **kwargs)
+                self.assertLessEqual(len(queries), self.BOUNDS[name])
+                self.assert_plans_use_indexes(queries)
+
+
+class NotificationTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user('author')
+        cls.fans = [User.objects.create_user(f'fan{i}') for i in range(3)]
+        cls.post = Contribution.objects.create(author=cls.author, state=State.objects.first(), category='DANCE')
+
+    def setUp(self):
+        cache.clear()
+
+    def like(self, user):
+        self.client.force_login(user)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse('like_contribution', args=[self.post.pk]))
+
+    def test_likes_coalesce_into_one_notification(self):
+        for fan in self.fans:
+            self.like(fan)
+        notification = Notification.objects.get(recipient=self.author)
+        self.assertEqual((notification.sender, notification.actor_count), (self.fans[-1], 3))
+        self.client.force_login(self.author)
+        self.assertContains(self.client.get(reverse('notifications')), 'and 2 others')
+
+    def test_batch_coalesces_and_skips_repeat_actors(self):
+        fan = self.fans[0].pk
+        notifications.write_batch([
+            (self.author.pk, fan, 'started following you', None),
+            (self.author.pk, fan, 'started following you', None),
+            (self.author.pk, self.fans[1].pk, 'started following you', None),
+        ])
+        notifications.write_batch([(self.author.pk, fan, 'started following you', None)])
+        notification = Notification.objects.get(recipient=self.author)
+        self.assertEqual((notification.sender_id, notification.actor_count), (self.fans[1].pk, 2))
+        notifications.write_batch([(self.author.pk, self.fans[2].pk, 'started following you', None)])
+        notification.refresh_from_db()
+        self.assertEqual((notification.actor_count, notification.actor_ids), (3, [fan, self.fans[1].pk, self.fans[2].pk]))
+
+    def test_unread_count_is_cached_and_maintained(self):
+        self.assertEqual(notifications.unread_count(self.author.pk), 0)
+        self.like(self.fans[0])
+        with self.assertNumQueries(0):
+            self.assertEqual(notifications.unread_count(self.author.pk), 1)
+        self.client.force_login(self.author)
+        self.client.post(reverse('mark_all_notifications_as_read'))
+        self.assertEqual(notifications.unread_count(self.author.pk), 0)
+        self.assertFalse(Notification.objects.filter(is_read=False).exists())
+
+    def test_notifications_are_paginated(self):
+        Notification.objects.bulk_create([Notification(recipient=self.author, sender=self.fans[0], verb=f'v{i}') for i in range(5)])
+        items, cursor = notifications.page(self.author.pk, page_size=3)
+        rest, end = notifications.page(self.author.pk, cursor, page_size=3)
+        self.assertEqual(len({n.pk for n in items + rest}), 5)
+        self.assertIsNone(end)
+
+    def test_prune_removes_old_read_notifications(self):
+        old = timezone.now() - timezone.timedelta(days=40)
+        Notification.objects.bulk_create([
+            Notification(recipient=self.author, sender=self.fans[0], verb='old read', is_read=True),
+            Notification(recipient=self.author, sender=self.fans[0], verb='old unread'),
+        ])
+        Notification.objects.update(timestamp=old)
+        call_command('prune_notifications', days=30, stdout=open(os.devnull, 'w'))
+        self.assertEqual(list(Notification.objects.values_list('verb', flat=True)), ['old unread'])
+
+
+class RealtimeTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user('author')
+        cls.fan = User.objects.create_user('fan')
+        cls.post = Contribution.objects.create(author=cls.author, state=State.objects.first(), category='DANCE')
+
+    async def test_broker_hands_publishes_from_other_threads_to_subscribers(self):
+        broker = realtime.InProcessBroker()
+        subscription = await broker.subscribe(['post:1'])
+        await asyncio.to_thread(broker.publish, 'post:1', 'counts', {'likes_count': 3})
+        self.assertEqual(await subscription.get(1), ('counts', {'likes_count': 3}))
+        await subscription.close()
+        broker.publish('post:1', 'counts', {'likes_count': 4})
+        self.assertIsNone(await subscription.get(0.01))
+
+    async def test_event_stream_sends_unread_count_then_post_counts(self):
+        await self.async_client.aforce_login(self.fan)
+        response = await self.async_client.get(reverse('events'), {'posts': f'{self.post.pk},junk'})
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        chunks = aiter(response.streaming_content)
+        self.assertIn(b'event: unread\ndata: {"count": 0}', await anext(chunks))
+        realtime.publish(realtime.post_channel(self.post.pk), 'counts', {'id': self.post.pk, 'likes_count': 1})
+        self.assertIn(b'"likes_count": 1', await anext(chunks))
+        await chunks.aclose()
+
+    def test_like_pushes_counts_and_notification(self):
+        self.client.force_login(self.fan)
+        with mock.patch.object(realtime, 'publish') as publish, self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse('like_contribution', args=[self.post.pk]))
+        published = {(call.args[0], call.args[1]) for call in publish.call_args_list}
+        self.assertEqual(published, {
+            (f'post:{self.post.pk}', 'counts'),
+            (f'user:{self.author.pk}', 'notification'),
+            (f'user:{self.author.pk}', 'unread'),
+        })
+
+
+class SearchTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('kuchipudi_fan', is_staff=True, is_superuser=True)
+        cls.andhra = State.objects.get(name='Andhra Pradesh')
+        cls.assam = State.objects.get(name='Assam')
+
+    def setUp(self):
+        self.client.force_login(self.user)
+
+    def post(self, text, state=None, category='DANCE'):
+        with self.captureOnCommitCallbacks(execute=True):
+            return Contribution.objects.create(author=self.user, state=state or self.andhra, category=category, text_content=text)
+
+    def test_indic_text_is_tokenized_and_prefix_matched(self):
+        post = self.post('కూచిపూడి నృత్యం ఆంధ్రప్రదేశ్ నుండి')
+        self.post('Bihu is danced in spring', state=self.assam)
+        self.assertEqual(search.search('కూచిపూడి')[0], [post.pk])
+        self.assertEqual(search.search('నృత్')[0], [post.pk])
+
+    def test_indic_vowel_signs_do_not_split_words(self):
+        self.post('కూచిపూడి నృత్యం')
+        # Bare consonants and other vowel signs must not match the word
+        self.assertEqual(search.search('కా')[0], [])
+        self.assertEqual(search.search('కి')[0], [])
+        self.assertEqual(search.search('చ')[0], [])
+
+    def test_ranking_filters_and_cursor(self):
+        in_text = self.post('a dance about kuchipudi_fan and friends', state=self.assam)
+        by_author = self.post('harvest festival', category='FOOD')
+        self.assertEqual(search.search('kuchipudi_fan')[0], [by_author.pk, in_text.pk])
+        self.assertEqual(search.search('kuchipudi_fan', state_id=self.assam.pk)[0], [in_text.pk])
+        self.assertEqual(search.search('kuchipudi_fan', category='FOOD')[0], [by_author.pk])
+        first, cursor = search.search('kuchipudi_fan', page_size=1)
+        second, end = search.search('kuchipudi_fan', cursor=cursor, page_size=1)
+        self.assertEqual((first, second, end), ([by_author.pk], [in_text.pk], None))
+
+    def test_index_follows_edits_renames_and_deletes(self):
+        post = self.post('Sattriya from Majuli')
+        post.text_content = 'Bihu from Majuli'
+        with self.captureOnCommitCallbacks(execute=True):
+            post.save()
+        self.assertEqual(search.search('Sattriya')[0], [])
+        with self.captureOnCommitCallbacks(execute=True):
+            User.objects.filter(pk=self.user.pk).update(username='bihu_dancer')
+            self.user.refresh_from_db()
+            self.user.save()
+        self.assertEqual(search.search('bihu_dancer')[0], [post.pk])
+        with self.captureOnCommitCallbacks(execute=True):
+            post.delete()
+        self.assertEqual(search.search('Majuli')[0], [])
+
+    def test_search_view_and_admin_use_the_index(self):
+        post = self.post('Pootharekulu sweets from Atreyapuram', category='FOOD')
+        response = self.client.get(reverse('search'), {'q': 'pootharekulu', 'category': 'FOOD'})
+        self.assertEqual([item.pk for item in response.context['contributions']], [post.pk])
+        response = self.client.get(reverse('admin:portal_contribution_changelist'), {'q': 'atreyapuram'})
+        self.assertEqual(list(response.context['cl'].queryset), [post])
+        self.assertIn('portal_contribution_fts', str(response.context['cl'].queryset.query))
+
+
+class RankingTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user('author')
+        cls.fans = [User.objects.create_user(f'fan{i}') for i in range(3)]
+        cls.kerala = State.objects.get(name='Kerala')
+        cls.goa = State.objects.get(name='Goa')
+
+    def setUp(self):
+        cache.clear()
+        cache.set(f'last-seen:{self.fans[0].pk}', True)
+        notifications.unread_count(self.fans[0].pk)
+        ranking.states()
+        graph.following_ids(self.fans[0].pk)
+        self.client.force_login(self.fans[0])
+        auth.CachedModelBackend().get_user(self.fans[0].pk)
+
+    def post(self, state, category='DANCE', **fields):
+        with self.captureOnCommitCallbacks(execute=True):
+            post = Contribution.objects.create(author=self.author, state=state, category=category, **fields)
+        post.refresh_from_db()
+        return post
+
+    def test_scores_decay_with_the_half_life(self):
+        now = timezone.now().timestamp()
+        day_old = ranking.add_weight(0, 4, now - ranking.HALF_LIFE)
+        self.assertAlmostEqual(day_old, ranking.add_weight(0, 2, now))
+        liked = ranking.add_weight(day_old, 1, now)
+        self.assertGreater(liked, day_old)
+        self.assertAlmostEqual(ranking.add_weight(liked, -1, now), day_old)
+
+    def test_events_update_scores_and_cached_lists(self):
+        older = self.post(self.kerala)
+        newer = self.post(self.goa, category='FOOD')
+        ranking.rebuild_all()
+        self.assertEqual(ranking.top_ids('trending'), [newer.pk, older.pk])
+        self.assertEqual(ranking.top_ids(f'state-{self.kerala.pk}'), [older.pk])
+        with self.captureOnCommitCallbacks(execute=True):
+            for fan in self.fans:
+                older.toggle_like(fan)
+            older.add_comment(self.fans[0], 'Theyyam!')
+        with self.assertNumQueries(0):
+            self.assertEqual(ranking.top_ids('trending'), [older.pk, newer.pk])
+            self.assertEqual(ranking.top_ids('week'), [older.pk, newer.pk])
+            self.assertEqual(ranking.top_ids('category-FOOD'), [newer.pk])
+        # The cached lists agree with a rebuild from the indexed column
+        cache.clear()
+        self.assertEqual(ranking.top_ids('trending'), [older.pk, newer.pk])
+
+    def test_week_list_skips_old_posts(self):
+        old = self.post(self.kerala)
+        Contribution.objects.filter(pk=old.pk).update(submitted_at=timezone.now() - timedelta(days=8), likes_count=50)
+        recent = self.post(self.kerala)
+        cache.clear()
+        self.assertEqual(ranking.top_ids('week'), [recent.pk])
+
+    def test_explore_tabs(self):
+        posts = [self.post(self.kerala) for i in range(5)]
+        with self.captureOnCommitCallbacks(execute=True):
+            posts[0].toggle_like(self.fans[1])
+        for name, title in (('trending', 'Trending'), ('week', 'Top this week'), (f'state-{self.kerala.pk}', 'Top in Kerala')):
+            ranking.top_ids(name)
+            with self.assertNumQueries(3):
+                response = self.client.get(reverse('explore'), {'feed': name, 'page_size': 2})
+            self.assertContains(response, title)
+            self.assertEqual(response.context['contributions'][0], posts[0])
+        response = self.client.get(reverse('feed_more', args=['trending']), {'cursor': '2', 'page_size': 2})
+        self.assertEqual(response.json()['next_cursor'], '4')
+        self.assertEqual(self.client.get(reverse('feed_more', args=['trending']), {'cursor': 'x'}).status_code, 400)
+        self.assertEqual(self.client.get(reverse('explore'), {'feed': 'home'}).status_code, 404)
+        self.assertEqual(self.client.get(reverse('explore'), {'feed': 'state-x'}).status_code, 404)
+
+    def test_rebuild_command_rescores_counters(self):
+        quiet = self.post(self.goa)
+        busy = self.post(self.goa)
+        Contribution.objects.filter(pk=quiet.pk).update(likes_count=10, trending_score=0)
+        call_command('rebuild_rankings', rescore=True, stdout=io.StringIO())
+        self.assertEqual(ranking.top_ids(f'state-{self.goa.pk}'), [quiet.pk, busy.pk])
+
+
+class CardCacheTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user('author')
+        cls.fan = User.objects.create_user('fan')
+        cls.post = Contribution.objects.create(author=cls.author, state=State.objects.first(), category='DANCE', text_content='Perini Sivatandavam')
+        cls.fan.userprofile.follows.add(cls.author.userprofile)
+
+    def setUp(self):
+        cache.clear()
+
+    def explore_as(self, user):
+        self.client.force_login(user)
+        return self.client.get(reverse('explore')).content.decode()
+
+    def test_fragment_is_shared_and_personalized_per_viewer(self):
+        self.post.toggle_like(self.fan)
+        fan_html = self.explore_as(self.fan)
+        author_html = self.explore_as(self.author)
+        self.assertEqual(cards.stats(), {'hits': 1, 'misses': 1, 'hit_rate': 0.5})
+        self.assertIn('❤️', fan_html)
+        self.assertIn('Unfollow', fan_html)
+        self.assertIn('🤍', author_html)
+        self.assertNotIn(reverse('follow_user', args=[self.author.pk]), author_html)
+        self.assertIn('name="csrfmiddlewaretoken"', author_html)
+        self.assertNotIn('<!--viewer:', author_html)
+
+    def test_likes_reuse_the_fragment_and_comments_invalidate_it(self):
+        self.explore_as(self.fan)
+        self.client.post(reverse('like_contribution', args=[self.post.pk]))
+        self.assertIn('1 likes', self.explore_as(self.fan))
+        self.assertEqual(cards.stats()['misses'], 1)
+        self.client.post(reverse('add_comment', args=[self.post.pk]), {'comment_text': 'Adbhutam!'})
+        self.assertIn('Adbhutam!', self.explore_as(self.fan))
+        self.assertEqual(cards.stats()['misses'], 2)
+
+    def test_cards_rendered_before_a_comment_commits_are_dropped_after(self):
+        stale = list(feed.with_card_data(Contribution.objects.filter(pk=self.post.pk)))
+        with self.captureOnCommitCallbacks(execute=True):
+            self.post.add_comment(self.fan, 'Adbhutam!')
+            # A concurrent request still sees the old rows and caches their card
+            cards.render(stale)
+        self.assertIn('Adbhutam!', self.explore_as(self.fan))
+
+    def test_edits_invalidate_every_variant(self):
+        self.explore_as(self.author)
+        self.client.get(reverse('profile'))
+        self.post.text_content = 'Perini Thandavam'
+        self.post.save()
+        self.assertIn('Perini Thandavam', self.client.get(reverse('profile')).content.decode())
+        self.assertIn('Perini Thandavam', self.explore_as(self.author))
+
+
+class InstrumentationTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.staff = User.objects.create_user('staff', is_staff=True)
+        cls.member = User.objects.create_user('member')
+        Contribution.objects.create(author=cls.member, state=State.objects.first(), category='FOOD', text_content='Gongura')
+
+    def setUp(self):
+        instrumentation.registry.reset()
+        self.addCleanup(instrumentation.registry.reset)
+
+    def test_disabled_middleware_is_dropped(self):
+        self.client.force_login(self.member)
+        response = self.client.get(reverse('explore'))
+        self.assertFalse(response.has_header('Server-Timing'))
+        self.assertEqual(instrumentation.registry.snapshot(), {})
+
+    @mock.patch.object(instrumentation, 'PROFILE_RATE', 1.0)
+    @mock.patch.object(instrumentation, 'ENABLED', True)
+    def test_requests_are_measured_and_profiled(self):
+        self.client.force_login(self.member)
+        for _ in range(3):
+            response = self.client.get(reverse('explore'))
+        self.assertIn('total;dur=', response['Server-Timing'])
+        explore = instrumentation.registry.snapshot()['explore']
+        self.assertEqual(explore['count'], 3)
+        self.assertGreater(explore['queries']['quantiles'][0.5], 0)
+        self.assertGreater(explore['template_time']['sum'], 0)
+        self.assertGreater(explore['bytes_sent'], 0)
+        self.assertIn('explore', [profile['view'] for profile in instrumentation.profiles][0])
+
+    @mock.patch.object(instrumentation, 'ENABLED', True)
+    async def test_async_view_queries_are_counted(self):
+        # The test database connection was opened on another thread before the middleware was built
+        await sync_to_async(instrumentation.install_query_recorder)()
+        await self.async_client.aforce_login(self.member)
+        response = await self.async_client.get(reverse('notifications'))
+        recorded = instrumentation.registry.snapshot()['notifications']['queries']['sum']
+        # The page and unread-count queries run in sync_to_async threads
+        self.assertGreater(recorded, 0)
+        self.assertIn(f'desc="{recorded:g} queries"', response['Server-Timing'])
+
+    def test_repeated_query_signatures_are_flagged(self):
+        stats = instrumentation.RequestStats()
+        execute = lambda sql, params, many, context: None
+        for params in ([1], [1, 2], [3, 4, 5]):
+            stats.record_query(execute, f'SELECT 1 FROM t WHERE id IN ({", ".join(["%s"] * len(params))})', params, False, {})
+        stats.record_query(execute, 'SELECT 2', [], False, {})
+        self.assertEqual(stats.duplicates(), {'SELECT 1 FROM t WHERE id IN (...)': 3})
+
+    @mock.patch.object(instrumentation, 'METRICS_TOKEN', 'scrape-me')
+    def test_metrics_endpoint_is_restricted_and_prometheus_formatted(self):
+        instrumentation.registry.record('home', instrumentation.RequestStats(), 0.25, 200, 1024)
+        url = reverse('instrumentation_metrics')
+        self.client.force_login(self.member)
+        self.assertEqual(self.client.get(url).status_code, 403)
+        self.client.logout()
+        self.assertEqual(self.client.get(url, HTTP_AUTHORIZATION='Bearer scrape-you').status_code, 403)
+        body = self.client.get(url, HTTP_AUTHORIZATION='Bearer scrape-me').content.decode()
+        self.assertIn('portal_request_duration_seconds{view="home",quantile="0.99"} 0.25', body)
+        self.assertIn('portal_response_bytes_total{view="home"} 1024', body)
+        self.client.force_login(self.staff)
+        self.assertContains(self.client.get(reverse('instrumentation_report')), 'home')
+
+
+class BenchmarkHarnessTests(TestCase):
+    def test_seed_data_then_benchmark_writes_json(self):
+        call_command('seed_data', users=20, posts_per_user=2, stdout=open(os.devnull, 'w'))
+        self.assertEqual(User.objects.filter(username__startswith='seed_').count(), 21)
+        self.assertEqual(Contribution.objects.filter(author__username__startswith='seed_').count(), 40)
+        self.assertTrue(Contribution.likes.through.objects.exists())
+        with tempfile.NamedTemporaryFile(suffix='.json') as output:
+            call_command('run_benchmark', requests=2, concurrency=1, json_path=output.name, stdout=open(os.devnull, 'w'))
+            with open(output.name) as handle:
+                report = json.load(handle)
+        scenarios = {result['scenario']: result for result in report['results']}
+        self.assertIn('home', scenarios)
+        self.assertIn('like_contribution', scenarios)
+        self.assertEqual(sum(result['errors'] for result in report['results']), 0)
+        self.assertGreater(scenarios['explore']['queries_per_request'], 0)
+        self.assertEqual(set(scenarios['explore']['latency_ms']), {'p50', 'p90', 'p99'})
+
+
+class DatabaseProfileTests(TestCase):
+    def test_new_connections_get_the_configured_pragmas(self):
+        # TestCase runs inside a transaction, where journal_mode and temp_store cannot change
+        pragmas = {'cache_size': -4321, 'busy_timeout': 1234}
+        with mock.patch.object(database, 'PRAGMAS', pragmas):
+            database.configure_connection(sender=None, connection=connection)
+        with connection.cursor() as cursor:
+            cursor.execute('PRAGMA cache_size')
+            self.assertEqual(cursor.fetchone()[0], -4321)
+            cursor.execute('PRAGMA busy_timeout')
+            self.assertEqual(cursor.fetchone()[0], 1234)
+
+    def test_describe_reports_connection_settings(self):
+        info = database.describe()
+        self.assertEqual(info['vendor'], 'sqlite')
+        self.assertIn('journal_mode', info)
+        self.assertFalse(info['pool'])
+
+
+class ReplicaRoutingTests(TestCase):
+    def setUp(self):
+        self.router = database.ReplicaRouter()
+        database.reset_health()
+        for patcher in (
+            mock.patch.object(database, 'REPLICAS', ['replica_1']),
+            mock.patch.object(database, '_check', return_value=True),
+            # TestCase wraps every test in a transaction, which would pin reads to the primary
+            mock.patch.object(connection, 'in_atomic_block', False),
+        ):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def test_reads_go_to_replicas_until_the_request_writes(self):
+        with database.routing() as state:
+            self.assertEqual(self.router.db_for_read(Contribution), 'replica_1')
+            self.assertEqual(self.router.db_for_write(Contribution), 'default')
+            self.assertEqual(self.router.db_for_read(Contribution), 'default')
+        self.assertTrue(state.wrote)
+        self.assertEqual(self.router.db_for_read(Contribution), 'replica_1')
+        with database.primary():
+            self.assertEqual(self.router.db_for_read(Contribution), 'default')
+
+    def test_unhealthy_replicas_fail_over_to_the_primary(self):
+        database._check.return_value = False
+        self.assertEqual(self.router.db_for_read(Contribution), 'default')
+        database._check.return_value = True
+        # The failed check is remembered until the next health check is due
+        self.assertEqual(self.router.db_for_read(Contribution), 'default')
+        with mock.patch.object(database, 'HEALTH_CHECK_SECONDS', 0):
+            self.assertEqual(self.router.db_for_read(Contribution), 'replica_1')
+
+    def test_writing_request_pins_the_browser_to_the_primary(self):
+        # Real requests run here, so keep their reads on the test database
+        connection.in_atomic_block = True
+        user = User.objects.create_user('writer')
+        post = Contribution.objects.create(author=User.objects.create_user('poster'), state=State.objects.first(), category='FOOD')
+        cache.set(f'last-seen:{user.pk}', True)
+        client = Client()
+        client.force_login(user)
+        with mock.patch.object(router, 'routers', [self.router]):
+            response = client.get(reverse('home'))
+            self.assertNotIn(database.PIN_COOKIE, response.cookies)
+            response = client.post(reverse('like_contribution', args=[post.pk]))
+        self.assertEqual(response.cookies[database.PIN_COOKIE]['max-age'], database.STICKY_SECONDS)
+
+
+class AdminDashboardTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_user('admin', is_staff=True, is_superuser=True)
+        state = State.objects.get(name='Assam')
+        Contribution.objects.bulk_create([Contribution(author=cls.admin, state=state, category='DANCE') for i in range(25)])
+        cls.state = state
+
+    def setUp(self):
+        cache.clear()
+        notifications.unread_count(self.admin.pk)
+        self.client.force_login(self.admin)
+        auth.CachedModelBackend().get_user(self.admin.pk)
+
+    def test_dashboard_is_aggregated_and_cached(self):
+        UserProfile.objects.filter(user=self.admin).update(last_seen=timezone.now())
+        with self.assertNumQueries(9):
+            response = self.client.get(reverse('admin:index'))
+        self.assertEqual(response.context['total_contributions'], 25)
+        self.assertEqual(response.context['active_users'], 1)
+        assam = next(row for row in response.context['states'] if row['name'] == 'Assam')
+        self.assertEqual(assam['contribution_count'], 25)
+        with self.assertNumQueries(0):
+            self.client.get(reverse('admin:index'))
+
+    def test_state_drilldown_is_paginated(self):
+        url = reverse('admin_state_contributions', args=[self.state.pk])
+        response = self.client.get(url, {'page_size': 10})
+        self.assertEqual(len(response.context['contributions']), 10)
+        self.assertIsNotNone(response.context['next_cursor'])
+
+    def test_last_seen_write_is_throttled(self):
+        with self.assertNumQueries(3):
+            self.client.get(reverse('create_post'))
+        with self.assertNumQueries(2):
+            self.client.get(reverse('create_post'))
+
+
+class MediaProcessingTests(TestCase):
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root)
+        self.user = User.objects.create_user('photographer')
+        self.client.force_login(self.user)
+
+    def upload(self, width, height):
+        buffer = io.BytesIO()
+        Image.new('RGB', (width, height), 'orange').save(buffer, 'PNG')
+        return SimpleUploadedFile('charminar.png', buffer.getvalue(), content_type='image/png')
+
+    def test_image_renditions_are_recorded(self):
+        with override_settings(MEDIA_ROOT=self.media_root):
+            with self.captureOnCommitCallbacks(execute=True):
+                self.client.post(reverse('create_post'), {
+                    'state': State.objects.first().pk, 'category': 'PLACES', 'text_content': 'Charminar',
+                    'image_content': self.upload(800, 400),
+                })
+            post = Contribution.objects.get(author=self.user)
+            self.assertEqual(post.media_status, Contribution.MEDIA_READY)
+            widths = [r['width'] for r in post.media_renditions['image']]
+            self.assertEqual(widths, [320, 640, 800])
+            self.assertIn('640w', post.image_srcset())
+            self.assertRegex(post.display_image_url(), r'image-800w\.[0-9a-f]{12}\.webp$')
+
+    def test_unprocessable_images_fail_and_keep_the_original(self):
+        with override_settings(MEDIA_ROOT=self.media_root):
+            post = Contribution.objects.create(
+                author=self.user, state=State.objects.first(), category='PLACES', image_content=self.upload(800, 400),
+            )
+            # Far over the pixel limit, so Pillow refuses it as a decompression bomb
+            with mock.patch.object(Image, 'MAX_IMAGE_PIXELS', 1000), self.assertLogs('portal.media', 'ERROR'):
+                self.assertEqual(media.process(post.pk), {})
+            post.refresh_from_db()
+            self.assertEqual(post.media_status, Contribution.MEDIA_FAILED)
+            self.assertEqual(post.display_image_url(), post.image_content.url)
+
+    def test_short_clips_get_a_poster_and_poster_errors_keep_the_transcode(self):
+        def short_clip(*args):
+            # Like ffmpeg on a half-second clip: seeking a second in yields no frame
+            if '-ss' not in args:
+                Path(args[-1]).write_bytes(b'rendition of ' + args[1].encode())
+
+        def broken_poster(*args):
+            if args[-1].endswith('.jpg'):
+                raise subprocess.CalledProcessError(1, 'ffmpeg')
+            Path(args[-1]).write_bytes(b'transcode')
+
+        with override_settings(MEDIA_ROOT=self.media_root), mock.patch.object(media.shutil, 'which', return_value='ffmpeg'):
+            post = Contribution.objects.create(
+                author=self.user, state=State.objects.first(), category='DANCE',
+                video_content=ContentFile(b'\x00\x00\x00\x18ftypmp42', name='clip.mp4'),
+            )
+            with mock.patch.object(media, '_ffmpeg', short_clip):
+                renditions = media.process(post.pk)
+            self.assertEqual(set(renditions), {'poster', 'video'})
+            with mock.patch.object(media, '_ffmpeg', broken_poster), self.assertLogs('portal.media', 'ERROR'):
+                renditions = media.process(post.pk)
+            self.assertEqual(set(renditions), {'video'})
+            post.refresh_from_db()
+            self.assertEqual(post.media_status, Contribution.MEDIA_READY)
+            self.assertEqual(post.video_poster_url(), '')
+
+
+class ChunkedUploadTests(TestCase):
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root)
+        settings_override = override_settings(MEDIA_ROOT=self.media_root)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        partial_dir = mock.patch.object(uploads, 'PARTIAL_DIR', Path(self.media_root) / 'partial')
+        partial_dir.start()
+        self.addCleanup(partial_dir.stop)
+        self.user = User.objects.create_user('dancer')
+        self.client.force_login(self.user)
+        # An MP4 header ahead of arbitrary payload
+        self.data = b'\x00\x00\x00\x18ftypisom' + os.urandom(2488)
+
+    def start(self):
+        response = self.client.post(reverse('upload_start'), {
+            'kind': 'video', 'filename': 'kuchipudi.mp4', 'content_type': 'video/mp4', 'size': len(self.data),
+            'sha256': hashlib.sha256(self.data).hexdigest(),
+        })
+        self.assertEqual(response.status_code, 201)
+        return response.json()['id']
+
+    def put(self, upload_id, start, end, checksum=None):
+        chunk = self.data[start:end]
+        return self.client.put(
+            reverse('upload_detail', args=[upload_id]), chunk, content_type='application/octet-stream',
+            headers={
+                'Content-Range': f'bytes {start}-{end - 1}/{len(self.data)}',
+                'X-Chunk-SHA256': checksum or hashlib.sha256(chunk).hexdigest(),
+            },
+        )
+
+    def test_resumable_upload_is_attached_to_contribution(self):
+        upload_id = self.start()
+        self.assertEqual(self.put(upload_id, 0, 1000).json()['received_size'], 1000)
+        self.assertEqual(self.put(upload_id, 1000, 2000, checksum='0' * 64).status_code, 422)
+        self.assertEqual(self.put(upload_id, 1500, 2500).status_code, 409)
+        self.assertEqual(self.client.get(reverse('upload_detail', args=[upload_id])).json()['received_size'], 1000)
+        self.put(upload_id, 1000, 2500)
+        response = self.client.post(reverse('upload_complete', args=[upload_id]))
+        self.assertEqual(response.json()['status'], UploadSession.COMPLETE)
+
+        self.client.post(reverse('create_post'), {
+            'state': State.objects.first().pk, 'category': 'DANCE', 'text_content': 'Kuchipudi',
+            'video_upload': upload_id,
+        })
+        post = Contribution.objects.get(author=self.user)
+        with post.video_content.open('rb') as video:
+            self.assertEqual(video.read(), self.data)
+        self.assertEqual(UploadSession.objects.get(id=upload_id).status, UploadSession.ATTACHED)
+
+    def test_a_chunk_for_a_taken_offset_is_refused(self):
+        upload_id = self.start()
+        stale = UploadSession.objects.get(id=upload_id)
+        self.put(upload_id, 0, 1000)
+        # A concurrent PUT that read the session before the first one finished
+        with self.assertRaises(uploads.UploadError) as raised:
+            uploads.write_chunk(stale, io.BytesIO(self.data[:1000]), f'bytes 0-999/{len(self.data)}', 1000)
+        self.assertEqual(raised.exception.status, 409)
+        self.assertEqual(stale.received_size, 1000)
+
+    def test_uploads_are_attached_only_once_the_contribution_is_saved(self):
+        upload_id = self.start()
+        self.put(upload_id, 0, len(self.data))
+        self.client.post(reverse('upload_complete', args=[upload_id]))
+        form = ContributionForm({
+            'state': State.objects.first().pk, 'category': 'DANCE', 'text_content': 'Kuchipudi', 'video_upload': upload_id,
+        }, user=self.user)
+        self.assertTrue(form.is_valid(), form.errors)
+        contribution = form.save(commit=False)
+        self.assertEqual(UploadSession.objects.get(id=upload_id).status, UploadSession.COMPLETE)
+        contribution.author = self.user
+        contribution.save()
+        form.save_m2m()
+        self.assertEqual(UploadSession.objects.get(id=upload_id).status, UploadSession.ATTACHED)
+
+    def test_content_is_sniffed_on_completion(self):
+        page = b'<html><script>alert(1)</script></html>'
+        response = self.client.post(reverse('upload_start'), {
+            'kind': 'image', 'filename': 'photo.html', 'content_type': 'image/png', 'size': len(page),
+        })
+        upload_id = response.json()['id']
+        self.client.put(
+            reverse('upload_detail', args=[upload_id]), page, content_type='application/octet-stream',
+            headers={'Content-Range': f'bytes 0-{len(page) - 1}/{len(page)}'},
+        )
+        self.assertEqual(self.client.post(reverse('upload_complete', args=[upload_id])).status_code, 415)
+        self.assertEqual(UploadSession.objects.get(id=upload_id).status, UploadSession.OPEN)
+
+        upload_id = self.start()
+        self.put(upload_id, 0, len(self.data))
+        self.client.post(reverse('upload_complete', args=[upload_id]))
+        session = UploadSession.objects.get(id=upload_id)
+        self.assertTrue(session.stored_name.endswith('.mp4'))
+        self.assertEqual(session.content_type, 'video/mp4')
+
+    def test_direct_uploads_get_the_detected_extension(self):
+        self.client.post(reverse('create_post'), {
+            'state': State.objects.first().pk, 'category': 'TRADITION', 'text_content': 'Bathukamma',
+            'audio_content': SimpleUploadedFile('song.html', b'ID3' + os.urandom(200)),
+        })
+        self.assertTrue(Contribution.objects.get(author=self.user).audio_content.name.endswith('.mp3'))
+        response = self.client.post(reverse('create_post'), {
+            'state': State.objects.first().pk, 'category': 'TRADITION', 'text_content': 'Not audio',
+            'audio_content': SimpleUploadedFile('song.mp3', b'<svg onload="alert(1)"/>'),
+        })
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(Contribution.objects.filter(author=self.user).count(), 1)
+
+    def test_limits_are_enforced_up_front(self):
+        response = self.client.post(reverse('upload_start'), {
+            'kind': 'video', 'filename': 'huge.mp4', 'content_type': 'video/mp4', 'size': uploads.MAX_SIZES['video'] + 1,
+        })
+        self.assertEqual(response.status_code, 413)
+        response = self.client.post(reverse('upload_start'), {
+            'kind': 'video', 'filename': 'script.sh', 'content_type': 'text/x-shellscript', 'size': 10,
+        })
+        self.assertEqual(response.status_code, 415)
+
+
+class MediaBlobTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user('weaver')
+        cls.state = State.objects.first()
+
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root)
+        settings_override = override_settings(MEDIA_ROOT=self.media_root)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.data = b'ikat-' + os.urandom(64)
+
+    def post(self, author=None, **files):
+        return Contribution.objects.create(author=author or self.author, state=self.state, category='ART', **files)
+
+    def files_under(self, top):
+        root = Path(self.media_root) / top
+        return sorted(str(path.relative_to(self.media_root)) for path in root.rglob('*') if path.is_file())
+
+    def gc(self):
+        call_command('gc_media', grace_hours=0, stdout=io.StringIO())
+
+    def test_identical_uploads_share_one_sharded_blob(self):
+        first = self.post(image_content=SimpleUploadedFile('Pochampally.PNG', self.data))
+        second = self.post(image_content=SimpleUploadedFile('copy.png', self.data))
+        digest = hashlib.sha256(self.data).hexdigest()
+        self.assertEqual(first.image_content.name, f'images/{digest[:2]}/{digest[2:4]}/{digest}.png')
+        self.assertEqual(second.image_content.name, first.image_content.name)
+        self.assertEqual(self.files_under('images'), [first.image_content.name])
+        self.assertEqual(MediaBlob.objects.get().ref_count, 2)
+        self.assertIn(f'.{digest[:12]}.png', first.image_content.url)
+
+    def test_deletes_release_references_and_gc_reclaims_the_file(self):
+        weaver = User.objects.create_user('other-weaver')
+        first = self.post(image_content=SimpleUploadedFile('a.png', self.data))
+        self.post(author=weaver, image_content=SimpleUploadedFile('b.png', self.data))
+        first.delete()
+        self.assertEqual(MediaBlob.objects.get().ref_count, 1)
+        self.gc()
+        self.assertEqual(len(self.files_under('images')), 1)
+        weaver.delete()
+        self.assertEqual(MediaBlob.objects.get().ref_count, 0)
+        self.gc()
+        self.assertFalse(MediaBlob.objects.exists())
+        self.assertEqual(self.files_under('images'), [])
+
+    def test_gc_sweeps_unreferenced_files_and_repairs_counts(self):
+        legacy = default_storage.save('images/legacy.png', ContentFile(b'kept'))
+        kept = self.post(image_content=legacy)
+        default_storage.save('images/orphan_9qXwfJY.webp', ContentFile(b'orphan'))
+        default_storage.save(f'renditions/{kept.pk + 1000}/image-320w.webp', ContentFile(b'gone'))
+        held = UploadSession.objects.create(
+            user=self.author, kind='video', filename='v.mp4', content_type='video/mp4', total_size=4,
+            status=UploadSession.COMPLETE, stored_name=blob_storage().save('videos/v.mp4', ContentFile(b'wait')),
+        )
+        MediaBlob.objects.filter(name=held.stored_name).update(ref_count=3)
+        self.gc()
+        self.assertEqual(self.files_under('images'), [legacy])
+        self.assertEqual(self.files_under('renditions'), [])
+        self.assertEqual(self.files_under('videos'), [held.stored_name])
+        self.assertEqual(MediaBlob.objects.get(name=held.stored_name).ref_count, 0)
+
+
+class MediaDeliveryTests(TestCase):
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root)
+        settings_override = override_settings(MEDIA_ROOT=self.media_root)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.data = bytes(range(256)) * 64
+        self.name = default_storage.save('videos/dance.mp4', ContentFile(self.data))
+        self.url = default_storage.url(self.name)
+
+    def test_hashed_url_is_immutable(self):
+        self.assertRegex(self.url, r'^/media/videos/dance\.[0-9a-f]{12}\.mp4$')
+        response = self.client.get(self.url)
+        self.assertEqual(b''.join(response.streaming_content), self.data)
+        self.assertIn('immutable', response['Cache-Control'])
+        plain = self.client.get('/media/videos/dance.mp4')
+        self.assertNotIn('immutable', plain['Cache-Control'])
+
+    def test_range_requests(self):
+        response = self.client.get(self.url, headers={'Range': 'bytes=100-199'})
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response['Content-Range'], f'bytes 100-199/{len(self.data)}')
+        self.assertEqual(b''.join(response.streaming_content), self.data[100:200])
+        suffix = self.client.get(self.url, headers={'Range': 'bytes=-10'})
+        self.assertEqual(b''.join(suffix.streaming_content), self.data[-10:])
+        self.assertEqual(self.client.get(self.url, headers={'Range': f'bytes={len(self.data)}-'}).status_code, 416)
+
+    def test_conditional_get(self):
+        etag = self.client.get(self.url)['ETag']
+        self.assertEqual(self.client.get(self.url, headers={'If-None-Match': etag}).status_code, 304)
+        stale = self.client.get(self.url, headers={'If-Range': '"stale"', 'Range': 'bytes=0-9'})
+        self.assertEqual(stale.status_code, 200)
+
+    def test_offload_to_front_proxy(self):
+        with mock.patch.object(delivery, 'OFFLOAD', 'x-accel-redirect'):
+            response = self.client.get(self.url)
+        self.assertEqual(response['X-Accel-Redirect'], '/protected-media/videos/dance.mp4')
+        self.assertEqual(response.content, b'')
+
+    def test_path_traversal_is_rejected(self):
+        self.assertEqual(self.client.get('/media/../manage.py').status_code, 404)
+
+
+class AssetPipelineTests(TestCase):
+    def test_committed_stylesheets_match_templates(self):
+        call_command('build_assets', check=True, stdout=io.StringIO())
+
+    def test_utilities(self):
+        self.assertEqual(assets.utility('px-6')[1], '.px-6{padding-left:1.5rem;padding-right:1.5rem}')
+        self.assertEqual(
+            assets.utility('md:grid-cols-2')[1],
+            '@media (min-width:768px){.md\\:grid-cols-2{grid-template-columns:repeat(2,minmax(0,1fr))}}',
+        )
+        self.assertEqual(assets.utility('hover:text-secondary')[1], '.hover\\:text-secondary:hover{color:#F97316}')
+        self.assertIsNone(assets.utility('feed_name'))
+        self.assertIsNone(assets.utility('px-13'))
+        # Later utilities win the cascade: hidden must come after every display utility
+        order = sorted(assets.utility(name) for name in ('hidden', 'table', 'inline', 'flex'))
+        self.assertTrue(order[-1][1].startswith('.hidden'))
+
+    def test_pages_use_self_hosted_assets(self):
+        self.client.force_login(User.objects.create_user('reader'))
+        html = self.client.get(reverse('explore')).content.decode()
+        self.assertIn('/static/portal/css/app.css', html)
+        self.assertIn('/static/portal/js/app.js', html)
+        self.assertNotIn('cdn.tailwindcss.com', html)
+        self.assertNotIn('fonts.googleapis.com', html)
+        # The script is precompiled, so it takes every endpoint from <body> rather than hard-coding paths
+        self.assertIn(f'data-notification-read-url="{reverse("mark_notification_as_read", args=[0])}"', html)
+        self.assertNotRegex((assets.OUTPUT_DIR / 'js' / 'app.js').read_text(), r'[`\'"]/[a-z]')
+
+    def test_collected_assets_are_hashed_compressed_and_immutable(self):
+        static_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, static_root)
+        with override_settings(STATIC_ROOT=static_root):
+            call_command('collectstatic', interactive=False, verbosity=0)
+            url = static('portal/css/app.css')
+            self.assertRegex(url, r'^/static/portal/css/app\.[0-9a-f]{12}\.css$')
+            response = self.client.get(url, headers={'Accept-Encoding': 'gzip, deflate'})
+            original = Path(static_root, url.removeprefix('/static/')).read_bytes()
+            self.assertEqual(response['Content-Encoding'], 'gzip')
+            self.assertEqual(response['Content-Type'], 'text/css')
+            self.assertIn('immutable', response['Cache-Control'])
+            self.assertEqual(gzip.decompress(b''.join(response.streaming_content)), original)
+            revalidated = self.client.get(url, headers={'Accept-Encoding': 'gzip', 'If-None-Match': response['ETag']})
+            self.assertEqual(revalidated.status_code, 304)
+            plain = self.client.get('/static/portal/css/app.css', headers={'Accept-Encoding': 'identity'})
+            self.assertNotIn('Content-Encoding', plain)
+            self.assertNotIn('immutable', plain['Cache-Control'])
+            self.assertEqual(b''.join(plain.streaming_content), (assets.OUTPUT_DIR / 'css' / 'app.css').read_bytes())
+
+
+class ApiTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.viewer = User.objects.create_user('viewer')
+        cls.author = User.objects.create_user('author')
+        cls.state = State.objects.get(name='Kerala')
+        cls.posts = []
+        for i in range(12):
+            post = Contribution.objects.create(author=cls.author, state=cls.state, category='DANCE', text_content=f'post {i} ' * 20)
+            post.add_comment(cls.viewer, f'comment {i}')
+            cls.posts.append(post)
+        cls.posts[-1].toggle_like(cls.viewer)
+        cls.viewer.userprofile.follows.add(cls.author.userprofile)
+        notifications.write_batch([(cls.author.pk, cls.viewer.pk, 'started following you', None)])
+
+    def setUp(self):
+        cache.clear()
+        cache.set(f'last-seen:{self.viewer.pk}', True)
+        ranking.states()
+        graph.following_ids(self.viewer.pk)
+        self.client.force_login(self.viewer)
+        auth.CachedModelBackend().get_user(self.viewer.pk)
+
+    def test_contribution_pages(self):
+        url = reverse('api_contributions')
+        seen, cursor = [], None
+        while True:
+            data = self.client.get(url, {'page_size': 5, **({'cursor': cursor} if cursor else {})}).json()
+            seen.extend(item['id'] for item in data['data'])
+            if not data['has_more']:
+                break
+            cursor = data['next_cursor']
+        self.assertEqual(seen, [post.pk for post in reversed(self.posts)])
+        first = self.client.get(url, {'page_size': 1}).json()['data'][0]
+        self.assertEqual((first['author']['username'], first['state']['name']), ('author', 'Kerala'))
+        self.assertTrue(first['viewer_has_liked'])
+        self.assertTrue(first['viewer_follows_author'])
+        self.assertEqual(first['comment_preview'][0]['text'], 'comment 11')
+        self.assertEqual(self.client.get(url, {'cursor': '!!!'}).status_code, 400)
+        self.assertEqual(self.client.get(url, {'feed': 'nope'}).status_code, 404)
+        self.assertEqual(len(self.client.get(url, {'state': self.state.pk, 'author': 'nobody'}).json()['data']), 0)
+
+    def test_page_query_count_is_constant(self):
+        url = reverse('api_contributions')
+        # Contributions with authors and states, the viewer's likes, comment previews
+        with self.assertNumQueries(3):
+            self.client.get(url, {'page_size': 2})
+        with self.assertNumQueries(3):
+            self.client.get(url, {'page_size': 12})
+        # Per-viewer fields that aren't asked for aren't queried
+        with self.assertNumQueries(1):
+            data = self.client.get(url, {'page_size': 12, 'fields': 'id,text,likes_count'}).json()['data']
+        self.assertEqual(set(data[0]), {'id', 'text', 'likes_count'})
+
+    def test_etag_and_compression(self):
+        url = reverse('api_contributions')
+        response = self.client.get(url)
+        self.assertEqual(response['Cache-Control'], 'private, no-cache')
+        self.assertFalse(response['ETag'].startswith('W/'))
+        self.assertEqual(self.client.get(url, headers={'If-None-Match': response['ETag']}).status_code, 304)
+        zipped = self.client.get(url, headers={'Accept-Encoding': 'gzip'})
+        self.assertEqual(zipped['Content-Encoding'], 'gzip')
+        self.assertIn('Accept-Encoding', zipped['Vary'])
+        self.assertNotEqual(zipped['ETag'], response['ETag'])
+        self.assertEqual(gzip.decompress(zipped.content), response.content)
+        self.assertEqual(self.client.get(url, headers={'Accept-Encoding': 'gzip', 'If-None-Match': zipped['ETag']}).status_code, 304)
+        self.posts[0].toggle_like(self.author)
+        self.assertEqual(self.client.get(url, headers={'If-None-Match': response['ETag']}).status_code, 200)
+
+    def test_detail_media_and_related_resources(self):
+        post = self.posts[0]
+        Contribution.objects.filter(pk=post.pk).update(media_renditions={
+            'image': [{'name': 'renditions/1/small.webp', 'width': 320, 'height': 240},
+                      {'name': 'renditions/1/large.webp', 'width': 1280, 'height': 960}],
+        })
+        data = self.client.get(reverse('api_contribution', args=[post.pk])).json()['data']
+        image = data['media']['image']
+        self.assertTrue(image['url'].startswith('http://testserver/media/renditions/1/large'))
+        self.assertEqual([r['width'] for r in image['renditions']], [320, 1280])
+        self.assertEqual(self.client.get(reverse('api_contribution', args=[0])).status_code, 404)
+        comments = self.client.get(reverse('api_contribution_comments', args=[post.pk])).json()['data']
+        self.assertEqual(comments[0]['author']['username'], 'viewer')
+        user = self.client.get(reverse('api_user', args=['author'])).json()['data']
+        self.assertEqual((user['followers_count'], user['viewer_follows']), (1, True))
+        states = self.client.get(reverse('api_states'), {'fields': 'name'}).json()['data']
+        self.assertIn({'name': 'Kerala'}, states)
+
+    def test_notifications_need_a_session(self):
+        self.client.force_login(self.author)
+        data = self.client.get(reverse('api_notifications')).json()['data']
+        self.assertEqual(data[0]['text'], 'viewer started following you')
+        self.client.logout()
+        self.assertEqual(self.client.get(reverse('api_notifications')).status_code, 401)
+        self.assertEqual(self.client.post(reverse('api_states')).status_code, 405)
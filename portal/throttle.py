@@ -0,0 +1,53 @@
+# portal/throttle.py
+"""
+Per-user token buckets kept in the cache.
+
+A bucket holds up to ``capacity`` tokens and refills at ``rate`` tokens per
+second; each action spends tokens and is refused once the bucket is empty,
+so short bursts pass while sustained hammering is held to ``rate``. Bucket
+state lives in the default cache so every worker shares it. Updates are
+serialized per process only, so across processes a few requests may slip
+through at the same instant; the limit still holds over any longer window.
+"""
+import math
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+
+LIKE_RATE = getattr(settings, 'LIKE_THROTTLE_RATE', 2.0)
+LIKE_BURST = getattr(settings, 'LIKE_THROTTLE_BURST', 50)
+
+
+class TokenBucket:
+    def __init__(self, scope, rate, capacity):
+        self.scope = scope
+        self.rate = rate
+        self.capacity = capacity
+        self._lock = threading.Lock()
+
+    def _key(self, user_id):
+        return f'throttle:{self.scope}:{user_id}'
+
+    def consume(self, user_id, tokens=1):
+        """Spend ``tokens``; returns ``(allowed, retry_after_seconds)``."""
+        key = self._key(user_id)
+        with self._lock:
+            now = time.time()
+            level, updated = cache.get(key) or (self.capacity, now)
+            level = min(self.capacity, level + (now - updated) * self.rate)
+            allowed = level >= tokens
+            if allowed:
+                level -= tokens
+            # Forget idle buckets once they would have refilled anyway
+            cache.set(key, (level, now), math.ceil(self.capacity / self.rate) + 1)
+        if allowed:
+            return True, 0
+        return False, math.ceil((tokens - level) / self.rate)
+
+    def reset(self, user_id):
+        cache.delete(self._key(user_id))
+
+
+likes = TokenBucket('likes', LIKE_RATE, LIKE_BURST)
@@ -0,0 +1,206 @@
+# portal/timeline.py
+"""
+Materialized home timelines.
+
+New contributions are fanned out on write into ``TimelineEntry`` rows for
+the author's followers and for everyone subscribed to the post's category,
+so reading a home feed is a single range scan over
+``(user, -submitted_at, -contribution)``.
+
+Authors with more than ``TIMELINE_FANOUT_FOLLOWER_LIMIT`` followers are not
+fanned out to their followers, nor posts in categories with more than
+``TIMELINE_FANOUT_SUBSCRIBER_LIMIT`` subscribers to those subscribers; such
+posts are pulled at read time and merged into the page instead (the usual
+hybrid push/pull split), so a post never costs more than about the two limits
+in timeline writes.
+"""
+import asyncio
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Q
+
+from . import graph
+from .models import CategorySubscription, Contribution, TimelineEntry, UserProfile
+from .pagination import after_cursor, clamp_page_size, split_page
+
+FANOUT_FOLLOWER_LIMIT = getattr(settings, 'TIMELINE_FANOUT_FOLLOWER_LIMIT', 5000)
+FANOUT_SUBSCRIBER_LIMIT = getattr(settings, 'TIMELINE_FANOUT_SUBSCRIBER_LIMIT', 5000)
+# Subscriber counts only drift slowly, so which categories are pulled is cached briefly
+PULLED_CATEGORIES_SECONDS = 60
+BACKFILL_LIMIT = getattr(settings, 'TIMELINE_BACKFILL_LIMIT', 200)
+BATCH_SIZE = 1000
+
+
+# --- Audiences ---
+
+def follower_ids(author_id):
+    return graph.follower_ids(author_id)
+
+
+def followed_ids(user_id):
+    return graph.following_ids(user_id)
+
+
+def category_subscriber_ids(category):
+    return CategorySubscription.objects.subscriber_ids(category)
+
+
+def subscribed_categories(user_id):
+    return list(CategorySubscription.objects.categories_for(user_id))
+
+
+def is_high_fanout(author_id):
+    return UserProfile.objects.filter(user_id=author_id, followers_count__gt=FANOUT_FOLLOWER_LIMIT).exists()
+
+
+def _pulled_queryset(user_id):
+    return UserProfile.objects.filter(
+        followed_by__user_id=user_id, followers_count__gt=FANOUT_FOLLOWER_LIMIT,
+    ).values_list('user_id', flat=True)
+
+
+def pulled_author_ids(user_id):
+    """Followed authors whose posts are merged in at read time instead of pushed."""
+    return list(_pulled_queryset(user_id))
+
+
+def _pulled_categories_key():
+    return f'timeline:pulled-categories:{FANOUT_SUBSCRIBER_LIMIT}'
+
+
+def high_fanout_categories():
+    """Categories whose posts are pulled at read time instead of pushed to their subscribers."""
+    categories = cache.get(_pulled_categories_key())
+    if categories is None:
+        counts = CategorySubscription.objects.subscriber_counts()
+        categories = sorted(category for category, count in counts.items() if count > FANOUT_SUBSCRIBER_LIMIT)
+        cache.set(_pulled_categories_key(), categories, PULLED_CATEGORIES_SECONDS)
+    return categories
+
+
+def _pulled_categories_queryset(user_id, categories):
+    return CategorySubscription.objects.filter(user_id=user_id, category__in=categories).values_list('category', flat=True)
+
+
+def pulled_categories(user_id):
+    """Subscribed categories whose posts are merged in at read time instead of pushed."""
+    categories = high_fanout_categories()
+    return list(_pulled_categories_queryset(user_id, categories)) if categories else []
+
+
+# --- Writes ---
+
+def _insert(pairs):
+    """Bulk-insert ``(user_id, contribution)`` pairs, skipping ones already present."""
+    batch = []
+    for user_id, contribution in pairs:
+        batch.append(TimelineEntry(user_id=user_id, contribution_id=contribution.pk, submitted_at=contribution.submitted_at))
+        if len(batch) >= BATCH_SIZE:
+            TimelineEntry.objects.bulk_create(batch, ignore_conflicts=True)
+            batch = []
+    if batch:
+        TimelineEntry.objects.bulk_create(batch, ignore_conflicts=True)
+
+
+def fan_out(contribution):
+    """Push a newly created contribution into its audience's timelines."""
+    recipients = set()
+    if contribution.category not in high_fanout_categories():
+        recipients.update(category_subscriber_ids(contribution.category))
+    if not is_high_fanout(contribution.author_id):
+        recipients.update(follower_ids(contribution.author_id))
+    _insert((user_id, contribution) for user_id in recipients)
+
+
+def _recent(queryset):
+    return queryset.only('id', 'submitted_at').order_by('-submitted_at', '-id')[:BACKFILL_LIMIT]
+
+
+def backfill_author(user_id, author_id):
+    """Called after ``user_id`` starts following ``author_id``."""
+    if is_high_fanout(author_id):
+        return
+    _insert((user_id, c) for c in _recent(Contribution.objects.filter(author_id=author_id)))
+
+
+def prune_author(user_id, author_id):
+    """Called after ``user_id`` stops following ``author_id``."""
+    TimelineEntry.objects.filter(user_id=user_id, contribution__author_id=author_id).exclude(
+        contribution__category__in=subscribed_categories(user_id),
+    ).delete()
+
+
+def add_categories(user_id, categories):
+    categories = set(categories).difference(high_fanout_categories())
+    if not categories:
+        return
+    _insert((user_id, c) for c in _recent(Contribution.objects.filter(category__in=categories)))
+
+
+def remove_categories(user_id, categories):
+    if not categories:
+        return
+    TimelineEntry.objects.filter(user_id=user_id, contribution__category__in=categories).exclude(
+        contribution__author_id__in=list(followed_ids(user_id)),
+    ).delete()
+
+
+def rebuild(user_id):
+    """Recompute a user's timeline from scratch, e.g. after changing the fan-out limit."""
+    TimelineEntry.objects.filter(user_id=user_id).delete()
+    add_categories(user_id, subscribed_categories(user_id))
+    for author_id in followed_ids(user_id):
+        backfill_author(user_id, author_id)
+
+
+# --- Reads ---
+
+def _entry_rows(viewer, cursor, page_size):
+    entries = after_cursor(TimelineEntry.objects.filter(user_id=viewer.pk), cursor, pk_field='contribution_id')
+    return entries.order_by('-submitted_at', '-contribution_id').values_list('submitted_at', 'contribution_id')[:page_size + 1]
+
+
+def _direct_rows(pulled, categories, cursor, page_size):
+    direct = after_cursor(Contribution.objects.filter(Q(author_id__in=pulled) | Q(category__in=categories)), cursor)
+    return direct.order_by('-submitted_at', '-id').values_list('submitted_at', 'id')[:page_size + 1]
+
+
+def _page(rows, page_size):
+    rows, next_cursor = split_page(rows, page_size, key=lambda row: row)
+    return [pk for submitted_at, pk in rows], next_cursor
+
+
+def page_ids(viewer, cursor=None, page_size=None):
+    """Contribution ids for one page of ``viewer``'s home feed and the next cursor."""
+    page_size = clamp_page_size(page_size)
+    rows = list(_entry_rows(viewer, cursor, page_size))
+    pulled, categories = pulled_author_ids(viewer.pk), pulled_categories(viewer.pk)
+    if pulled or categories:
+        rows.extend(_direct_rows(pulled, categories, cursor, page_size))
+        rows = sorted(set(rows), reverse=True)
+    return _page(rows, page_size)
+
+
+async def apage_ids(viewer, cursor=None, page_size=None):
+    """``page_ids`` through the async ORM, reading the timeline and the pulled authors concurrently."""
+    page_size = clamp_page_size(page_size)
+
+    async def entries():
+        return [row async for row in _entry_rows(viewer, cursor, page_size)]
+
+    async def pulled():
+        return [pk async for pk in _pulled_queryset(viewer.pk)]
+
+    async def categories():
+        high_fanout = await sync_to_async(high_fanout_categories)()
+        if not high_fanout:
+            return []
+        return [category async for category in _pulled_categories_queryset(viewer.pk, high_fanout)]
+
+    rows, pulled_ids, category_names = await asyncio.gather(entries(), pulled(), categories())
+    if pulled_ids or category_names:
+        rows.extend([row async for row in _direct_rows(pulled_ids, category_names, cursor, page_size)])
+        rows = sorted(set(rows), reverse=True)
+    return _page(rows, page_size)
@@ -0,0 +1,249 @@
+# portal/uploads.py
+"""
+Resumable, chunked uploads for large media.
+
+A client opens an ``UploadSession`` declaring the file's name, type and
+size, then PUTs consecutive byte ranges. Each chunk is streamed straight to
+a partial file on disk (never buffered in memory) and verified against its
+``X-Chunk-SHA256`` header before the session's offset advances, so a
+dropped connection resumes from the last good byte. Completing the session
+checks the assembled file's bytes and moves it into the contribution
+storage under the extension of the type it really is, after which
+``ContributionForm`` can attach it by id. Files the client mislabelled, or
+that aren't media at all, are rejected with a 415. Stored files may be shared with
+other posts (see ``portal.blobs``), so discarding a session leaves its file
+to ``gc_media``.
+"""
+import hashlib
+import os
+from pathlib import Path
+
+from django.conf import settings
+from django.core.files import File
+from django.db import transaction
+from PIL import Image
+
+from .models import Contribution, UploadSession
+
+MB = 1024 * 1024
+CHUNK_SIZE = getattr(settings, 'UPLOAD_CHUNK_SIZE', 5 * MB)
+MAX_SIZES = getattr(settings, 'UPLOAD_MAX_SIZES', {
+    'image': 20 * MB,
+    'audio': 200 * MB,
+    'video': 2048 * MB,
+})
+ALLOWED_TYPES = getattr(settings, 'UPLOAD_ALLOWED_TYPES', {
+    'image': ('image/jpeg', 'image/png', 'image/webp', 'image/gif'),
+    'audio': ('audio/mpeg', 'audio/mp4', 'audio/x-m4a', 'audio/aac', 'audio/ogg', 'audio/wav', 'audio/webm'),
+    'video': ('video/mp4', 'video/webm', 'video/quicktime', 'video/x-matroska'),
+})
+# What Pillow may report for an allowed image, and the type and extension it is stored as
+IMAGE_FORMATS = {
+    'JPEG': ('image/jpeg', '.jpg'),
+    'PNG': ('image/png', '.png'),
+    'WEBP': ('image/webp', '.webp'),
+    'GIF': ('image/gif', '.gif'),
+}
+SNIFF_BYTES = 64
+PARTIAL_DIR = Path(getattr(settings, 'UPLOAD_PARTIAL_DIR', Path(settings.MEDIA_ROOT) / 'uploads' / 'partial'))
+READ_BLOCK = 64 * 1024
+
+
+class UploadError(Exception):
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+
+class _AssembledFile(File):
+    # Lets FileSystemStorage move the partial file into place instead of copying it
+    def temporary_file_path(self):
+        return self.file.name
+
+
+def partial_path(session):
+    return PARTIAL_DIR / f'{session.pk}.part'
+
+
+def start(user, kind, filename, content_type, total_size, sha256=''):
+    if kind not in MAX_SIZES:
+        raise UploadError(f'Unknown upload kind {kind!r}.')
+    if content_type not in ALLOWED_TYPES[kind]:
+        raise UploadError(f'{content_type or "This file type"} is not allowed for {kind} uploads.', status=415)
+    try:
+        total_size = int(total_size)
+    except (TypeError, ValueError):
+        raise UploadError('A numeric size is required.')
+    if not 0 < total_size <= MAX_SIZES[kind]:
+        raise UploadError(f'{kind.capitalize()} uploads must be between 1 byte and {MAX_SIZES[kind] // MB} MB.', status=413)
+    filename = os.path.basename(filename or '').strip()
+    if not filename:
+        raise UploadError('A file name is required.')
+    session = UploadSession.objects.create(
+        user=user, kind=kind, filename=filename[:255], content_type=content_type,
+        total_size=total_size, sha256=(sha256 or '').lower(),
+    )
+    PARTIAL_DIR.mkdir(parents=True, exist_ok=True)
+    partial_path(session).touch()
+    return session
+
+
+def parse_content_range(header):
+    """``bytes <start>-<end>/<total>`` -> ``(start, end, total)``, with ``end`` inclusive."""
+    try:
+        unit, spec = header.split(' ', 1)
+        span, total = spec.split('/', 1)
+        first, last = span.split('-', 1)
+        first, last, total = int(first), int(last), int(total)
+    except (AttributeError, ValueError):
+        raise UploadError('A Content-Range header of the form "bytes start-end/total" is required.')
+    if unit != 'bytes' or first > last:
+        raise UploadError('Invalid Content-Range header.')
+    return first, last, total
+
+
+def write_chunk(session, stream, content_range, content_length, checksum=''):
+    """Append one chunk from ``stream`` to the session's partial file."""
+    with transaction.atomic():
+        # Re-read under a lock held until the chunk is recorded, so a concurrent PUT for the
+        # same offset waits and then finds the offset taken instead of writing over this one
+        session.status, session.received_size = (
+            UploadSession.objects.select_for_update().values_list('status', 'received_size').get(pk=session.pk)
+        )
+        return _write_chunk(session, stream, content_range, content_length, checksum)
+
+
+def _write_chunk(session, stream, content_range, content_length, checksum):
+    if session.status != UploadSession.OPEN:
+        raise UploadError('This upload is already complete.', status=409)
+    first, last, total = parse_content_range(content_range)
+    length = last - first + 1
+    if total != session.total_size or last >= session.total_size:
+        raise UploadError('Content-Range does not match the declared file size.', status=416)
+    if first != session.received_size:
+        raise UploadError(f'Expected a chunk starting at byte {session.received_size}.', status=409)
+    if length > CHUNK_SIZE:
+        raise UploadError(f'Chunks may be at most {CHUNK_SIZE} bytes.', status=413)
+    if content_length != length:
+        raise UploadError('Content-Length does not match Content-Range.')
+
+    digest = hashlib.sha256()
+    remaining = length
+    with open(partial_path(session), 'r+b') as partial:
+        partial.seek(first)
+        while remaining:
+            block = stream.read(min(READ_BLOCK, remaining))
+            if not block:
+                break
+            digest.update(block)
+            partial.write(block)
+            remaining -= len(block)
+        if remaining or (checksum and digest.hexdigest() != checksum.lower()):
+            # Drop the bad bytes so the client can retry from the same offset
+            partial.truncate(first)
+            raise UploadError('Chunk was incomplete or failed its checksum.', status=422)
+        partial.truncate(last + 1)
+    session.received_size = last + 1
+    session.save(update_fields=['received_size', 'updated_at'])
+    return session
+
+
+def _file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as handle:
+        for block in iter(lambda: handle.read(READ_BLOCK * 16), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+# --- Content sniffing ---
+
+def _sniff_image(handle):
+    try:
+        with Image.open(handle) as image:
+            image_format = image.format
+            image.verify()
+    # Pillow reports corrupt or hostile files with many exception types
+    except Exception:
+        return None
+    return IMAGE_FORMATS.get(image_format)
+
+
+def _sniff_media(kind, head):
+    box = head[4:8]
+    if box == b'ftyp':
+        if kind == 'audio':
+            return 'audio/mp4', '.m4a'
+        if head[8:12] == b'qt  ':
+            return 'video/quicktime', '.mov'
+        return 'video/mp4', '.mp4'
+    if kind == 'video' and box in (b'moov', b'mdat', b'wide', b'free'):
+        return 'video/quicktime', '.mov'
+    if head.startswith(b'\x1a\x45\xdf\xa3'):
+        if b'webm' in head:
+            return f'{kind}/webm', '.webm'
+        return 'video/x-matroska', '.mkv'
+    if head.startswith(b'OggS'):
+        return 'audio/ogg', '.ogg'
+    if head.startswith(b'RIFF') and head[8:12] == b'WAVE':
+        return 'audio/wav', '.wav'
+    if head.startswith(b'ID3'):
+        return 'audio/mpeg', '.mp3'
+    if len(head) > 1 and head[0] == 0xFF:
+        # Frame sync: ADTS AAC has layer bits 00, MPEG audio doesn't
+        if head[1] & 0xF6 == 0xF0:
+            return 'audio/aac', '.aac'
+        if head[1] & 0xE0 == 0xE0:
+            return 'audio/mpeg', '.mp3'
+    return None
+
+
+def detect(kind, handle):
+    """
+    ``(content_type, extension)`` of the file open in ``handle``, judged by
+    its bytes; raises ``UploadError`` unless it is a type allowed for ``kind``.
+    """
+    handle.seek(0)
+    if kind == 'image':
+        detected = _sniff_image(handle)
+    else:
+        detected = _sniff_media(kind, handle.read(SNIFF_BYTES))
+    handle.seek(0)
+    if detected is None or detected[0] not in ALLOWED_TYPES[kind]:
+        raise UploadError(f'The file is not a supported {kind} format.', status=415)
+    return detected
+
+
+def stored_filename(filename, extension):
+    """``filename`` with its extension replaced by the detected one."""
+    return os.path.splitext(filename)[0] + extension
+
+
+def complete(session):
+    """Verify the assembled file and move it into the contribution storage."""
+    if session.status != UploadSession.OPEN:
+        raise UploadError('This upload is already complete.', status=409)
+    if session.received_size != session.total_size:
+        raise UploadError(f'Only {session.received_size} of {session.total_size} bytes were received.', status=409)
+    path = partial_path(session)
+    if session.sha256 and _file_sha256(path) != session.sha256:
+        raise UploadError('The assembled file does not match its checksum.', status=422)
+    field = Contribution._meta.get_field(f'{session.kind}_content')
+    with open(path, 'rb') as handle:
+        content_type, extension = detect(session.kind, handle)
+        filename = stored_filename(session.filename, extension)
+        stored_name = field.storage.save(field.generate_filename(None, filename), _AssembledFile(handle))
+    if path.exists():
+        path.unlink()
+    session.stored_name = stored_name
+    session.content_type = content_type
+    session.status = UploadSession.COMPLETE
+    session.save(update_fields=['stored_name', 'content_type', 'status', 'updated_at'])
+    return session
+
+
+def discard(session):
+    path = partial_path(session)
+    if path.exists():
+        path.unlink()
+    session.delete()
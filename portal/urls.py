@@ -1,25 +1,46 @@
 # portal/urls.py
 from django.urls import path
-from . import views
+from . import api, views
 
 urlpatterns = [
     path('register/', views.register, name='register'),
     path('profile/', views.profile, name='profile'),
     path('create/', views.create_post, name='create_post'), # The new URL for creating posts
+    path('uploads/', views.upload_start, name='upload_start'),
+    path('uploads/<uuid:upload_id>/', views.upload_detail, name='upload_detail'),
+    path('uploads/<uuid:upload_id>/complete/', views.upload_complete, name='upload_complete'),
     path('', views.home, name='home'), # This is now the main feed
     
     path('profile/edit/', views.edit_profile, name='edit_profile'),
     path('explore/', views.explore, name='explore'),
+    path('search/', views.search, name='search'),
+    path('feed/<str:feed_name>/more/', views.feed_more, name='feed_more'),
     # portal/urls.py
 # ...
 
     path('user/<str:username>/', views.public_profile, name='public_profile'),
     path('notifications/', views.notifications, name='notifications'),
+    path('events/', views.events, name='events'),
+    path('notifications/read-all/', views.mark_all_notifications_as_read, name='mark_all_notifications_as_read'),
     path('notifications/read/<int:notification_id>/', views.mark_notification_as_read, name='mark_notification_as_read'),
 
 
     # Social URLs
     path('like/<int:contribution_id>/', views.like_contribution, name='like_contribution'),
+    path('likes/', views.like_batch, name='like_batch'),
     path('comment/<int:contribution_id>/', views.add_comment, name='add_comment'),
     path('follow/<int:user_id>/', views.follow_user, name='follow_user'),
+
+    # Read-only JSON API for the mobile clients, see portal.api
+    path('api/v1/contributions/', api.contributions, name='api_contributions'),
+    path('api/v1/contributions/<int:contribution_id>/', api.contribution_detail, name='api_contribution'),
+    path('api/v1/contributions/<int:contribution_id>/comments/', api.contribution_comments, name='api_contribution_comments'),
+    path('api/v1/states/', api.states, name='api_states'),
+    path('api/v1/users/<str:username>/', api.user_detail, name='api_user'),
+    path('api/v1/notifications/', api.notification_list, name='api_notifications'),
+
+    # Admin dashboard drill-down
+    path('dashboard/state/<int:state_id>/', views.admin_state_contributions, name='admin_state_contributions'),
+    path('dashboard/instrumentation/', views.instrumentation_report, name='instrumentation_report'),
+    path('dashboard/instrumentation/metrics/', views.instrumentation_metrics, name='instrumentation_metrics'),
 ]
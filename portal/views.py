@@ -1,14 +1,21 @@
 # portal/views.py
-from django.shortcuts import render, redirect, get_object_or_404
+import asyncio
+import json
+
+from django.shortcuts import render, redirect, get_object_or_404, aget_object_or_404
 from django.contrib.auth import login as auth_login
 from django.contrib.auth.decorators import login_required
 from django.contrib.admin.views.decorators import staff_member_required
-from django.http import JsonResponse
-from django.db.models import Q
+from django.views.decorators.http import require_http_methods, require_POST
+from django.http import Http404, HttpResponse, JsonResponse, StreamingHttpResponse
+from django.template.loader import render_to_string
 from django.contrib.auth.models import User
-from django.contrib.sessions.models import Session
-from django.utils import timezone
-from .models import State, Contribution, Comment, UserProfile 
+from django.db import transaction
+from django.utils.crypto import constant_time_compare
+from asgiref.sync import sync_to_async
+from .models import State, Contribution, Notification, UploadSession
+from . import auth, cards, dashboard, feed, graph, instrumentation, media, notifications as notification_service, ranking, realtime, search as search_service, throttle, timeline, uploads
+from .pagination import InvalidCursor
 from .forms import (
     ContributionForm, 
     CustomUserCreationForm, 
@@ -45,150 +52,431 @@ def register(request):
 
 # --- Core User-facing Views ---
 
+# The hot read views are async: their queries go through the async ORM and
+# only template rendering (which may touch the session, cache and lazy
+# relations) runs in a worker thread.
+arender = sync_to_async(render)
+
+async def _viewer(request):
+    user = await request.auser()
+    # request.user caches separately from auser(); share the loaded user so templates don't fetch it again
+    request.user = user
+    return user
+
+async def _feed_response(request, feed_name, template, context):
+    user = await _viewer(request)
+    try:
+        page = await feed.aget_feed(feed_name, user, request.GET.get('cursor'), request.GET.get('page_size'))
+    except InvalidCursor:
+        raise Http404('Invalid cursor')
+    context.update({
+        'contributions': page.items,
+        'next_cursor': page.next_cursor,
+        'feed_name': feed_name,
+    })
+    return await arender(request, template, context)
+
 @login_required
-def home(request):
-    profile, created = UserProfile.objects.get_or_create(user=request.user)
-    followed_users = profile.follows.all()
-    followed_categories = profile.followed_categories.split(',')
-    query = Q(author__userprofile__in=followed_users) | Q(category__in=followed_categories)
-    feed_items = Contribution.objects.filter(query).distinct().order_by('-submitted_at')
-    context = {
-        'contributions': feed_items,
-        'is_personal_feed': True 
+async def home(request):
+    return await _feed_response(request, 'home', 'home.html', {'is_personal_feed': True})
+
+def _explore_tabs(feed_name):
+    return {
+        'state_tabs': [(f'state-{pk}', name) for pk, name in ranking.states()],
+        'feed_title': ranking.title(feed_name) if feed_name != 'explore' else None,
     }
-    return render(request, 'home.html', context)
 
 @login_required
-def explore(request):
-    all_contributions = Contribution.objects.all().order_by('-submitted_at')
+async def explore(request):
+    """Latest posts, or the ranked list named by ``?feed=`` (trending, week, state-<id>, category-<code>)."""
+    feed_name = request.GET.get('feed') or 'explore'
+    if feed_name == 'home' or not feed.is_feed(feed_name):
+        raise Http404('Unknown feed')
+    context = await sync_to_async(_explore_tabs)(feed_name)
+    return await _feed_response(request, feed_name, 'home.html', context)
+
+@login_required
+def search(request):
+    query = request.GET.get('q', '').strip()
+    state_id = request.GET.get('state', '')
+    state_id = int(state_id) if state_id.isdigit() else None
+    category = request.GET.get('category', '')
+    category = category if category in dict(Contribution.CATEGORY_CHOICES) else None
+    try:
+        ids, next_cursor = search_service.search(
+            query, state_id, category, request.GET.get('cursor'), request.GET.get('page_size'),
+        )
+    except search_service.InvalidCursor:
+        raise Http404('Invalid cursor')
+    page = feed.page_from_ids(ids, request.user, next_cursor)
+    next_query = None
+    if next_cursor:
+        params = request.GET.copy()
+        params['cursor'] = next_cursor
+        next_query = params.urlencode()
     context = {
-        'contributions': all_contributions
+        'query': query,
+        'contributions': page.items,
+        'next_query': next_query,
+        'states': State.objects.all(),
+        'selected_state': state_id,
+        'categories': Contribution.CATEGORY_CHOICES,
+        'selected_category': category,
     }
-    return render(request, 'home.html', context)
+    return render(request, 'search.html', context)
+
+@login_required
+def feed_more(request, feed_name):
+    """Next page of a feed as an HTML fragment, wrapped in JSON unless ?format=html."""
+    if not feed.is_feed(feed_name):
+        raise Http404('Unknown feed')
+    try:
+        page = feed.get_feed(feed_name, request.user, request.GET.get('cursor'), request.GET.get('page_size'))
+    except InvalidCursor:
+        return JsonResponse({'error': 'Invalid cursor'}, status=400)
+    html = render_to_string('partials/feed_items.html', {'contributions': page.items}, request=request)
+    if request.GET.get('format') == 'html':
+        response = HttpResponse(html)
+        response['X-Next-Cursor'] = page.next_cursor or ''
+        return response
+    return JsonResponse({'html': html, 'next_cursor': page.next_cursor, 'has_more': page.has_more})
 
 @login_required
 def create_post(request):
     if request.method == 'POST':
-        form = ContributionForm(request.POST, request.FILES)
+        form = ContributionForm(request.POST, request.FILES, user=request.user)
         if form.is_valid():
             new_contribution = form.save(commit=False)
             new_contribution.author = request.user
-            new_contribution.save()
+            with transaction.atomic():
+                new_contribution.save()
+                form.save_m2m()
+            transaction.on_commit(lambda: timeline.fan_out(new_contribution))
+            media.schedule(new_contribution)
             return redirect('profile') 
     else:
-        form = ContributionForm()
+        form = ContributionForm(user=request.user)
     context = { 'form': form }
     return render(request, 'create_post.html', context)
 
+# --- Chunked Uploads ---
+
+def _upload_payload(session):
+    return {
+        'id': str(session.id),
+        'kind': session.kind,
+        'status': session.status,
+        'received_size': session.received_size,
+        'total_size': session.total_size,
+        'chunk_size': uploads.CHUNK_SIZE,
+    }
+
+@login_required
+@require_POST
+def upload_start(request):
+    if request.content_type == 'application/json':
+        try:
+            data = json.loads(request.body)
+        except ValueError:
+            return JsonResponse({'error': 'Invalid JSON'}, status=400)
+    else:
+        data = request.POST
+    try:
+        session = uploads.start(
+            request.user, data.get('kind'), data.get('filename'), data.get('content_type'),
+            data.get('size'), data.get('sha256', ''),
+        )
+    except uploads.UploadError as exc:
+        return JsonResponse({'error': str(exc)}, status=exc.status)
+    return JsonResponse(_upload_payload(session), status=201)
+
+@login_required
+@require_http_methods(['GET', 'PUT', 'DELETE'])
+def upload_detail(request, upload_id):
+    """GET reports the resume offset, PUT appends a chunk, DELETE abandons the upload."""
+    session = get_object_or_404(UploadSession, id=upload_id, user=request.user)
+    if request.method == 'DELETE':
+        uploads.discard(session)
+        return JsonResponse({'deleted': True})
+    if request.method == 'PUT':
+        try:
+            content_length = int(request.META.get('CONTENT_LENGTH') or 0)
+            uploads.write_chunk(
+                session, request, request.headers.get('Content-Range'), content_length,
+                request.headers.get('X-Chunk-SHA256', ''),
+            )
+        except uploads.UploadError as exc:
+            return JsonResponse({'error': str(exc), **_upload_payload(session)}, status=exc.status)
+    return JsonResponse(_upload_payload(session))
+
+@login_required
+@require_POST
+def upload_complete(request, upload_id):
+    session = get_object_or_404(UploadSession, id=upload_id, user=request.user)
+    try:
+        uploads.complete(session)
+    except uploads.UploadError as exc:
+        return JsonResponse({'error': str(exc), **_upload_payload(session)}, status=exc.status)
+    return JsonResponse(_upload_payload(session))
+
+def _contributions_page(request, queryset):
+    try:
+        return feed.paginate(queryset, request.GET.get('cursor'), request.GET.get('page_size'))
+    except InvalidCursor:
+        raise Http404('Invalid cursor')
+
 @login_required
 def profile(request):
-    UserProfile.objects.get_or_create(user=request.user)
-    user_contributions = Contribution.objects.filter(author=request.user).order_by('-submitted_at')
+    profile = auth.profile_for(request.user)
+    user_contributions, next_cursor = _contributions_page(request, Contribution.objects.filter(author=request.user))
+    suggested = graph.suggestions(request.user.id, limit=5)
+    users = User.objects.in_bulk([pk for pk, mutual in suggested]) if suggested else {}
     context = {
-        'user_contributions': user_contributions
+        'profile': profile,
+        'suggested_users': [(users[pk], mutual) for pk, mutual in suggested if pk in users],
+        'user_contributions': user_contributions,
+        'next_cursor': next_cursor,
     }
     return render(request, 'profile.html', context)
 
-def public_profile(request, username):
-    user_obj = get_object_or_404(User, username=username)
-    user_contributions = Contribution.objects.filter(author=user_obj).order_by('-submitted_at')
+async def public_profile(request, username):
+    # Filtering on the username lets the user and their first page load concurrently
+    try:
+        viewer, user_obj, (user_contributions, next_cursor) = await asyncio.gather(
+            _viewer(request),
+            aget_object_or_404(User.objects.select_related('userprofile'), username=username),
+            feed.apaginate(
+                Contribution.objects.filter(author__username=username),
+                request.GET.get('cursor'), request.GET.get('page_size'),
+            ),
+        )
+    except InvalidCursor:
+        raise Http404('Invalid cursor')
     context = {
         'profile_user': user_obj,
-        'user_contributions': user_contributions
+        'viewer_follows': viewer.is_authenticated and await graph.afollows(viewer.pk, user_obj.pk),
+        'user_contributions': user_contributions,
+        'next_cursor': next_cursor,
     }
-    return render(request, 'public_profile.html', context)
+    return await arender(request, 'public_profile.html', context)
 
 @login_required
 def edit_profile(request):
-    profile, created = UserProfile.objects.get_or_create(user=request.user)
+    profile = auth.profile_for(request.user)
     if request.method == 'POST':
         form = ProfileEditForm(request.POST, instance=profile)
         if form.is_valid():
             form.save()
             return redirect('profile')
     else:
-        initial_data = {'followed_categories': profile.followed_categories.split(',')}
-        form = ProfileEditForm(instance=profile, initial=initial_data)
+        form = ProfileEditForm(instance=profile)
     return render(request, 'edit_profile.html', {'form': form})
 
 # --- Social Feature Views ---
 
+def _toggle_like(contribution, user):
+    # Transactions and on_commit hooks are sync-only, so the write runs in a worker thread
+    liked, likes_count = contribution.toggle_like(user)
+    if liked and user.id != contribution.author_id:
+        notification_service.notify(contribution.author_id, user.id, 'liked your post', contribution.pk)
+    transaction.on_commit(lambda: realtime.publish(
+        realtime.post_channel(contribution.pk), 'counts', {'id': contribution.pk, 'likes_count': likes_count},
+    ))
+    return liked, likes_count
+
+def _throttled(retry_after):
+    response = JsonResponse({'error': 'Too many likes, slow down', 'retry_after': retry_after}, status=429)
+    response['Retry-After'] = str(retry_after)
+    return response
+
 @login_required
-def like_contribution(request, contribution_id):
-    contribution = get_object_or_404(Contribution, id=contribution_id)
+async def like_contribution(request, contribution_id):
+    contribution = await aget_object_or_404(Contribution, id=contribution_id)
     if request.method == 'POST':
-        if contribution.likes.filter(id=request.user.id).exists():
-            contribution.likes.remove(request.user)
-            liked = False
-        else:
-            contribution.likes.add(request.user)
-            liked = True
-            if request.user != contribution.author:
-                Notification.objects.create(recipient=contribution.author, sender=request.user, verb='liked your post', target=contribution)
-        return JsonResponse({'liked': liked, 'likes_count': contribution.total_likes()})
+        user = await _viewer(request)
+        allowed, retry_after = await sync_to_async(throttle.likes.consume)(user.pk)
+        if not allowed:
+            return _throttled(retry_after)
+        liked, likes_count = await sync_to_async(_toggle_like)(contribution, user)
+        return JsonResponse({'liked': liked, 'likes_count': likes_count})
     return JsonResponse({'error': 'Invalid request'}, status=400)
 
+def _parse_like_batch(body):
+    """``{"likes": [{"id": 1, "liked": true}, ...]}`` as ``{id: liked}``; later entries win."""
+    data = json.loads(body)
+    entries = data.get('likes') if isinstance(data, dict) else None
+    if not isinstance(entries, list):
+        raise ValueError('Expected {"likes": [...]}')
+    desired = {}
+    for entry in entries:
+        if not isinstance(entry, dict) or type(entry.get('id')) is not int or type(entry.get('liked')) is not bool:
+            raise ValueError('Each like needs an integer "id" and a boolean "liked"')
+        desired[entry['id']] = entry['liked']
+    return desired
+
+@login_required
+@require_POST
+def like_batch(request):
+    """Apply a batch of like/unlike toggles from the feed script and return the resulting counts."""
+    try:
+        desired = _parse_like_batch(request.body)
+    except ValueError as exc:
+        return JsonResponse({'error': str(exc)}, status=400)
+    if len(desired) > throttle.LIKE_BURST:
+        return JsonResponse({'error': f'At most {throttle.LIKE_BURST} likes per batch'}, status=400)
+    if not desired:
+        return JsonResponse({'likes': []})
+    allowed, retry_after = throttle.likes.consume(request.user.pk, len(desired))
+    if not allowed:
+        return _throttled(retry_after)
+    results, newly_liked = Contribution.objects.set_likes(request.user, desired)
+    for contribution in newly_liked:
+        notification_service.notify(contribution.author_id, request.user.id, 'liked your post', contribution.pk)
+    for pk, (liked, likes_count) in results.items():
+        transaction.on_commit(lambda pk=pk, likes_count=likes_count: realtime.publish(
+            realtime.post_channel(pk), 'counts', {'id': pk, 'likes_count': likes_count},
+        ))
+    return JsonResponse({'likes': [
+        {'id': pk, 'liked': liked, 'likes_count': likes_count} for pk, (liked, likes_count) in results.items()
+    ]})
+
 @login_required
 def add_comment(request, contribution_id):
     contribution = get_object_or_404(Contribution, id=contribution_id)
     if request.method == 'POST':
         comment_text = request.POST.get('comment_text')
         if comment_text:
-            Comment.objects.create(contribution=contribution, author=request.user, text=comment_text)
-            if request.user != contribution.author:
-                Notification.objects.create(recipient=contribution.author, sender=request.user, verb='commented on your post', target=contribution)
+            contribution.add_comment(request.user, comment_text)
+            notification_service.notify(contribution.author_id, request.user.id, 'commented on your post', contribution.pk)
+            transaction.on_commit(lambda: realtime.publish_counts(contribution.pk))
     return redirect('home')
 
 @login_required
 def follow_user(request, user_id):
     user_to_follow = get_object_or_404(User, id=user_id)
-    profile, created = UserProfile.objects.get_or_create(user=request.user)
-    if user_to_follow.userprofile in profile.follows.all():
-        profile.follows.remove(user_to_follow.userprofile)
+    if graph.toggle_follow(request.user.id, user_to_follow.id):
+        timeline.backfill_author(request.user.id, user_to_follow.id)
+        notification_service.notify(user_to_follow.id, request.user.id, 'started following you')
     else:
-        profile.follows.add(user_to_follow.userprofile)
-        Notification.objects.create(recipient=user_to_follow, sender=request.user, verb='started following you')
+        timeline.prune_author(request.user.id, user_to_follow.id)
     return redirect('home')
 
 @login_required
-def notifications(request):
-    user_notifications = Notification.objects.filter(recipient=request.user)
+async def notifications(request):
+    user = await _viewer(request)
+    try:
+        user_notifications, next_cursor = await notification_service.apage(
+            user.id, request.GET.get('cursor'), request.GET.get('page_size'),
+        )
+    except InvalidCursor:
+        raise Http404('Invalid cursor')
     context = {
-        'notifications': user_notifications
+        'notifications': user_notifications,
+        'next_cursor': next_cursor,
     }
-    return render(request, 'notifications.html', context)
+    return await arender(request, 'notifications.html', context)
 
 @login_required
 def mark_notification_as_read(request, notification_id):
     notification = get_object_or_404(Notification, id=notification_id, recipient=request.user)
-    notification.is_read = True
-    notification.save()
-    if notification.target:
+    notification_service.mark_read(notification)
+    if notification.target_id:
         return redirect('home')
     return redirect('notifications')
 
+@login_required
+@require_POST
+def mark_all_notifications_as_read(request):
+    notification_service.mark_all_read(request.user.id)
+    return redirect('notifications')
+
+# --- Live updates ---
+
+def _post_ids(param, limit):
+    ids = []
+    for value in param.split(','):
+        if value.strip().isdigit():
+            ids.append(int(value))
+    return list(dict.fromkeys(ids))[:limit]
+
+@login_required
+async def events(request):
+    """Server-sent event stream of the viewer's notifications and counters for ``?posts=1,2,3``."""
+    user = await request.auser()
+    channels = [realtime.user_channel(user.pk)]
+    channels += [realtime.post_channel(pk) for pk in _post_ids(request.GET.get('posts', ''), realtime.MAX_POSTS)]
+
+    async def stream():
+        subscription = await realtime.get_broker().subscribe(channels)
+        try:
+            unread = await sync_to_async(notification_service.unread_count)(user.pk)
+            yield f'retry: 5000\n{realtime.format_event("unread", {"count": unread})}'
+            while True:
+                message = await subscription.get(realtime.HEARTBEAT_SECONDS)
+                yield ': keepalive\n\n' if message is None else realtime.format_event(*message)
+        finally:
+            await asyncio.shield(subscription.close())
+
+    response = StreamingHttpResponse(stream(), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
 # --- Admin-facing View ---
 
 @staff_member_required
 def admin_dashboard(request):
-    total_users = User.objects.count()
-    active_sessions = Session.objects.filter(expire_date__gte=timezone.now())
-    active_users_count = 0
-    for session in active_sessions:
-        if session.get_decoded().get('_auth_user_id'):
-            active_users_count += 1
-    
-    total_contributions = Contribution.objects.count()
-    states = State.objects.prefetch_related('contribution_set').all()
-    contributions_by_state = {
-        state: state.contribution_set.all().order_by('-submitted_at') for state in states
+    context = dashboard.get_stats()
+    context['title'] = 'Dashboard'
+    context['card_cache'] = cards.stats()
+    return render(request, 'admin/custom_index.html', context)
+
+@staff_member_required
+def admin_state_contributions(request, state_id):
+    """One keyset page of a state's contributions, loaded when its row is expanded."""
+    state = get_object_or_404(State, id=state_id)
+    contributions, next_cursor = _contributions_page(request, Contribution.objects.filter(state=state))
+    context = {
+        'state': state,
+        'contributions': contributions,
+        'next_cursor': next_cursor,
     }
+    return render(request, 'admin/state_contributions.html', context)
 
+@staff_member_required
+def instrumentation_report(request):
+    """Per-view percentiles, likely N+1 queries and recent cProfile samples."""
+    rows = []
+    for view, summary in instrumentation.registry.snapshot().items():
+        quantiles = lambda series, scale=1: [value * scale for value in summary[series]['quantiles'].values()]
+        rows.append({
+            'view': view,
+            'count': summary['count'],
+            'duration_ms': quantiles('duration', 1000),
+            'queries': quantiles('queries'),
+            'db_ms': quantiles('db_time', 1000),
+            'template_ms': quantiles('template_time', 1000),
+            'bytes_sent': summary['bytes_sent'],
+            'errors': summary['errors'],
+            'duplicates': summary['duplicates'],
+        })
     context = {
-        'total_users': total_users,
-        'active_users': active_users_count,
-        'total_contributions': total_contributions,
-        'contributions_by_state': contributions_by_state,
-        'title': 'Dashboard'
+        'title': 'Instrumentation',
+        'enabled': instrumentation.ENABLED,
+        'rows': rows,
+        'quantiles': [f'p{round(q * 100)}' for q in instrumentation.QUANTILES],
+        'profiles': list(instrumentation.profiles),
     }
-    return render(request, 'admin/custom_index.html', context)
+    return render(request, 'admin/instrumentation.html', context)
+
+
+def instrumentation_metrics(request):
+    """Prometheus text format; staff session or ``Authorization: Bearer <INSTRUMENTATION_METRICS_TOKEN>``."""
+    token = instrumentation.METRICS_TOKEN
+    authorized = request.user.is_active and request.user.is_staff
+    scheme, _, credentials = request.headers.get('Authorization', '').partition(' ')
+    if token and scheme == 'Bearer' and constant_time_compare(credentials, token):
+        authorized = True
+    if not authorized:
+        return HttpResponse(status=403)
+    return HttpResponse(instrumentation.prometheus(), content_type='text/plain; version=0.0.4; charset=utf-8')